@@ -1,6 +1,12 @@
+import abc
 import random
 import uuid
-import copy
+import json
+import hashlib
+import struct
+import ipaddress
+import heapq
+import math
 
 
 # example configuration for DMPR daemon
@@ -9,6 +15,21 @@ exa_conf = """
     "rtn-msg-interval" : "30",
     "rtn-msg-interval-jitter" : "7",
     "rtn-msg-hold-time" : "90",
+    "rtn-msg-interval-mode" : "adaptive",
+    "rtn-msg-interval-min" : "7",
+    "rtn-msg-interval-max" : "120",
+    "rtn-msg-format" : "dict",
+    "rtn-msg-snapshot-interval" : "10",
+    "route-engine" : "path-vector",
+    "multipath" : "on",
+    "multipath-tolerance" : "0.1",
+    "prefix-aggregation" : "on",
+    "route-recompute-hold-down" : "1",
+    "route-recompute-max-delay" : "5",
+    "rtn-msg-triggered-updates" : "on",
+    "rtn-msg-triggered-spacing" : "5",
+    "route-flap-half-life" : "60",
+    "route-flap-suppress" : "3",
     "mcast-v4-tx-addr" : "224.0.1.1",
     "mcast-v6-tx-addr" : "ff05:0:0:0:0:0:0:2",
     "proto-transport-enable"  : [ "v4" ],
@@ -27,11 +48,60 @@ exa_conf = """
 
 class ConfigurationException(Exception): pass
 class InternalException(Exception): pass
+class CodecException(Exception): pass
 
 class DMPRConfigDefaults(object):
     rtn_msg_interval = "30"
     rtn_msg_interval_jitter = str(int(int(rtn_msg_interval) / 4))
     rtn_msg_hold_time = str(int(rtn_msg_interval) * 3)
+    # "adaptive" doubles the interval between routing messages from min
+    # to max while routes and neighbors are stable and falls back to min
+    # after a change. The jitter grows with the number of neighbors and
+    # each message carries the hold time receivers should apply to it
+    rtn_msg_interval_mode = "static"
+    rtn_msg_interval_min = str(int(int(rtn_msg_interval) / 4))
+    rtn_msg_interval_max = str(int(rtn_msg_interval) * 4)
+    # "dict" hands the message as python dict to the tx callback,
+    # "binary" as bytes in DMPRMsgCodec format. Receivers accept both
+    rtn_msg_format = "dict"
+    # every n-th routing message carries the full routing paths, the
+    # messages in between only the changes since this snapshot. 1 means
+    # every message is a full one
+    rtn_msg_snapshot_interval = "1"
+    # "path-vector" extends the best path advertised by each neighbor by
+    # the link to it, "graph" runs a shortest path search per policy over
+    # all links found in the received routing paths
+    route_engine = "path-vector"
+    # "on" adds all usable next hops as "next-hops" to the routing
+    # table rows, "off" routes over the best path only
+    multipath = "off"
+    # paths with a weight within this fraction of the best path are
+    # next hops too, 0 keeps equal cost paths only
+    multipath_tolerance = "0"
+    # "on" collapses adjacent and covered prefixes with the same
+    # forwarding in the advertised networks and the routing tables
+    prefix_aggregation = "off"
+    # received and expired routing messages mark their neighbors dirty,
+    # the routes are recalculated once no message changed them for this
+    # many seconds, 0 recalculates on each message
+    route_recompute_hold_down = "0"
+    # a pending recalculation runs at the latest this many seconds after
+    # the first change, 0 means four times the hold-down
+    route_recompute_max_delay = "0"
+    # "on" sends a routing message at the next tick after the FIB
+    # changed instead of waiting for the next interval, at most one per
+    # interface within the spacing in seconds
+    rtn_msg_triggered_updates = "off"
+    rtn_msg_triggered_spacing = "5"
+    # each change of the route to a destination adds a penalty of 1
+    # which halves every half-life seconds. Above the suppress penalty
+    # changes of the destination trigger no routing message until the
+    # penalty decayed to half of it, they wait for the next interval
+    route_flap_half_life = "60"
+    route_flap_suppress = "3"
+    # v4 and v6 networks share one routing message, it is sent over
+    # the first of these transports
+    proto_transport_enable = [ "v4" ]
 
     # default bandwidth for a given interface in bytes/second
     # bytes/second enabled dmpr deployed in low bandwidth environments
@@ -51,13 +121,1005 @@ class DMPRConfigDefaults(object):
     LINK_CHARACTERISITCS_COST = "0"
 
 
+class DMPRMetric(abc.ABC):
+    """ base class of a routing policy. A policy only defines the weight
+        of a single link (a path characteristic), if a link is usable at
+        all and how weights combine along a path. The route calculation
+        itself is policy agnostic, see DMPR.register_metric(). weight()
+        must be implemented, the other methods have defaults. path_data
+        is a DMPRPathData """
+    # name of the policy in the FIB and routing messages
+    name = None
+    # name of the policy in the routing table
+    table = None
+    def usable(self, path_data):
+        return True
+
+    @abc.abstractmethod
+    def weight(self, path_data):
+        pass
+
+    def combine(self, weight1, weight2):
+        return weight1 + weight2
+
+    def better(self, weight1, weight2):
+        """ compare path weights, lower weight is better """
+        return weight1 < weight2
+
+    def better_link(self, weight1, weight2):
+        """ compare the weights of two links to the same neighbor """
+        return self.better(weight1, weight2)
+
+    def tolerable(self, weight, best_weight, tolerance):
+        """ if a path is used beside the best one, tolerance is
+            relative to the best weight """
+        return not self.better(best_weight + abs(best_weight) * tolerance, weight)
+
+
+class DMPRMetricLowLoss(DMPRMetric):
+    name = 'low_loss'
+    table = 'lowest-loss'
+
+    def weight(self, path_data):
+        return path_data.loss
+
+
+class DMPRMetricHighBandwidth(DMPRMetric):
+    name = 'high_bandwidth'
+    table = 'highest-bandwidth'
+
+    def weight(self, path_data):
+        return path_data.bandwidth
+
+    def better_link(self, weight1, weight2):
+        return weight1 > weight2
+
+
+class DMPRMetricBwAndLoss(DMPRMetric):
+    name = 'bw_and_loss'
+    table = 'formular_bw_loss'
+
+    def __init__(self, k1=1, k2=100):
+        # k1 and k2 value for bw and loss compound metric calculation
+        self.k1 = k1
+        self.k2 = k2
+
+    def weight(self, path_data):
+        return (self.k1*(10000000/path_data.bandwidth))+(self.k2*path_data.loss)
+
+
+class DMPRMetricNoCost(DMPRMetric):
+    name = 'no_cost'
+    table = 'no-cost'
+
+    def usable(self, path_data):
+        return path_data.cost == 0
+
+    def weight(self, path_data):
+        return path_data.cost
+
+    def better_link(self, weight1, weight2):
+        # all usable links cost nothing, the last one is used
+        return True
+
+
+class DMPRMetricBwAndCost(DMPRMetric):
+    name = 'bw_and_cost'
+    table = 'filtered-bw-cost'
+
+    def usable(self, path_data):
+        return path_data.cost == 0
+
+    def weight(self, path_data):
+        return path_data.bandwidth
+
+    def better_link(self, weight1, weight2):
+        return weight1 > weight2
+
+
+class DMPRWeightOrder(object):
+    """ orders path weights in a heap by better() of the metric,
+        weights where none is better than the other are equal """
+    __slots__ = ('metric', 'weight')
+
+    def __init__(self, metric, weight):
+        self.metric = metric
+        self.weight = weight
+
+    def __lt__(self, other):
+        return self.metric.better(self.weight, other.weight)
+
+    def __eq__(self, other):
+        return not (self.metric.better(self.weight, other.weight) or
+                    self.metric.better(other.weight, self.weight))
+
+
+class DMPRPathData(object):
+    """ characteristics of a link, loss, bandwidth and cost. The
+        routing messages carry their dict form, see as_dict() """
+    __slots__ = ('loss', 'bandwidth', 'cost')
+
+    def __init__(self, loss, bandwidth, cost):
+        self.loss = loss
+        self.bandwidth = bandwidth
+        self.cost = cost
+
+    @classmethod
+    def from_dict(cls, path_data):
+        return cls(path_data['loss'], path_data['bandwidth'], path_data['cost'])
+
+    def key(self):
+        return (self.loss, self.bandwidth, self.cost)
+
+    def __eq__(self, other):
+        return isinstance(other, DMPRPathData) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def as_dict(self):
+        return {'loss': self.loss, 'bandwidth': self.bandwidth, 'cost': self.cost}
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+class DMPRPathCharacteristics(object):
+    """ interning table for path characteristics. Each distinct
+        DMPRPathData gets a path number which stays stable as long as
+        a FIB entry uses it, numbers are never reused. Both directions
+        are plain dict lookups """
+
+    def __init__(self):
+        # path number -> DMPRPathData, advertised as FIB
+        # 'path_characteristics'
+        self.path_characteristics = dict()
+        self._path_nums = dict()
+        self._refs = dict()
+        self._next_num = 1
+
+    def acquire(self, path_data):
+        """ return the path number of the characteristics and
+            hold a reference to it """
+        path_num = self._path_nums.get(path_data)
+        if path_num is None:
+            path_num = str(self._next_num)
+            self._next_num += 1
+            self._path_nums[path_data] = path_num
+            self._refs[path_num] = 0
+            self.path_characteristics[path_num] = path_data
+        self._refs[path_num] += 1
+        return path_num
+
+    def release(self, path_num):
+        self._refs[path_num] -= 1
+        if self._refs[path_num] == 0:
+            path_data = self.path_characteristics.pop(path_num)
+            del self._path_nums[path_data]
+            del self._refs[path_num]
+
+    def lookup(self, path_num):
+        return self.path_characteristics.get(path_num)
+
+
+class DMPRPrefixTrie(object):
+    """ path compressed binary radix trie of network prefixes for longest
+        prefix match lookups. Prefixes and addresses are integers of width
+        bits, a lookup walks at most one node per prefix bit """
+
+    class Node(object):
+        __slots__ = ('prefix', 'length', 'value', 'children')
+
+        def __init__(self, prefix, length, value):
+            self.prefix = prefix
+            self.length = length
+            self.value = value
+            self.children = [None, None]
+
+    def __init__(self, width):
+        self.width = width
+        self.root = self.Node(0, 0, None)
+
+    def _bit(self, key, pos):
+        return (key >> (self.width - pos - 1)) & 1
+
+    def _common_length(self, key1, key2, length):
+        diff = key1 ^ key2
+        if diff == 0:
+            return length
+        return min(length, self.width - diff.bit_length())
+
+    def _mask(self, key, length):
+        return key & ~((1 << (self.width - length)) - 1)
+
+    def insert(self, prefix, length, value):
+        """ add or replace a prefix, host bits must be zero """
+        node = self.root
+        while node.length != length:
+            bit = self._bit(prefix, node.length)
+            child = node.children[bit]
+            if child is None:
+                node.children[bit] = self.Node(prefix, length, value)
+                return
+            common = self._common_length(prefix, child.prefix, min(length, child.length))
+            if common == child.length:
+                node = child
+                continue
+            # the new prefix branches off within the compressed path
+            # of the child, split it
+            split = self.Node(self._mask(prefix, common), common, None)
+            node.children[bit] = split
+            split.children[self._bit(child.prefix, common)] = child
+            if common == length:
+                split.value = value
+            else:
+                split.children[self._bit(prefix, common)] = self.Node(prefix, length, value)
+            return
+        node.value = value
+
+    def remove(self, prefix, length):
+        parents = list()
+        node = self.root
+        while node is not None and node.length < length:
+            parents.append(node)
+            node = node.children[self._bit(prefix, node.length)]
+        if node is None or node.length != length or node.prefix != prefix:
+            return
+        node.value = None
+        # drop nodes without value and with less than two children
+        while parents and node.value is None:
+            children = [child for child in node.children if child is not None]
+            if len(children) == 2:
+                break
+            parent = parents.pop()
+            parent.children[self._bit(node.prefix, parent.length)] = children[0] if children else None
+            node = parent
+
+    def lookup(self, address):
+        """ value of the longest prefix containing the address or None """
+        node = self.root
+        best = node.value
+        while node.length < self.width:
+            node = node.children[self._bit(address, node.length)]
+            if node is None or (address ^ node.prefix) >> (self.width - node.length) != 0:
+                break
+            if node.value is not None:
+                best = node.value
+        return best
+
+
+class DMPRFibEntry(object):
+    """ the route to a destination in one policy: the next hop router
+        id, the networks of the destination, the path numbers of the
+        links {"id1>id2": path number} and the weight. Entries are
+        replaced but never modified, networks and paths may be shared """
+    __slots__ = ('next_hop', 'networks', 'paths', 'weight')
+
+    def __init__(self, next_hop, networks, paths, weight=None):
+        self.next_hop = next_hop
+        self.networks = networks
+        self.paths = paths
+        self.weight = weight
+
+    def __eq__(self, other):
+        return (isinstance(other, DMPRFibEntry) and self.next_hop == other.next_hop and
+                self.weight == other.weight and self.paths == other.paths and
+                self.networks == other.networks)
+
+    def as_dict(self):
+        """ the form of routing messages """
+        return {'next-hop': self.next_hop, 'networks': self.networks,
+                'paths': self.paths, 'weight': self.weight}
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+class DMPRRoute(object):
+    """ a routing table row of the destination router dest, next_hops
+        is only set with multipath """
+    __slots__ = ('dest', 'proto', 'prefix', 'prefix_len', 'interface', 'next_hop', 'next_hops')
+
+    def __init__(self, dest, proto, prefix, prefix_len, interface, next_hop, next_hops=None):
+        self.dest = dest
+        self.proto = proto
+        self.prefix = prefix
+        self.prefix_len = prefix_len
+        self.interface = interface
+        self.next_hop = next_hop
+        self.next_hops = next_hops
+
+    def __eq__(self, other):
+        return (isinstance(other, DMPRRoute) and self.dest == other.dest and
+                self.proto == other.proto and
+                self.prefix == other.prefix and self.prefix_len == other.prefix_len and
+                self.interface == other.interface and self.next_hop == other.next_hop and
+                self.next_hops == other.next_hops)
+
+    def as_dict(self):
+        """ the form handed to the driver """
+        row = {'proto': self.proto, 'prefix': self.prefix, 'prefix-len': self.prefix_len,
+               'interface': self.interface, 'next-hop': self.next_hop}
+        if self.next_hops is not None:
+            row['next-hops'] = self.next_hops
+        return row
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+class DMPRRxData(object):
+    """ the last routing message received from a router on an interface
+        with its reception data, an entry of the rx-msg-db """
+    __slots__ = ('rx_order', 'rx_time', 'msg', 'msg_digest', 'snapshot', 'deadline')
+
+    def __init__(self, rx_order):
+        self.rx_order = rx_order
+        self.rx_time = None
+        self.msg = None
+        self.msg_digest = None
+        # last full message, base of the delta messages
+        self.snapshot = None
+        # the current entry of the expiry heap, older ones are stale
+        self.deadline = None
+
+    def as_dict(self):
+        return {'rx-order': self.rx_order, 'rx-time': self.rx_time, 'msg': self.msg,
+                'msg-digest': self.msg_digest, 'snapshot': self.snapshot,
+                'deadline': self.deadline}
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+class DMPRNeighbor(object):
+    """ a neighbor combined from its routing messages on all interfaces:
+        the interfaces it is seen on, the best link to it per policy
+        as (weight, interface) and the routing paths it advertises """
+    __slots__ = ('networks', 'ifaces', 'links', 'routingpaths', 'rx_order', 'dests', 'advertised',
+                 'path_info')
+
+    def __init__(self, networks):
+        self.networks = networks
+        self.ifaces = list()
+        self.links = dict()
+        self.routingpaths = dict()
+        # (interface number, rx order) of the first interface
+        # with routing paths
+        self.rx_order = None
+        # destinations advertised in any policy
+        self.dests = set()
+        # per policy {destination: (dest_data, bitset of the routers
+        # on its paths)}
+        self.advertised = dict()
+        # DMPRPathData of the path numbers in the routing paths
+        self.path_info = dict()
+
+    def as_dict(self):
+        return {'networks': self.networks, 'ifaces': self.ifaces, 'links': self.links,
+                'routingpaths': self.routingpaths, 'rx-order': self.rx_order,
+                'dests': self.dests, 'advertised': self.advertised, 'path-info': self.path_info}
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+class DMPRRouterIds(object):
+    """ interning table of router ids. Each router id gets a small number
+        when it is seen first and all internal routing data is keyed by
+        these numbers, paths are tuples of them. Router id strings are
+        only used in routing messages, the FIB and the routing table, all
+        built from the one string object saved here. Numbers are never
+        reused, the table grows with the routers ever seen. Paths are
+        interned while a neighbor entry holds a reference to them, like
+        the numbers of DMPRPathCharacteristics """
+
+    def __init__(self):
+        self._nums = dict()
+        self._router_ids = list()
+        self._paths = dict()
+        self._path_refs = dict()
+        self._path_keys = dict()
+
+    def number(self, router_id):
+        router_num = self._nums.get(router_id)
+        if router_num is None:
+            router_num = len(self._router_ids)
+            self._nums[router_id] = router_num
+            self._router_ids.append(router_id)
+        return router_num
+
+    def lookup(self, router_id):
+        """ number of a router id or None if never seen """
+        return self._nums.get(router_id)
+
+    def router_id(self, router_num):
+        return self._router_ids[router_num]
+
+    def acquire_path(self, path_key):
+        """ return the path "id1>id2" as tuple of router numbers and
+            hold a reference to it """
+        path = self._paths.get(path_key)
+        if path is None:
+            path = tuple(self.number(router_id) for router_id in path_key.split('>'))
+            self._paths[path_key] = path
+            self._path_refs[path_key] = 0
+        self._path_refs[path_key] += 1
+        return path
+
+    def release_path(self, path_key):
+        self._path_refs[path_key] -= 1
+        if self._path_refs[path_key] == 0:
+            path = self._paths.pop(path_key)
+            del self._path_refs[path_key]
+            self._path_keys.pop(path, None)
+
+    def release_paths(self):
+        """ drop all references, e.g. when all neighbor entries are rebuilt """
+        self._paths.clear()
+        self._path_refs.clear()
+        self._path_keys.clear()
+
+    def path(self, path_key):
+        """ path "id1>id2" as tuple of router numbers, interned if held """
+        path = self._paths.get(path_key)
+        if path is None:
+            path = tuple(self.number(router_id) for router_id in path_key.split('>'))
+        return path
+
+    def forget_path_key(self, router_num, next_num):
+        """ drop the cached path key of a link not in use anymore """
+        self._path_keys.pop((router_num, next_num), None)
+
+    def path_key(self, router_num, next_num):
+        """ path "id1>id2" of two router numbers """
+        path = (router_num, next_num)
+        path_key = self._path_keys.get(path)
+        if path_key is None:
+            path_key = "{}>{}".format(self._router_ids[router_num], self._router_ids[next_num])
+            self._path_keys[path] = path_key
+        return path_key
+
+
+DMPR_DEFAULT_METRICS = (DMPRMetricLowLoss, DMPRMetricHighBandwidth, DMPRMetricBwAndLoss,
+                        DMPRMetricNoCost, DMPRMetricBwAndCost)
+
+
+class DMPRMsgCodec(object):
+    """ compact binary form of a routing message, decoding returns
+        the identical dict form. Node ids are written once in a string
+        table (UUIDs as 16 bytes) and referenced by index, integers are
+        varints and well known keys are enum coded. Anything the binary
+        form does not know is carried as JSON, so any message survives
+        the round trip """
+    MAGIC = b'\xd3\x01'
+
+    # string table entries
+    STR_UTF8 = 0
+    STR_UUID = 1
+
+    # values
+    VAL_NONE = 0
+    VAL_UINT = 1
+    VAL_NINT = 2
+    VAL_FLOAT = 3
+    VAL_STR = 4
+    VAL_DEC_STR = 5
+    VAL_TRUE = 6
+    VAL_FALSE = 7
+
+    # networks and addresses
+    NET_JSON = 0
+    NET_V4 = 1
+    NET_V6 = 2
+    ADDR_VALUE = 0
+    ADDR_V4 = 1
+    ADDR_V6 = 2
+
+    # message fields, 0 is a JSON coded field
+    FIELD_JSON = 0
+    FIELDS = ('id', 'sequence-no', 'networks', 'originator-addr-v4',
+              'originator-addr-v6', 'routingpaths', 'snapshot-sequence-no',
+              'routingpaths-delta', 'routingpaths-removed', 'hold-time')
+
+    # routingpaths keys, 0 is a policy name in clear text
+    POLICIES = ('low_loss', 'high_bandwidth', 'bw_and_loss', 'no_cost',
+                'bw_and_cost', 'path_characteristics')
+
+    # order of the metric fields in path characteristics
+    METRICS = ('loss', 'bandwidth', 'cost')
+    DEST_KEYS = frozenset(('next-hop', 'networks', 'paths', 'weight'))
+
+    def __init__(self):
+        self._field_codes = {name: i + 1 for i, name in enumerate(self.FIELDS)}
+        self._policy_codes = {name: i + 1 for i, name in enumerate(self.POLICIES)}
+
+    def encode(self, msg):
+        """ return the binary form of a routing message dict """
+        strings = dict()
+        body = bytearray()
+        fields = list(msg.items())
+        self._put_varint(body, len(fields))
+        for key, value in fields:
+            code = self._field_codes.get(key)
+            if key in ('routingpaths', 'routingpaths-delta') \
+                    and not self._routingpaths_encodable(value):
+                code = None
+            if key == 'routingpaths-removed' and not self._removed_encodable(value):
+                code = None
+            if code is None:
+                body.append(self.FIELD_JSON)
+                self._put_str(body, key)
+                self._put_json(body, value)
+                continue
+            body.append(code)
+            if key == 'id':
+                self._put_varint(body, self._str_index(strings, value))
+            elif key == 'networks':
+                self._put_networks(body, value)
+            elif key in ('originator-addr-v4', 'originator-addr-v6'):
+                self._put_addr(body, value)
+            elif key in ('routingpaths', 'routingpaths-delta'):
+                self._put_routingpaths(body, strings, value)
+            elif key == 'routingpaths-removed':
+                self._put_removed(body, strings, value)
+            else:
+                self._put_value(body, value)
+        data = bytearray(self.MAGIC)
+        self._put_varint(data, len(strings))
+        for string in strings:
+            if self._is_uuid(string):
+                data.append(self.STR_UUID)
+                data += uuid.UUID(string).bytes
+            else:
+                data.append(self.STR_UTF8)
+                self._put_str(data, string)
+        data += body
+        return bytes(data)
+
+    def decode(self, data):
+        """ return the routing message dict of a binary form,
+            raise CodecException if data is malformed """
+        try:
+            return self._decode(memoryview(data))
+        except (IndexError, ValueError, struct.error, UnicodeDecodeError) as e:
+            raise CodecException("malformed routing message: {}".format(e))
+
+    def is_encoded(self, msg):
+        return isinstance(msg, (bytes, bytearray, memoryview))
+
+    def _decode(self, data):
+        if bytes(data[0:2]) != self.MAGIC:
+            raise CodecException("not a DMPR binary routing message")
+        pos = [2]
+        strings = list()
+        for _ in range(self._get_varint(data, pos)):
+            tag = self._get_byte(data, pos)
+            if tag == self.STR_UUID:
+                strings.append(str(uuid.UUID(bytes=self._get_bytes(data, pos, 16))))
+            elif tag == self.STR_UTF8:
+                strings.append(self._get_str(data, pos))
+            else:
+                raise CodecException("unknown string type {}".format(tag))
+        msg = dict()
+        for _ in range(self._get_varint(data, pos)):
+            code = self._get_byte(data, pos)
+            if code == self.FIELD_JSON:
+                key = self._get_str(data, pos)
+                msg[key] = self._get_json(data, pos)
+                continue
+            if code > len(self.FIELDS):
+                raise CodecException("unknown field {}".format(code))
+            key = self.FIELDS[code - 1]
+            if key == 'id':
+                msg[key] = strings[self._get_varint(data, pos)]
+            elif key == 'networks':
+                msg[key] = self._get_networks(data, pos)
+            elif key in ('originator-addr-v4', 'originator-addr-v6'):
+                msg[key] = self._get_addr(data, pos)
+            elif key in ('routingpaths', 'routingpaths-delta'):
+                msg[key] = self._get_routingpaths(data, pos, strings)
+            elif key == 'routingpaths-removed':
+                msg[key] = self._get_removed(data, pos, strings)
+            else:
+                msg[key] = self._get_value(data, pos)
+        if pos[0] != len(data):
+            raise CodecException("trailing data after routing message")
+        return msg
+
+    def _routingpaths_encodable(self, routingpaths):
+        """ check that routingpaths has the structure of a FIB, everything
+            else is sent as JSON """
+        if not isinstance(routingpaths, dict):
+            return False
+        for policy, entries in routingpaths.items():
+            if not isinstance(policy, str) or not isinstance(entries, dict):
+                return False
+            if policy == 'path_characteristics':
+                for path_num, path_data in entries.items():
+                    if not isinstance(path_num, str) or not isinstance(path_data, dict):
+                        return False
+                    if set(path_data) != set(self.METRICS):
+                        return False
+                    if not all(self._is_value(v) for v in path_data.values()):
+                        return False
+                continue
+            for dest_id, dest_data in entries.items():
+                if not isinstance(dest_id, str) or not isinstance(dest_data, dict):
+                    return False
+                if set(dest_data) != self.DEST_KEYS:
+                    return False
+                if not isinstance(dest_data['next-hop'], str):
+                    return False
+                if not self._is_value(dest_data['weight']):
+                    return False
+                if not isinstance(dest_data['networks'], list):
+                    return False
+                if not isinstance(dest_data['paths'], dict):
+                    return False
+                for path, path_num in dest_data['paths'].items():
+                    if not isinstance(path, str) or path.count('>') != 1:
+                        return False
+                    if not self._is_value(path_num):
+                        return False
+        return True
+
+    def _removed_encodable(self, removed):
+        if not isinstance(removed, dict):
+            return False
+        for policy, keys in removed.items():
+            if not isinstance(policy, str) or not isinstance(keys, list):
+                return False
+            if not all(isinstance(key, str) for key in keys):
+                return False
+        return True
+
+    def _put_policy(self, out, policy):
+        code = self._policy_codes.get(policy, 0)
+        out.append(code)
+        if code == 0:
+            self._put_str(out, policy)
+
+    def _get_policy(self, data, pos):
+        code = self._get_byte(data, pos)
+        if code == 0:
+            return self._get_str(data, pos)
+        if code <= len(self.POLICIES):
+            return self.POLICIES[code - 1]
+        raise CodecException("unknown policy {}".format(code))
+
+    def _put_removed(self, out, strings, removed):
+        """ destinations and path numbers removed since the snapshot """
+        self._put_varint(out, len(removed))
+        for policy, keys in removed.items():
+            self._put_policy(out, policy)
+            self._put_varint(out, len(keys))
+            for key in keys:
+                self._put_varint(out, self._str_index(strings, key))
+
+    def _get_removed(self, data, pos, strings):
+        removed = dict()
+        for _ in range(self._get_varint(data, pos)):
+            policy = self._get_policy(data, pos)
+            removed[policy] = [strings[self._get_varint(data, pos)]
+                               for _ in range(self._get_varint(data, pos))]
+        return removed
+
+    def _put_routingpaths(self, out, strings, routingpaths):
+        self._put_varint(out, len(routingpaths))
+        for policy, entries in routingpaths.items():
+            self._put_policy(out, policy)
+            self._put_varint(out, len(entries))
+            if policy == 'path_characteristics':
+                for path_num, path_data in entries.items():
+                    self._put_value(out, path_num)
+                    for metric in self.METRICS:
+                        self._put_value(out, path_data[metric])
+                continue
+            for dest_id, dest_data in entries.items():
+                self._put_varint(out, self._str_index(strings, dest_id))
+                self._put_varint(out, self._str_index(strings, dest_data['next-hop']))
+                self._put_value(out, dest_data['weight'])
+                self._put_networks(out, dest_data['networks'])
+                self._put_varint(out, len(dest_data['paths']))
+                for path, path_num in dest_data['paths'].items():
+                    src, dst = path.split('>')
+                    self._put_varint(out, self._str_index(strings, src))
+                    self._put_varint(out, self._str_index(strings, dst))
+                    self._put_value(out, path_num)
+
+    def _get_routingpaths(self, data, pos, strings):
+        routingpaths = dict()
+        for _ in range(self._get_varint(data, pos)):
+            policy = self._get_policy(data, pos)
+            entries = routingpaths[policy] = dict()
+            if policy == 'path_characteristics':
+                for _ in range(self._get_varint(data, pos)):
+                    path_num = self._get_value(data, pos)
+                    if not isinstance(path_num, str):
+                        raise CodecException("path number must be a string: {}".format(path_num))
+                    entries[path_num] = {metric: self._get_value(data, pos)
+                                         for metric in self.METRICS}
+                continue
+            for _ in range(self._get_varint(data, pos)):
+                dest_id = strings[self._get_varint(data, pos)]
+                dest_data = entries[dest_id] = dict()
+                dest_data['next-hop'] = strings[self._get_varint(data, pos)]
+                dest_data['weight'] = self._get_value(data, pos)
+                dest_data['networks'] = self._get_networks(data, pos)
+                paths = dest_data['paths'] = dict()
+                for _ in range(self._get_varint(data, pos)):
+                    src = strings[self._get_varint(data, pos)]
+                    dst = strings[self._get_varint(data, pos)]
+                    paths["{}>{}".format(src, dst)] = self._get_value(data, pos)
+        return routingpaths
+
+    def _put_networks(self, out, networks):
+        if not isinstance(networks, list):
+            raise CodecException("networks must be a list: {}".format(networks))
+        self._put_varint(out, len(networks))
+        for network in networks:
+            packed = self._pack_network(network)
+            if packed is None:
+                out.append(self.NET_JSON)
+                self._put_json(out, network)
+            else:
+                out += packed
+
+    def _pack_network(self, network):
+        """ {"v4-prefix": "10.0.0.0/8"} as type, address and prefix length,
+            only if the packed form decodes to the very same string """
+        if not isinstance(network, dict) or len(network) != 1:
+            return None
+        key, prefix = next(iter(network.items()))
+        if key == 'v4-prefix':
+            net_type, addr_type = self.NET_V4, ipaddress.IPv4Address
+        elif key == 'v6-prefix':
+            net_type, addr_type = self.NET_V6, ipaddress.IPv6Address
+        else:
+            return None
+        if not isinstance(prefix, str) or prefix.count('/') != 1:
+            return None
+        addr, prefix_len = prefix.split('/')
+        try:
+            addr = addr_type(addr)
+        except ValueError:
+            return None
+        if not prefix_len.isdigit() or str(int(prefix_len)) != prefix_len:
+            return None
+        if int(prefix_len) > addr.max_prefixlen or "{}/{}".format(addr, prefix_len) != prefix:
+            return None
+        return bytes((net_type,)) + addr.packed + bytes((int(prefix_len),))
+
+    def _get_networks(self, data, pos):
+        networks = list()
+        for _ in range(self._get_varint(data, pos)):
+            net_type = self._get_byte(data, pos)
+            if net_type == self.NET_JSON:
+                networks.append(self._get_json(data, pos))
+                continue
+            if net_type == self.NET_V4:
+                key, addr = 'v4-prefix', ipaddress.IPv4Address(self._get_bytes(data, pos, 4))
+            elif net_type == self.NET_V6:
+                key, addr = 'v6-prefix', ipaddress.IPv6Address(self._get_bytes(data, pos, 16))
+            else:
+                raise CodecException("unknown network type {}".format(net_type))
+            prefix_len = self._get_byte(data, pos)
+            networks.append({key: "{}/{}".format(addr, prefix_len)})
+        return networks
+
+    def _put_addr(self, out, addr):
+        for addr_type, addr_cls in ((self.ADDR_V4, ipaddress.IPv4Address),
+                                    (self.ADDR_V6, ipaddress.IPv6Address)):
+            try:
+                packed = addr_cls(addr)
+            except ValueError:
+                continue
+            if str(packed) == addr:
+                out.append(addr_type)
+                out += packed.packed
+                return
+        out.append(self.ADDR_VALUE)
+        self._put_value(out, addr)
+
+    def _get_addr(self, data, pos):
+        addr_type = self._get_byte(data, pos)
+        if addr_type == self.ADDR_V4:
+            return str(ipaddress.IPv4Address(self._get_bytes(data, pos, 4)))
+        if addr_type == self.ADDR_V6:
+            return str(ipaddress.IPv6Address(self._get_bytes(data, pos, 16)))
+        if addr_type == self.ADDR_VALUE:
+            return self._get_value(data, pos)
+        raise CodecException("unknown address type {}".format(addr_type))
+
+    def _is_value(self, value):
+        return value is None or isinstance(value, (bool, int, float, str))
+
+    def _put_value(self, out, value):
+        if value is None:
+            out.append(self.VAL_NONE)
+        elif value is True:
+            out.append(self.VAL_TRUE)
+        elif value is False:
+            out.append(self.VAL_FALSE)
+        elif isinstance(value, int):
+            if value >= 0:
+                out.append(self.VAL_UINT)
+                self._put_varint(out, value)
+            else:
+                out.append(self.VAL_NINT)
+                self._put_varint(out, -value - 1)
+        elif isinstance(value, float):
+            out.append(self.VAL_FLOAT)
+            out += struct.pack('!d', value)
+        elif isinstance(value, str):
+            if value.isdigit() and value.isascii() and str(int(value)) == value:
+                # path numbers and most configuration values
+                out.append(self.VAL_DEC_STR)
+                self._put_varint(out, int(value))
+            else:
+                out.append(self.VAL_STR)
+                self._put_str(out, value)
+        else:
+            raise CodecException("value not encodable: {}".format(value))
+
+    def _get_value(self, data, pos):
+        tag = self._get_byte(data, pos)
+        if tag == self.VAL_NONE:
+            return None
+        if tag == self.VAL_TRUE:
+            return True
+        if tag == self.VAL_FALSE:
+            return False
+        if tag == self.VAL_UINT:
+            return self._get_varint(data, pos)
+        if tag == self.VAL_NINT:
+            return -self._get_varint(data, pos) - 1
+        if tag == self.VAL_FLOAT:
+            return struct.unpack('!d', self._get_bytes(data, pos, 8))[0]
+        if tag == self.VAL_STR:
+            return self._get_str(data, pos)
+        if tag == self.VAL_DEC_STR:
+            return str(self._get_varint(data, pos))
+        raise CodecException("unknown value type {}".format(tag))
+
+    def _is_uuid(self, string):
+        if len(string) != 36:
+            return False
+        try:
+            return str(uuid.UUID(string)) == string
+        except ValueError:
+            return False
+
+    def _str_index(self, strings, string):
+        index = strings.get(string)
+        if index is None:
+            index = strings[string] = len(strings)
+        return index
+
+    def _put_varint(self, out, value):
+        while value >= 0x80:
+            out.append((value & 0x7f) | 0x80)
+            value >>= 7
+        out.append(value)
+
+    def _get_varint(self, data, pos):
+        value = shift = 0
+        while True:
+            byte = self._get_byte(data, pos)
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def _put_str(self, out, string):
+        raw = string.encode('utf-8')
+        self._put_varint(out, len(raw))
+        out += raw
+
+    def _get_str(self, data, pos):
+        return self._get_bytes(data, pos, self._get_varint(data, pos)).decode('utf-8')
+
+    def _put_json(self, out, value):
+        self._put_str(out, json.dumps(value, separators=(',', ':')))
+
+    def _get_json(self, data, pos):
+        return json.loads(self._get_str(data, pos))
+
+    def _get_byte(self, data, pos):
+        byte = data[pos[0]]
+        pos[0] += 1
+        return byte
+
+    def _get_bytes(self, data, pos, length):
+        if pos[0] + length > len(data):
+            raise CodecException("routing message truncated")
+        raw = bytes(data[pos[0]:pos[0] + length])
+        pos[0] += length
+        return raw
+
+
+class DMPRLog(object):
+    """ level gated logging in front of the log object of the driver.
+        Which levels are enabled is decided once, the methods of disabled
+        levels do nothing: no message is formatted, no payload is built
+        and no time is fetched. Besides the plain form log.info(msg,
+        time=now) events take structured fields, log.debug("event",
+        key=value), which are formatted only if the level is enabled.
+        A callable field value is a lazy payload, called at that point.
+        Without time the current time is fetched if required """
+    LEVELS = ('debug', 'info', 'warning', 'error')
+
+    def __init__(self, log, level="info"):
+        self._log = log
+        self._get_time = None
+        self._get_time_priv_data = None
+        self.set_level(level)
+
+    def set_level(self, level):
+        """ enable level and all levels above """
+        if level not in self.LEVELS:
+            raise ConfigurationException("log level must be one of {}".format(self.LEVELS))
+        self.level = level
+        threshold = self.LEVELS.index(level)
+        for i, name in enumerate(self.LEVELS):
+            enabled = i >= threshold
+            setattr(self, name + '_enabled', enabled)
+            setattr(self, name, self._emitter(getattr(self._log, name)) if enabled else self._discard)
+
+    def register_get_time_cb(self, function, priv_data=None):
+        self._get_time = function
+        self._get_time_priv_data = priv_data
+
+    def _discard(self, msg, time=None, **fields):
+        pass
+
+    def _emitter(self, log_func):
+        def emit(msg, time=None, **fields):
+            if len(fields) > 0:
+                msg = "{} {}".format(msg, self._format_fields(fields))
+            if time is None and self._get_time is not None:
+                time = self._get_time(priv_data=self._get_time_priv_data)
+            if time is None:
+                log_func(msg)
+            else:
+                log_func(msg, time=time)
+        return emit
+
+    def _format_fields(self, fields):
+        items = list()
+        for key, value in fields.items():
+            if callable(value):
+                value = value()
+            items.append("{}:{}".format(key.replace('_', '-'), value))
+        return ", ".join(items)
+
+
 class DMPR(object):
 
-    def __init__(self, log=None):
+    def __init__(self, log=None, log_level="info"):
+        """ log_level is the lowest enabled level, messages below
+            cost nothing, see DMPRLog. "debug" adds dumps of the
+            received messages, the FIB and the routing tables """
         assert(log)
         self._conf = None
         self._time = None
-        self.log = log
+        self.log = DMPRLog(log, log_level)
+        self._metrics = dict()
+        self._codec = DMPRMsgCodec()
+        for metric_cls in DMPR_DEFAULT_METRICS:
+            metric = metric_cls()
+            self._metrics[metric.name] = metric
+        self._routing_table_update_func = None
+        self._routing_table_diff_func = None
+        # routes the diff callback reported per routing table, kept over
+        # restarts so stale routes of the driver are deleted afterwards
+        self._installed_routes = dict()
+        # networks and routing paths shared by the routing messages of
+        # all interfaces until the FIB or the configuration changes
+        self._tx_payload = None
+        # {policy: {destination: (FIB record, dict form)}} of the payload
+        self._tx_entries = dict()
         self.stop(init=True)
 
 
@@ -71,8 +1133,10 @@ class DMPR(object):
 
     def process_conf(self, configuration):
         """ convert external python dict configuration
-            into internal configuration and check values """
+            into internal configuration and check values. The
+            routing messages are built anew afterwards """
         assert(configuration)
+        self._tx_payload = None
         self._conf = {}
         cmd = "rtn-msg-interval"
         self._conf[cmd] = configuration.get(cmd, DMPRConfigDefaults.rtn_msg_interval)
@@ -80,6 +1144,89 @@ class DMPR(object):
         self._conf[cmd] = configuration.get(cmd, DMPRConfigDefaults.rtn_msg_interval_jitter)
         cmd = "rtn-msg-hold-time"
         self._conf[cmd] = configuration.get(cmd, DMPRConfigDefaults.rtn_msg_hold_time)
+        cmd = "rtn-msg-interval-mode"
+        self._conf[cmd] = configuration.get(cmd, DMPRConfigDefaults.rtn_msg_interval_mode)
+        if self._conf[cmd] not in ("static", "adaptive"):
+            msg = "rtn-msg-interval-mode must be \"static\" or \"adaptive\": {}".format(self._conf[cmd])
+            raise ConfigurationException(msg)
+        cmd = "rtn-msg-interval-min"
+        self._conf[cmd] = configuration.get(cmd, DMPRConfigDefaults.rtn_msg_interval_min)
+        if not str(self._conf[cmd]).isdigit() or int(self._conf[cmd]) < 1:
+            msg = "rtn-msg-interval-min must be a number >= 1: {}".format(self._conf[cmd])
+            raise ConfigurationException(msg)
+        cmd = "rtn-msg-interval-max"
+        self._conf[cmd] = configuration.get(cmd, DMPRConfigDefaults.rtn_msg_interval_max)
+        if not str(self._conf[cmd]).isdigit() or int(self._conf[cmd]) < int(self._conf["rtn-msg-interval-min"]):
+            msg = "rtn-msg-interval-max must be a number >= rtn-msg-interval-min: {}".format(self._conf[cmd])
+            raise ConfigurationException(msg)
+        cmd = "rtn-msg-format"
+        self._conf[cmd] = configuration.get(cmd, DMPRConfigDefaults.rtn_msg_format)
+        if self._conf[cmd] not in ("dict", "binary"):
+            msg = "rtn-msg-format must be \"dict\" or \"binary\": {}".format(self._conf[cmd])
+            raise ConfigurationException(msg)
+        cmd = "rtn-msg-snapshot-interval"
+        self._conf[cmd] = configuration.get(cmd, DMPRConfigDefaults.rtn_msg_snapshot_interval)
+        if not str(self._conf[cmd]).isdigit() or int(self._conf[cmd]) < 1:
+            msg = "rtn-msg-snapshot-interval must be a number >= 1: {}".format(self._conf[cmd])
+            raise ConfigurationException(msg)
+        cmd = "route-engine"
+        self._conf[cmd] = configuration.get(cmd, DMPRConfigDefaults.route_engine)
+        if self._conf[cmd] not in ("path-vector", "graph"):
+            msg = "route-engine must be \"path-vector\" or \"graph\": {}".format(self._conf[cmd])
+            raise ConfigurationException(msg)
+        cmd = "multipath"
+        self._conf[cmd] = configuration.get(cmd, DMPRConfigDefaults.multipath)
+        if self._conf[cmd] not in ("on", "off"):
+            msg = "multipath must be \"on\" or \"off\": {}".format(self._conf[cmd])
+            raise ConfigurationException(msg)
+        cmd = "multipath-tolerance"
+        self._conf[cmd] = configuration.get(cmd, DMPRConfigDefaults.multipath_tolerance)
+        try:
+            if float(self._conf[cmd]) < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            msg = "multipath-tolerance must be a number >= 0: {}".format(self._conf[cmd])
+            raise ConfigurationException(msg)
+        cmd = "prefix-aggregation"
+        self._conf[cmd] = configuration.get(cmd, DMPRConfigDefaults.prefix_aggregation)
+        if self._conf[cmd] not in ("on", "off"):
+            msg = "prefix-aggregation must be \"on\" or \"off\": {}".format(self._conf[cmd])
+            raise ConfigurationException(msg)
+        cmd = "route-recompute-hold-down"
+        self._conf[cmd] = configuration.get(cmd, DMPRConfigDefaults.route_recompute_hold_down)
+        try:
+            hold_down = float(self._conf[cmd])
+            if hold_down < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            msg = "route-recompute-hold-down must be a number >= 0: {}".format(self._conf[cmd])
+            raise ConfigurationException(msg)
+        cmd = "route-recompute-max-delay"
+        self._conf[cmd] = configuration.get(cmd, DMPRConfigDefaults.route_recompute_max_delay)
+        try:
+            max_delay = float(self._conf[cmd])
+            if max_delay < 0 or (max_delay > 0 and max_delay < hold_down):
+                raise ValueError
+        except (TypeError, ValueError):
+            msg = "route-recompute-max-delay must be 0 or a number >= route-recompute-hold-down: {}".format(self._conf[cmd])
+            raise ConfigurationException(msg)
+        if max_delay == 0:
+            self._conf[cmd] = str(hold_down * 4)
+        cmd = "rtn-msg-triggered-updates"
+        self._conf[cmd] = configuration.get(cmd, DMPRConfigDefaults.rtn_msg_triggered_updates)
+        if self._conf[cmd] not in ("on", "off"):
+            msg = "rtn-msg-triggered-updates must be \"on\" or \"off\": {}".format(self._conf[cmd])
+            raise ConfigurationException(msg)
+        for cmd, default in (("rtn-msg-triggered-spacing", DMPRConfigDefaults.rtn_msg_triggered_spacing),
+                             ("route-flap-half-life", DMPRConfigDefaults.route_flap_half_life),
+                             ("route-flap-suppress", DMPRConfigDefaults.route_flap_suppress)):
+            self._conf[cmd] = configuration.get(cmd, default)
+            try:
+                if float(self._conf[cmd]) <= 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                msg = "{} must be a number > 0: {}".format(cmd, self._conf[cmd])
+                raise ConfigurationException(msg)
         if "id" not in configuration:
             msg = "configuration contains no id! A id must be unique, it can be \
                    randomly generated but for better performance and debugging \
@@ -118,6 +1265,7 @@ class DMPR(object):
                 interface_data["link-characteristics"]["bandwidth"] = DMPRConfigDefaults.LINK_CHARACTERISITCS_BANDWIDTH
                 interface_data["link-characteristics"]["loss"] = DMPRConfigDefaults.LINK_CHARACTERISITCS_LOSS
                 interface_data["link-characteristics"]["cost"] = DMPRConfigDefaults.LINK_CHARACTERISITCS_COST
+        self._conf_iface_index()
         if "networks" in configuration:
             if not isinstance(configuration["networks"], list):
                 msg = "networks must be a list!"
@@ -135,6 +1283,9 @@ class DMPR(object):
                 if not "prefix-len" in network:
                     msg = "network must contain prefix-len key: {}".format(network)
                     raise ConfigurationException(msg)
+                if network["proto"] not in ("v4", "v6"):
+                    msg = "network proto must be v4 or v6: {}".format(network)
+                    raise ConfigurationException(msg)
             # seens fine, save it as it is
             self._conf["networks"] = configuration["networks"]
         if "mcast-v4-tx-addr" not in configuration:
@@ -145,38 +1296,96 @@ class DMPR(object):
             msg = "no mcast-v6-tx-addr configured!"
             raise ConfigurationException(msg)
         self._conf["mcast-v6-tx-addr"] = configuration["mcast-v6-tx-addr"]
+        cmd = "proto-transport-enable"
+        self._conf[cmd] = configuration.get(cmd, DMPRConfigDefaults.proto_transport_enable)
+        if not isinstance(self._conf[cmd], list) or len(self._conf[cmd]) == 0 or \
+                any(proto not in ("v4", "v6") for proto in self._conf[cmd]):
+            msg = "proto-transport-enable must be a list of \"v4\" and \"v6\": {}".format(self._conf[cmd])
+            raise ConfigurationException(msg)
+
+
+    def _conf_iface_index(self):
+        """ index the configured interfaces by name, with link characteristics
+            converted to numbers, and by link characteristics. All hot paths
+            use the index instead of searching the interface list """
+        self._iface_index = dict()
+        self._ifaces_by_path_data = dict()
+        for interface_data in self._conf["interfaces"]:
+            if interface_data["name"] in self._iface_index:
+                msg = "interface configured twice: {}".format(interface_data["name"])
+                raise ConfigurationException(msg)
+            link_chars = interface_data["link-characteristics"]
+            path_data = DMPRPathData(
+                self._conf_link_value(link_chars, "loss", DMPRConfigDefaults.LINK_CHARACTERISITCS_LOSS),
+                self._conf_link_value(link_chars, "bandwidth", DMPRConfigDefaults.LINK_CHARACTERISITCS_BANDWIDTH),
+                self._conf_link_value(link_chars, "cost", DMPRConfigDefaults.LINK_CHARACTERISITCS_COST))
+            self._iface_index[interface_data["name"]] = {
+                'addr-v4' : interface_data["addr-v4"],
+                'addr-v6' : interface_data.get("addr-v6"),
+                'path-characteristics' : path_data
+            }
+            self._ifaces_by_path_data.setdefault(path_data, list()).append(interface_data["name"])
+
+
+    def _conf_link_value(self, link_chars, key, default):
+        value = link_chars.get(key, default)
+        if isinstance(value, (int, float)):
+            return value
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            pass
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            msg = "link characteristic {} must be a number: {}".format(key, value)
+            raise ConfigurationException(msg)
 
 
     def _check_outdated_route_entries(self):
-        route_recalc_required = False
-        # iterate over all interfaces
-        for interface, v in self._rtd["interfaces"].items():
-            dellist = []
-            # iterate over all neighbors
-            for router_id, vv in v["rx-msg-db"].items():
-                now = self._get_time(priv_data=self._get_time_priv_data)
-                if now - vv["rx-time"] > int(self._conf["rtn-msg-hold-time"]):
-                    msg = "outdated entry from {} received at {}, interface: {} - drop it"
-                    self.log.debug(msg.format(router_id, vv["rx-time"], interface),
-                                   time=now)
-                    dellist.append(router_id)
-            for id_ in dellist:
-                route_recalc_required = True
-                del v["rx-msg-db"][id_]
-        return route_recalc_required
+        """ drop all routing messages older than the hold time. The expiry
+            heap holds a deadline per message, a refresh only pushes a new
+            one if the advertised hold time shrank and it is earlier: an
+            entry which turns out to be refreshed is pushed again with its
+            new deadline. Entries replaced by an earlier deadline are
+            skipped. A tick costs O(expired) """
+        outdated_neighs = set()
+        now = self._get_time(priv_data=self._get_time_priv_data)
+        expiry_heap = self._rtd["expiry-heap"]
+        while len(expiry_heap) > 0 and expiry_heap[0][0] < now:
+            deadline, interface, router_id = heapq.heappop(expiry_heap)
+            rx_msg_db = self._rtd["interfaces"][interface]["rx-msg-db"]
+            rx_data = rx_msg_db.get(router_id)
+            if rx_data is None or rx_data.deadline != deadline:
+                continue
+            rx_time = rx_data.rx_time
+            hold_time = self._rx_hold_time(rx_data.msg)
+            if now - rx_time <= hold_time:
+                rx_data.deadline = rx_time + hold_time
+                heapq.heappush(expiry_heap, (rx_data.deadline, interface, router_id))
+                continue
+            self.log.debug("outdated entry - drop it", time=now,
+                           router=self._router_ids.router_id(router_id),
+                           rx_time=rx_time, interface=interface)
+            outdated_neighs.add(router_id)
+            del rx_msg_db[router_id]
+        return outdated_neighs
+
+
+    def _rx_hold_time(self, msg):
+        """ senders with an adaptive interval advertise their hold time """
+        return int(msg.get('hold-time', self._conf["rtn-msg-hold-time"]))
 
 
     def conf_originator_addr_by_iface_v6(self, iface_name):
-        for iface_data in self._conf["interfaces"]:
-            if iface_data['name'] == iface_name:
-                return iface_data['addr-v6']
+        if iface_name in self._iface_index:
+            return self._iface_index[iface_name]['addr-v6']
         return None
 
 
     def conf_originator_addr_by_iface_v4(self, iface_name):
-        for iface_data in self._conf["interfaces"]:
-            if iface_data['name'] == iface_name:
-                return iface_data['addr-v4']
+        if iface_name in self._iface_index:
+            return self._iface_index[iface_name]['addr-v4']
         return None
 
 
@@ -195,29 +1404,260 @@ class DMPR(object):
         packet['sequence-no'] = self._sequence_no(interface_name)
         # ... and increment number locally
         self._sequence_no_inc(interface_name)
-        packet['networks'] = list()
+        payload = self._create_tx_payload()
+        packet['networks'] = payload['networks']
         packet['originator-addr-v4'] = self.conf_originator_addr_by_iface("v4", interface_name)
+        addr_v6 = self.conf_originator_addr_by_iface("v6", interface_name)
+        if addr_v6 is not None:
+            packet['originator-addr-v6'] = addr_v6
+        if self._conf["rtn-msg-interval-mode"] == "adaptive":
+            packet['hold-time'] = str(self._tx_hold_time())
+        packet['routingpaths'] = payload['routingpaths']
+        snapshot = self._rtd["interfaces"][interface_name]["tx-snapshot"]
+        if snapshot is None or snapshot['age'] + 1 >= int(self._conf["rtn-msg-snapshot-interval"]) \
+                or snapshot['routingpaths'].keys() != packet['routingpaths'].keys():
+            return self._tx_snapshot(interface_name, packet)
+        delta_packet = self._create_delta_msg(packet, snapshot)
+        if delta_packet is None:
+            return self._tx_snapshot(interface_name, packet)
+        snapshot['age'] += 1
+        return delta_packet
+
+
+    def _create_tx_payload(self):
+        """ the networks and routing paths of the routing messages, built
+            once after each recalculation or configuration change and
+            shared by all interfaces and messages until then. Packets
+            must not be modified by the caller """
+        if self._tx_payload is not None:
+            return self._tx_payload
+        networks = list()
+        # v4 and v6 networks share the routing paths of one message
         for network in self._conf["networks"]:
-            if network["proto"] == "v4":
-                ipstr = "{}/{}".format(network["prefix"], network["prefix-len"])
-                packet['networks'].append({ "v4-prefix" : ipstr })
-        packet['routingpaths'] = dict()
-       # if len(self.fib['high_bandwidth'])>0 or len(self.fib['low_loss'])>0:
-        if len(self.fib['high_bandwidth'])>0 or len(self.fib['low_loss'])>0 or len(self.fib['bw_and_loss']) or len(self.fib['no_cost']) or len(self.fib['bw_and_cost'])>0:
-
-           packet['routingpaths']=self.fib.copy()
+            ipstr = "{}/{}".format(network["prefix"], network["prefix-len"])
+            networks.append({ "{}-prefix".format(network["proto"]) : ipstr })
+        if self._conf["prefix-aggregation"] == "on":
+            networks = self._aggregate_networks(networks)
+        routingpaths = dict()
+        tx_entries = dict()
+        if any(len(self.fib[policy]) > 0 for policy in self._metrics):
+            # the message carries the dict form of the FIB records. An
+            # unchanged record keeps the dict of the last payload, delta
+            # messages skip it by identity
+            for policy in self._metrics:
+                entries = routingpaths[policy] = dict()
+                last_entries = self._tx_entries.get(policy, dict())
+                policy_entries = tx_entries[policy] = dict()
+                for dest_key, dest_data in self.fib[policy].items():
+                    last = last_entries.get(dest_key)
+                    if last is not None and last[0] is dest_data:
+                        entries[dest_key] = last[1]
+                    else:
+                        entries[dest_key] = dest_data.as_dict()
+                    policy_entries[dest_key] = (dest_data, entries[dest_key])
+            routingpaths['path_characteristics'] = {path_num: path_data.as_dict() for path_num, path_data
+                                                    in self.fib['path_characteristics'].items()}
+        self._tx_entries = tx_entries
+        self._tx_payload = {'networks': networks, 'routingpaths': routingpaths}
+        return self._tx_payload
+
+
+    def _tx_snapshot(self, interface_name, packet):
+        """ the packet is a full one, following delta messages
+            reference it """
+        self._rtd["interfaces"][interface_name]["tx-snapshot"] = {
+            'sequence-no': packet['sequence-no'],
+            'routingpaths': packet['routingpaths'],
+            'age': 0
+        }
         return packet
 
 
+    def _create_delta_msg(self, packet, snapshot):
+        """ replace the routing paths of the packet by the entries added,
+            changed and removed since the snapshot. The changes are always
+            relative to the snapshot, not to the previous message: a lost
+            delta message is repaired by the next one. FIB entries are
+            replaced and never modified, the snapshot can share them.
+            Return None if the delta is not much smaller than a snapshot """
+        delta = dict()
+        removed = dict()
+        delta_len = full_len = 0
+        for policy, entries in packet['routingpaths'].items():
+            snapshot_entries = snapshot['routingpaths'][policy]
+            changed = dict()
+            for key, entry in entries.items():
+                snapshot_entry = snapshot_entries.get(key)
+                if snapshot_entry is not entry and snapshot_entry != entry:
+                    changed[key] = entry
+            gone = [key for key in snapshot_entries if key not in entries]
+            if len(changed) > 0:
+                delta[policy] = changed
+            if len(gone) > 0:
+                removed[policy] = gone
+            delta_len += len(changed) + len(gone)
+            full_len += len(entries)
+        if 2 * delta_len > full_len:
+            return None
+        delta_packet = dict(packet)
+        del delta_packet['routingpaths']
+        delta_packet['snapshot-sequence-no'] = snapshot['sequence-no']
+        delta_packet['routingpaths-delta'] = delta
+        delta_packet['routingpaths-removed'] = removed
+        return delta_packet
+
+
+    def _calc_adaptive_next_tx_time(self):
+        """ wait the current interval and double it for the next time,
+            _adapt_tx_interval() shortens it again after a change """
+        interval = self._rtd["tx-interval"]
+        if self._next_tx_time == None:
+            # join the network as early as possible, see above
+            waittime = random.uniform(0, self._tx_jitter(interval))
+        else:
+            waittime = interval + random.uniform(0, self._tx_jitter(interval))
+            self._rtd["tx-interval"] = min(2 * interval, int(self._conf["rtn-msg-interval-max"]))
+        now = self._get_time(priv_data=self._get_time_priv_data)
+        self._next_tx_time = now + waittime
+        self.log.debug("schedule next transmission", time=now, at=self._next_tx_time)
+
+
+    def _tx_jitter(self, interval):
+        """ a quarter of the interval alone, up to half of it with many
+            neighbors sharing the medium """
+        neighs = len(self._rtd["neighs"])
+        return interval / 4 * (1 + neighs / (neighs + 4))
+
+
+    def _tx_hold_time(self):
+        """ the hold time receivers apply to our routing messages. It keeps
+            the ratio of rtn-msg-hold-time to rtn-msg-interval relative to
+            the longest wait after the next message """
+        ratio = float(self._conf["rtn-msg-hold-time"]) / float(self._conf["rtn-msg-interval"])
+        interval = min(2 * self._rtd["tx-interval"], int(self._conf["rtn-msg-interval-max"]))
+        return int(math.ceil(ratio * (interval + self._tx_jitter(interval))))
+
+
+    def _adapt_tx_interval(self):
+        """ fall back to the shortest interval after the FIB or the
+            neighbors changed, the next message is sent within it """
+        if not self._rtd["routes-changed"]:
+            return
+        self._rtd["routes-changed"] = False
+        if self._conf["rtn-msg-interval-mode"] != "adaptive":
+            return
+        interval = int(self._conf["rtn-msg-interval-min"])
+        if self._rtd["tx-interval"] <= interval:
+            return
+        self._rtd["tx-interval"] = interval
+        now = self._get_time(priv_data=self._get_time_priv_data)
+        waittime = interval + random.uniform(0, self._tx_jitter(interval))
+        self._next_tx_time = min(self._next_tx_time, now + waittime)
+
+
     def tx_route_packet(self):
         # depending on local information the route
         # packets must be generated for each interface
         for interface_name in self._rtd["interfaces"]:
-            msg = self.create_routing_msg(interface_name)
-            self.log.info(msg)
-            v4_mcast_addr = self._conf["mcast-v4-tx-addr"]
-            self._packet_tx_func(interface_name, "v4", v4_mcast_addr, msg,
-                                 priv_data=self._packet_tx_func_priv_data)
+            self._tx_route_packet_iface(interface_name)
+
+
+    def _tx_route_packet_iface(self, interface_name):
+        msg = self.create_routing_msg(interface_name)
+        self.log.info("tx route packet", interface=interface_name, seq_no=msg['sequence-no'])
+        self.log.debug("tx message", interface=interface_name, packet=msg)
+        if self._conf["rtn-msg-format"] == "binary":
+            msg = self._codec.encode(msg)
+        # one message for both address families
+        proto = self._conf["proto-transport-enable"][0]
+        mcast_addr = self._conf["mcast-{}-tx-addr".format(proto)]
+        self._packet_tx_func(interface_name, proto, mcast_addr, msg,
+                             priv_data=self._packet_tx_func_priv_data)
+        now = self._get_time(priv_data=self._get_time_priv_data)
+        self._rtd["interfaces"][interface_name]["tx-time"] = now
+        self._rtd["triggered-ifaces"].discard(interface_name)
+
+
+    def _tx_triggered_route_packets(self):
+        """ send the changed FIB early on all interfaces without a routing
+            message within the triggered update spacing. Return True if
+            any message was sent """
+        if len(self._rtd["triggered-ifaces"]) == 0:
+            return False
+        now = self._get_time(priv_data=self._get_time_priv_data)
+        spacing = float(self._conf["rtn-msg-triggered-spacing"])
+        transmitted = False
+        for interface_name in sorted(self._rtd["triggered-ifaces"]):
+            tx_time = self._rtd["interfaces"][interface_name]["tx-time"]
+            if tx_time is not None and now - tx_time < spacing:
+                continue
+            self.log.debug("triggered update", interface=interface_name, time=now)
+            self._tx_route_packet_iface(interface_name)
+            transmitted = True
+        return transmitted
+
+
+    def _fib_entry_changed(self, dest_id, old_entry, new_entry):
+        """ collect a new, changed or removed route to the destination in
+            any policy, accounted once per recalculation by
+            _account_fib_changes() """
+        if (self._conf["rtn-msg-triggered-updates"] != "on" and
+                self._conf["rtn-msg-interval-mode"] != "adaptive") or old_entry == new_entry:
+            return
+        changes = self._rtd["fib-changes"]
+        changes[dest_id] = changes.get(dest_id, False) or old_entry is not None
+
+
+    def _account_fib_changes(self):
+        """ account the changed destinations of a recalculation for
+            triggered updates and route flap dampening. A destination is
+            penalised once, however many of its policies changed, and
+            only for changed and removed routes. The penalty is decayed
+            lazily whenever the destination changes again """
+        changes = self._rtd["fib-changes"]
+        if len(changes) == 0:
+            return
+        self._rtd["fib-changes"] = dict()
+        self._rtd["routes-changed"] = True
+        if self._conf["rtn-msg-triggered-updates"] != "on":
+            return
+        now = self._get_time(priv_data=self._get_time_priv_data)
+        half_life = float(self._conf["route-flap-half-life"])
+        suppress = float(self._conf["route-flap-suppress"])
+        penalties = self._rtd["flap-penalties"]
+        suppressed = self._rtd["flap-suppressed"]
+        triggered = False
+        for dest_id, penalised in changes.items():
+            penalty, changed = penalties.get(dest_id, (0.0, now))
+            penalty *= 0.5 ** ((now - changed) / half_life)
+            if penalty < suppress / 2:
+                suppressed.discard(dest_id)
+            if penalised:
+                penalty += 1
+                penalties[dest_id] = (penalty, now)
+                if penalty > suppress and dest_id not in suppressed:
+                    self.log.info("route flaps, dampen triggered updates",
+                                  dest=self._router_ids.router_id(dest_id), penalty=penalty)
+                    suppressed.add(dest_id)
+            if dest_id not in suppressed:
+                triggered = True
+        if triggered:
+            self._rtd["triggered-ifaces"].update(self._rtd["interfaces"])
+
+
+    def _decay_flap_penalties(self):
+        """ forget the penalties of destinations which stopped flapping """
+        now = self._get_time(priv_data=self._get_time_priv_data)
+        half_life = float(self._conf["route-flap-half-life"])
+        penalties = self._rtd["flap-penalties"]
+        suppressed = self._rtd["flap-suppressed"]
+        suppress = float(self._conf["route-flap-suppress"])
+        for dest_id, (penalty, changed) in list(penalties.items()):
+            penalty *= 0.5 ** ((now - changed) / half_life)
+            if penalty < suppress / 2:
+                suppressed.discard(dest_id)
+            if penalty < 0.1:
+                del penalties[dest_id]
 
 
 
@@ -234,17 +1674,21 @@ class DMPR(object):
         if not self._started:
             # start() is not called, ignore this call
             return
-        route_recalc_required = self._check_outdated_route_entries()
-        if route_recalc_required:
-            self._recalculate_routing_table()
+        outdated_neighs = self._check_outdated_route_entries()
+        if len(outdated_neighs) > 0:
+            self._schedule_routing_table_update(outdated_neighs)
 
         now = self._get_time(priv_data=self._get_time_priv_data)
+        # advertise the current routes, not the ones before the hold-down
+        self._run_scheduled_routing_table_update(force=now >= self._next_tx_time)
+        self._adapt_tx_interval()
         if now >= self._next_tx_time:
             self.tx_route_packet()
             self._calc_next_tx_time()
+            self._decay_flap_penalties()
             self.transmitted_now = True
         else:
-            self.transmitted_now = False
+            self.transmitted_now = self._tx_triggered_route_packets()
 
 
     def stop(self, init=False):
@@ -263,7 +1707,7 @@ class DMPR(object):
         now = self._get_time(priv_data=self._get_time_priv_data)
         self.log.info("start DMPR core", time=now)
         assert(self._get_time)
-        assert(self._routing_table_update_func)
+        assert(self._routing_table_update_func or self._routing_table_diff_func)
         assert(self._packet_tx_func)
         assert(self._conf)
         assert(self._routing_table == None)
@@ -285,12 +1729,43 @@ class DMPR(object):
             self._rtd["interfaces"][interface["name"]] = dict()
             self._rtd["interfaces"][interface["name"]]["sequence-no-tx"] = 0
             self._rtd["interfaces"][interface["name"]]["rx-msg-db"] = dict()
-        self.fib = dict()
-        self.fib['high_bandwidth'] = dict()
-        self.fib['low_loss'] = dict()
-        self.fib['bw_and_loss'] = dict()
-        self.fib['no_cost'] = dict()
-        self.fib['bw_and_cost'] = dict()
+            self._rtd["interfaces"][interface["name"]]["tx-snapshot"] = None
+            self._rtd["interfaces"][interface["name"]]["tx-time"] = None
+        # reception order of new neighbors
+        self._rtd["rx-order"] = 0
+        # (deadline, interface, router number) of all received routing
+        # messages, see _check_outdated_route_entries()
+        self._rtd["expiry-heap"] = list()
+        # received routing messages, neighbors and routes are keyed by
+        # router numbers, see DMPRRouterIds
+        self._router_ids = DMPRRouterIds()
+        self._router_num = self._router_ids.number(self._conf["id"])
+        # longest prefix match tries per (routing table, proto), patched
+        # on the first lookup() after the routing table changed
+        self._rtd["lookup-routes"] = dict()
+        self._rtd["lookup-tries"] = dict()
+        # {(routing table, proto, prefix, prefix length): {destination:
+        # row}} of the prefixes in the tries
+        self._rtd["lookup-prefixes"] = dict()
+        self._rtd["lookup-outdated"] = False
+        # neighbors with changed routing messages since the last
+        # recalculation, see _schedule_routing_table_update()
+        self._rtd["recompute-pending"] = set()
+        self._rtd["recompute-first-change"] = None
+        self._rtd["recompute-last-change"] = None
+        # interfaces waiting for a triggered update and the route flap
+        # penalties {router number: (penalty, time)} of the destinations
+        self._rtd["triggered-ifaces"] = set()
+        self._rtd["flap-penalties"] = dict()
+        self._rtd["flap-suppressed"] = set()
+        # {router number: penalised} of the destinations changed in the
+        # current recalculation, see _fib_entry_changed()
+        self._rtd["fib-changes"] = dict()
+        # interval of the adaptive mode and whether the FIB or the
+        # neighbors changed since it was last adapted
+        self._rtd["tx-interval"] = int(self._conf["rtn-msg-interval-min"])
+        self._rtd["routes-changed"] = False
+        self._init_route_data()
 
 
     def _sequence_no(self, interface_name):
@@ -302,6 +1777,9 @@ class DMPR(object):
 
 
     def _calc_next_tx_time(self):
+        if self._conf["rtn-msg-interval-mode"] == "adaptive":
+            self._calc_adaptive_next_tx_time()
+            return
         interval = int(self._conf["rtn-msg-interval"])
         if self._next_tx_time == None:
             # we start to the first time or after a
@@ -314,15 +1792,11 @@ class DMPR(object):
         waittime = interval + random.randint(0, int(jitter))
         now = self._get_time(priv_data=self._get_time_priv_data)
         self._next_tx_time = now + waittime
-        self.log.debug("schedule next transmission for {} seconds".format(self._next_tx_time), time=now)
+        self.log.debug("schedule next transmission", time=now, at=self._next_tx_time)
 
 
     def _is_valid_interface(self, interface_name):
-        found = False
-        for interface in self._conf["interfaces"]:
-            if interface_name == interface["name"]:
-                found = True
-        return found
+        return interface_name in self._iface_index
 
 
     def _validate_rx_msg(self, msg, interface_name):
@@ -333,1174 +1807,1075 @@ class DMPR(object):
             now = self._get_time(priv_data=self._get_time_priv_data)
             self.log.error(emsg.format(interface_name), time=now)
             return False
+        emsg = self._rx_msg_error(msg)
+        if emsg is not None:
+            now = self._get_time(priv_data=self._get_time_priv_data)
+            self.log.error("malformed routing message: {}".format(emsg), time=now)
+            return False
         if msg['id'] == self._conf['id']:
             emsg = "receive a message from ourself! id:{} == id:{}, ".format(msg['id'], self._conf['id'])
             emsg += " This means a) configration error (same id, or look problem"
             now = self._get_time(priv_data=self._get_time_priv_data)
             self.log.error(emsg, time=now)
             return False
+        if 'hold-time' in msg and not str(msg['hold-time']).isdecimal():
+            emsg = "hold-time {} of {} is not a number".format(msg['hold-time'], msg['id'])
+            now = self._get_time(priv_data=self._get_time_priv_data)
+            self.log.error(emsg, time=now)
+            return False
         return True
 
 
 
-    # FIXME: search log for update here
-    def _cmp_dicts(self, dict1, dict2):
-        if dict1 == None or dict2 == None: return False
-        if type(dict1) is not dict or type(dict2) is not dict: return False
-        shared_keys = set(dict2.keys()) & set(dict2.keys())
-        if not len(shared_keys) == len(dict1.keys()) and len(shared_keys) == len(dict2.keys()):
-            return False
-        eq = True
-        for key in dict1.keys():
-            if type(dict1[key]) is dict:
-                if key not in dict2:
+    def _rx_msg_error(self, msg):
+        """ return why a received message is malformed or None. Decoded
+            packets are untrusted, all fields used before the routes are
+            calculated must be there with the right type. The routing
+            paths are checked by _rx_routingpaths_error() """
+        if not isinstance(msg, dict):
+            return "not a dict"
+        fields = [('id', str), ('sequence-no', int), ('networks', list)]
+        if self._is_delta_msg(msg):
+            fields.extend((('snapshot-sequence-no', int), ('routingpaths-delta', dict),
+                           ('routingpaths-removed', dict)))
+        else:
+            fields.append(('routingpaths', dict))
+        for key, value_type in fields:
+            if not isinstance(msg.get(key), value_type) or isinstance(msg[key], bool):
+                return "{} must be of type {}".format(key, value_type.__name__)
+        if 'originator-addr-v4' not in msg:
+            return "originator-addr-v4 is missing"
+        for key in ('originator-addr-v4', 'originator-addr-v6'):
+            if msg.get(key) is not None and not self._is_ip_address(msg[key]):
+                return "{} is not an address".format(key)
+        if not self._is_networks(msg['networks']):
+            return "invalid networks"
+        if self._is_delta_msg(msg):
+            for entries in msg['routingpaths-delta'].values():
+                if not isinstance(entries, dict):
+                    return "routingpaths-delta entries must be dicts"
+            for keys in msg['routingpaths-removed'].values():
+                if not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+                    return "routingpaths-removed must list strings"
+        return None
+
+
+    def _rx_routingpaths_error(self, routingpaths):
+        """ return why the routing paths of a received message are
+            malformed or None, see _create_tx_payload() for the form """
+        # most destinations are advertised in every policy
+        prefixes = set()
+        for policy, entries in routingpaths.items():
+            if not isinstance(entries, dict):
+                return "entries of {} must be a dict".format(policy)
+            if policy == 'path_characteristics':
+                for path_data in entries.values():
+                    if not isinstance(path_data, dict) or \
+                            not all(self._is_number(path_data.get(key)) for key in DMPRPathData.__slots__):
+                        return "path characteristics need a loss, bandwidth and cost"
+                continue
+            for dest_key, dest_data in entries.items():
+                if not isinstance(dest_key, str) or not isinstance(dest_data, dict) or \
+                        not isinstance(dest_data.get('next-hop'), str):
+                    return "entry of {} needs a next-hop".format(dest_key)
+                if not self._is_number(dest_data.get('weight')):
+                    return "weight of {} must be a number".format(dest_key)
+                if not isinstance(dest_data.get('networks'), list) or \
+                        not self._is_networks(dest_data['networks'], prefixes):
+                    return "invalid networks of {}".format(dest_key)
+                paths = dest_data.get('paths')
+                if not isinstance(paths, dict):
+                    return "paths of {} must be a dict".format(dest_key)
+                for path, path_num in paths.items():
+                    if not isinstance(path, str) or path.count('>') != 1 or \
+                            not (path_num is None or isinstance(path_num, str)):
+                        return "invalid path {} of {}".format(path, dest_key)
+        return None
+
+
+    def _is_networks(self, networks, prefixes=None):
+        """ networks are {"v4-prefix" : "10.0.0.0/24"} or v6 alike, the
+            valid ones are added to prefixes and not checked again """
+        for network in networks:
+            if not isinstance(network, dict):
+                return False
+            for prefix_type, prefix_ip in network.items():
+                if prefix_type not in ("v4-prefix", "v6-prefix") or not isinstance(prefix_ip, str):
                     return False
-                else:
-                    eq = eq and self._cmp_dicts(dict1[key], dict2[key])
-            else:
-                if key not in dict2:
+                if prefixes is not None and (prefix_type, prefix_ip) in prefixes:
+                    continue
+                try:
+                    prefix = ipaddress.ip_network(prefix_ip, strict=False)
+                except ValueError:
                     return False
-                else:
-                    eq = eq and (dict1[key] == dict2[key])
-        return eq
+                if "/" not in prefix_ip or "v{}-prefix".format(prefix.version) != prefix_type:
+                    return False
+                if prefixes is not None:
+                    prefixes.add((prefix_type, prefix_ip))
+        return True
+
+
+    def _is_ip_address(self, addr):
+        if not isinstance(addr, str):
+            return False
+        try:
+            ipaddress.ip_address(addr)
+        except ValueError:
+            return False
+        return True
+
+
+    def _is_number(self, value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
 
 
-    def _cmp_packets(self, packet1, packet2):
-        p1 = copy.deepcopy(packet1)
-        p2 = copy.deepcopy(packet2)
-        # some data may differ, but the content is identical,
-        # zeroize them here out
-        p1['sequence-no'] = 0
-        p2['sequence-no'] = 0
-        return self._cmp_dicts(p1, p2)
+    def _msg_digest(self, msg):
+        """ digest over the canonical form of the message content. Some
+            data may differ, but the content is identical, the sequence
+            number is left out here """
+        content = dict(msg)
+        del content['sequence-no']
+        content.pop('hold-time', None)
+        data = json.dumps(content, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(data.encode('utf-8')).digest()
 
 
     def msg_rx(self, interface_name, msg):
         """ receive routing packet in json encoded
-             data format """
-        rxmsg = "rx route packet from {}, interface:{}, seq-no:{}"
-        self.log.info(rxmsg.format(msg['id'], interface_name, msg['sequence-no']))
+             data format or in binary format, see DMPRMsgCodec """
+        msg = self._rx_decode_msg(interface_name, msg)
+        if msg is None:
+            return
+        route_recalc_required = self._rx_save_routing_data(msg, interface_name)
+        if route_recalc_required:
+            self._schedule_routing_table_update([self._router_ids.number(msg['id'])])
+
+
+    def msg_rx_batch(self, packets):
+        """ receive many routing packets at once, e.g. drained from a
+            socket, given as (interface name, msg) pairs. Of each sender
+            only the newest packet per interface is saved, preceded by
+            the snapshot it refers to if that is within the batch too.
+            The routes are recalculated once for all changed senders """
+        rx_msgs = dict()
+        for interface_name, msg in packets:
+            msg = self._rx_decode_msg(interface_name, msg)
+            if msg is None:
+                continue
+            rx_msgs.setdefault((interface_name, msg['id']), []).append(msg)
+        changed_neighs = set()
+        for (interface_name, sender), msgs in rx_msgs.items():
+            msg = max(msgs, key=lambda msg: msg['sequence-no'])
+            save_msgs = [msg]
+            if self._is_delta_msg(msg):
+                save_msgs = [snapshot for snapshot in msgs if not self._is_delta_msg(snapshot)
+                             and snapshot['sequence-no'] == msg['snapshot-sequence-no']][:1] + save_msgs
+            for msg in save_msgs:
+                if self._rx_save_routing_data(msg, interface_name):
+                    changed_neighs.add(self._router_ids.number(sender))
+        if len(changed_neighs) > 0:
+            self._schedule_routing_table_update(changed_neighs)
+
+
+    def _rx_decode_msg(self, interface_name, msg):
+        """ return the dict form of a received routing packet or None
+            if it is corrupt or invalid """
+        if self._codec.is_encoded(msg):
+            try:
+                msg = self._codec.decode(msg)
+            except CodecException as e:
+                now = self._get_time(priv_data=self._get_time_priv_data)
+                self.log.warning("packet corrupt, dropping it: {}".format(e), time=now)
+                return None
         ok = self._validate_rx_msg(msg, interface_name)
         if not ok:
             now = self._get_time(priv_data=self._get_time_priv_data)
             self.log.warning("packet corrupt, dropping it", time=now)
-            return
-        route_recalc_required = self._rx_save_routing_data(msg, interface_name)
-        if route_recalc_required:
-            self._recalculate_routing_table()
+            return None
+        self.log.info("rx route packet", sender=msg['id'], interface=interface_name,
+                      seq_no=msg['sequence-no'])
+        return msg
 
 
     def _rx_save_routing_data(self, msg, interface_name):
         route_recalc_required = True
-        sender_id = msg["id"]
-        if not sender_id in self._rtd["interfaces"][interface_name]["rx-msg-db"]:
-            # new entry (never seen before) or outdated comes
-            # back again
-            self._rtd["interfaces"][interface_name]["rx-msg-db"][sender_id] = dict()
-        else:
+        sender_id = self._router_ids.number(msg["id"])
+        rx_msg_db = self._rtd["interfaces"][interface_name]["rx-msg-db"]
+        if sender_id in rx_msg_db:
             # existing entry from neighbor
-            last_msg = self._rtd["interfaces"][interface_name]["rx-msg-db"][sender_id]["msg"]
+            last_msg = rx_msg_db[sender_id].msg
             seq_no_last = last_msg['sequence-no']
             seq_no_new  = msg['sequence-no']
             if seq_no_new <= seq_no_last:
                 #print("receive duplicate or outdated route packet -> ignore it")
                 route_recalc_required = False
                 return route_recalc_required
-            data_equal = self._cmp_packets(last_msg, msg)
-            if data_equal:
-                # packet is identical, we must save the last packet (think update sequence no)
-                # but a route recalculation is not required
-                route_recalc_required = False
+        snapshot = None
+        if self._is_delta_msg(msg):
+            full_msg = self._rx_apply_delta_msg(msg, rx_msg_db.get(sender_id))
+            if full_msg is None:
+                self.log.info("delta route packet without its snapshot, wait for the next full one",
+                              sender=msg["id"])
+                full_msg = self._rx_delta_fallback_msg(msg, rx_msg_db.get(sender_id))
+            msg = full_msg
+        else:
+            snapshot = msg
+        # the digest is computed once per message and saved
+        # with it, comparing content is a digest comparison
+        msg_digest = self._msg_digest(msg)
+        last_digest = None
+        if sender_id in rx_msg_db:
+            last_digest = rx_msg_db[sender_id].msg_digest
         now = self._get_time(priv_data=self._get_time_priv_data)
-        self._rtd["interfaces"][interface_name]["rx-msg-db"][sender_id]['rx-time'] = now
-        self._rtd["interfaces"][interface_name]["rx-msg-db"][sender_id]['msg'] = msg
-        self.log.info(self._rtd["interfaces"])
+        if last_digest == msg_digest:
+            # packet is identical, we must save the last packet (think update sequence no)
+            # but a route recalculation is not required
+            route_recalc_required = False
+        else:
+            # changed routing paths are checked once, before
+            # anything depends on them
+            emsg = self._rx_routingpaths_error(msg['routingpaths'])
+            if emsg is not None:
+                self.log.error("malformed routing paths of {}: {}".format(msg["id"], emsg), time=now)
+                return False
+        if not sender_id in rx_msg_db:
+            # new entry (never seen before) or outdated comes
+            # back again
+            rx_msg_db[sender_id] = DMPRRxData(self._rtd["rx-order"])
+            self._rtd["rx-order"] += 1
+        rx_data = rx_msg_db[sender_id]
+        rx_data.rx_time = now
+        rx_data.msg = msg
+        rx_data.msg_digest = msg_digest
+        if snapshot is not None:
+            rx_data.snapshot = snapshot
+        # a shrinking hold time must not wait for the old deadline
+        deadline = now + self._rx_hold_time(msg)
+        if rx_data.deadline is None or deadline < rx_data.deadline:
+            rx_data.deadline = deadline
+            heapq.heappush(self._rtd["expiry-heap"], (deadline, interface_name, sender_id))
+        self.log.debug("rx message database", interfaces=self._rtd["interfaces"])
         return route_recalc_required
 
 
+    def _is_delta_msg(self, msg):
+        return 'snapshot-sequence-no' in msg
+
+
+    def _rx_apply_delta_msg(self, msg, rx_data):
+        """ return the full routing message of a delta message, applied
+            to the last snapshot of the sender. Deltas are relative to
+            the snapshot, lost delta messages do no harm. If the snapshot
+            itself is lost (a gap in the sequence numbers at it) the delta
+            cannot be applied and None is returned """
+        if rx_data is None or rx_data.snapshot is None:
+            return None
+        snapshot = rx_data.snapshot
+        if snapshot['sequence-no'] != msg['snapshot-sequence-no']:
+            return None
+        routingpaths = dict()
+        for policy, entries in snapshot['routingpaths'].items():
+            routingpaths[policy] = entries.copy()
+        for policy, entries in msg['routingpaths-delta'].items():
+            if policy not in routingpaths:
+                return None
+            routingpaths[policy].update(entries)
+        for policy, keys in msg['routingpaths-removed'].items():
+            if policy not in routingpaths:
+                return None
+            for key in keys:
+                routingpaths[policy].pop(key, None)
+        full_msg = self._delta_msg_header(msg)
+        full_msg['routingpaths'] = routingpaths
+        return full_msg
+
+
+    def _rx_delta_fallback_msg(self, msg, rx_data):
+        """ a delta message which cannot be applied still shows the neighbor
+            is alive and carries its networks. Until the next snapshot the
+            routing paths known so far are kept """
+        full_msg = self._delta_msg_header(msg)
+        full_msg['routingpaths'] = dict()
+        if rx_data is not None:
+            full_msg['routingpaths'] = rx_data.msg['routingpaths']
+        return full_msg
+
+
+    def _delta_msg_header(self, msg):
+        header = dict()
+        for key, value in msg.items():
+            if key not in ('snapshot-sequence-no', 'routingpaths-delta', 'routingpaths-removed'):
+                header[key] = value
+        return header
+
+
     def next_hop_ip_addr(self, proto, router_id, iface_name):
         """ return the IPv4/IPv6 address of the sender of an routing message """
+        return self._next_hop_ip_addr(proto, self._router_ids.lookup(router_id), iface_name)
+
+
+    def _next_hop_ip_addr(self, proto, router_num, iface_name):
         if iface_name not in self._rtd["interfaces"]:
             raise InternalException("interface not configured: {}".format(iface_name))
-        if router_id not in self._rtd["interfaces"][iface_name]['rx-msg-db']:
+        if router_num not in self._rtd["interfaces"][iface_name]['rx-msg-db']:
+            router_id = None if router_num is None else self._router_ids.router_id(router_num)
             self.log.warning("cannot calculate next_hop_addr because router id is not in "
                              " databse (anymore!)? id:{}".format(router_id))
             return None
-        msg = self._rtd["interfaces"][iface_name]['rx-msg-db'][router_id]['msg']
+        msg = self._rtd["interfaces"][iface_name]['rx-msg-db'][router_num].msg
         if proto == 'v4':
             return msg['originator-addr-v4']
         if proto == 'v6':
-            return msg['originator-addr-v6']
+            # optional, routers without v6 addresses do not route v6
+            return msg.get('originator-addr-v6')
         raise InternalException("only v4 or v6 supported: {}".format(proto))
 
 
+    def _init_route_data(self):
+        self._tx_payload = None
+        self._tx_entries = dict()
+        self.fib = dict()
+        for policy in self._metrics:
+            self.fib[policy] = dict()
+        self._path_chars = DMPRPathCharacteristics()
+        self.fib['path_characteristics'] = self._path_chars.path_characteristics
+        self._router_ids.release_paths()
+        # neighbors, the destinations they advertise and the routing
+        # table rows per destination. Required to recalculate only the
+        # routes affected by a changed neighbor
+        self._rtd["neighs"] = dict()
+        self._rtd["adv-index"] = dict()
+        self._rtd["routing-rows"] = dict()
+        for policy in self._metrics:
+            self._rtd["routing-rows"][policy] = dict()
+
+
     def _recalculate_routing_table(self):
+        """ full rebuild of FIB and routing table from all received
+            routing messages. The regular code path is the incremental
+            _update_routing_table(), both produce the same result """
+        self._init_route_data()
+        neigh_ids = set()
+        for iface_data in self._rtd["interfaces"].values():
+            neigh_ids.update(iface_data["rx-msg-db"].keys())
+        self._update_routing_table(neigh_ids)
+
+
+    def _schedule_routing_table_update(self, neigh_ids):
+        """ mark the neighbors dirty, tick() recalculates the routes of
+            all dirty neighbors at once after the hold-down. A burst of
+            routing messages costs one recalculation instead of one per
+            message. Without a hold-down the routes are updated now """
+        if float(self._conf["route-recompute-hold-down"]) == 0:
+            self._update_routing_table(neigh_ids)
+            return
+        now = self._get_time(priv_data=self._get_time_priv_data)
+        if len(self._rtd["recompute-pending"]) == 0:
+            self._rtd["recompute-first-change"] = now
+        self._rtd["recompute-last-change"] = now
+        self._rtd["recompute-pending"].update(neigh_ids)
+
+
+    def _run_scheduled_routing_table_update(self, force=False):
+        """ recalculate the routes of the dirty neighbors if no routing
+            message changed them for the hold-down, if the first change
+            is older than the max delay or if forced """
+        pending = self._rtd["recompute-pending"]
+        if len(pending) == 0:
+            return
         now = self._get_time(priv_data=self._get_time_priv_data)
-        self.log.info("recalculate routing table", time=now)
+        quiet = now - self._rtd["recompute-last-change"]
+        stale = now - self._rtd["recompute-first-change"]
+        if (not force and quiet < float(self._conf["route-recompute-hold-down"]) and
+                stale < float(self._conf["route-recompute-max-delay"])):
+            return
+        self._rtd["recompute-pending"] = set()
+        self._update_routing_table(pending)
+
+
+    def _update_routing_table(self, neigh_ids):
+        """ update FIB and routing table after the routing messages of
+            the given neighbors changed, timed out or are new. Only routes
+            to these neighbors and to destinations they advertise now or
+            advertised before are recalculated, all other are untouched """
+        self.log.info("recalculate routing table")
+        dests = set()
+        for neigh_id in neigh_ids:
+            dests |= self._update_neigh_entry(neigh_id)
+        if self._conf["route-engine"] == "graph":
+            # any changed link may shorten or break paths
+            # to every destination
+            self._calc_graph_entries()
+        else:
+            for dest_id in sorted(dests):
+                self._calc_dest_entries(dest_id)
+        self._account_fib_changes()
         # see _routing_table_update() this is how the routing
         # table should look like and saved under
         # self._routing_table
-        # k1 and k2 value for bw and loss compound metric calculation
-        #k1=k2=1 by default
-        k1 = 1
-        k2 = 100
-        loss_flag = True
-        bandwidth_flag = True
-        cost_flag = True
         self._routing_table = dict()
-        neigh_routing_paths = dict()
-        self.fib = dict()
-        self.fib['low_loss'] = dict()
-        self.fib['high_bandwidth'] = dict()
-        self.fib['bw_and_loss'] = dict()
-        self.fib['no_cost'] = dict()
-        self.fib['bw_and_cost'] = dict()
-        self.fib['path_characteristics'] = dict()
-        neigh_routing_paths = self._calc_neigh_routing_paths(neigh_routing_paths)
-        if loss_flag==True:
-           self._calc_fib_low_loss(neigh_routing_paths)
-           self._calc_loss_routingtable()
-        if bandwidth_flag==True:
-           self._calc_fib_high_bandwidth(neigh_routing_paths)
-           self._calc_bw_routingtable()
-        if loss_flag==True and bandwidth_flag==True:
-           self._calc_fib_bw_and_loss(neigh_routing_paths,k1,k2)
-           self._calc_bw_and_loss_routingtable()
-        if cost_flag==True:
-           self._calc_fib_no_cost(neigh_routing_paths)
-           self._calc_cost_routingtable()
-        if cost_flag==True and bandwidth_flag==True:
-           self._calc_fib_bw_and_cost(neigh_routing_paths)
-           self._calc_bw_and_cost_routingtable()
-
-        self.log.debug(self.fib)
-        self.log.debug(self._routing_table)
+        for policy, metric in self._metrics.items():
+            routing_rows = self._rtd["routing-rows"][policy]
+            self._routing_table[metric.table] = [row for rows in routing_rows.values() for row in rows]
+            if self._conf["prefix-aggregation"] == "on":
+                self._routing_table[metric.table] = self._aggregate_rows(self._routing_table[metric.table])
+        self._rtd["lookup-outdated"] = True
+        self._tx_payload = None
+        self.log.debug("fib", fib=self.fib)
+        self.log.debug("routing table", routing_table=self._routing_table)
         # routing table calculated, now inform our "parent"
         # about the new routing table
         self._routing_table_update()
 
 
-    def _calc_neigh_routing_paths(self, neigh_routing_paths):
-        neigh_routing_paths['neighs'] = dict()
-        neigh_routing_paths['othernode_paths'] = dict()
-        neigh_routing_paths['othernode_paths']['high_bandwidth'] = dict()
-        neigh_routing_paths['othernode_paths']['low_loss'] = dict()
-        neigh_routing_paths['othernode_paths']['no_cost'] = dict()
-        neigh_routing_paths['othernode_paths']['bw_and_loss'] = dict()
-        neigh_routing_paths['othernode_paths']['bw_and_cost'] = dict()
-        for iface,iface_data in self._rtd["interfaces"].items():
-            for sender_id,sender_data_raw in iface_data["rx-msg-db"].items():
-                sender_data = dict()
-                sender_data = sender_data_raw.copy()
-                neigh_routing_paths = self._add_all_neighs(iface, iface_data,
-                                                           sender_id, sender_data_raw,
-                                                           neigh_routing_paths)
-                if len(sender_data['msg']['routingpaths'])>0:
-                   neigh_routing_paths = self._add_all_othernodes_loss(sender_id, sender_data,
-                                                                       neigh_routing_paths)
-                   neigh_routing_paths = self._add_all_othernodes_bw(sender_id, sender_data,
-                                                                     neigh_routing_paths)
-                   neigh_routing_paths = self._add_all_othernodes_bw_and_loss(sender_id, sender_data,
-                                                                      neigh_routing_paths)
-                   neigh_routing_paths = self._add_all_othernodes_no_cost(sender_id, sender_data,                                                                                                neigh_routing_paths)
-                   neigh_routing_paths = self._add_all_othernodes_bw_and_cost(sender_id, sender_data,
-                                                                      neigh_routing_paths)
-        self.log.debug(neigh_routing_paths)
-        return neigh_routing_paths
-
-
-    def _add_all_neighs(self, iface, iface_data, sender_id, sender_data, neigh_routing_paths):
-        found_neigh = False
-        if len(neigh_routing_paths['neighs']) > 0:
-           for neigh_id, neigh_data in neigh_routing_paths['neighs'].items():
-               if neigh_id == sender_id:
-                  path_found = False
-                  for neigh_path in neigh_data['paths']["{}>{}".
-                                                        format(self._conf["id"], neigh_id)]:
-                      if neigh_path == iface:
-                         path_found = True
-                         break
-                  if path_found == False:
-                     neigh_data['paths']["{}>{}".
-                                         format(self._conf["id"],neigh_id)].append(iface)
-                  found_neigh = True
-                  break
-           if found_neigh == False:
-              neigh_routing_paths = self._add_neigh_entries(iface, sender_id,
-                                                            sender_data, neigh_routing_paths)
-        else:
-             neigh_routing_paths = self._add_neigh_entries(iface, sender_id,
-                                                           sender_data, neigh_routing_paths)
-        return neigh_routing_paths
-
-
-    def _add_neigh_entries(self, iface, sender_id, sender_data, neigh_routing_paths):
-        neigh_routing_paths['neighs'][sender_id] = {'next-hop': sender_id,
-                                                    'networks': sender_data['msg']['networks'],
-                                                    'paths':{"{}>{}".
-                                                             format(self._conf["id"],sender_id):
-                                                             [iface]}
-                                                     }
-        return neigh_routing_paths
-
-
-    def _add_all_othernodes_bw(self, sender_id, sender_data, neigh_routing_paths):
-        othernodes_bw = dict()
-        othernodes_bw = neigh_routing_paths['othernode_paths']['high_bandwidth'].copy()
-        if not sender_id in othernodes_bw:
-           othernodes_bw[sender_id] = dict()
-           othernodes_bw[sender_id]['path_characteristics'] = dict()
-        else:
-             self.log.info('updating high bandwidth routes to other nodes from the existing neighbour')
-        sender_routeinfo = dict()
-        sender_routeinfo = sender_data['msg']['routingpaths'].copy()
-        othernodes_bw[sender_id] = sender_routeinfo['high_bandwidth']
-        othernodes_bw[sender_id]['path_characteristics'] = sender_routeinfo['path_characteristics']
-        neigh_routing_paths['othernode_paths']['high_bandwidth'] = othernodes_bw.copy()
-        return neigh_routing_paths
-
-
-    def _add_all_othernodes_loss(self, sender_id, sender_data, neigh_routing_paths):
-        othernodes_loss = dict()
-        othernodes_loss = neigh_routing_paths['othernode_paths']['low_loss'].copy()
-        if not sender_id in othernodes_loss:
-           othernodes_loss[sender_id] = dict()
-           othernodes_loss[sender_id]['path_characteristics'] = dict()
-        else:
-             self.log.info('updating low loss routes to other nodes from the existing neighbour')
-        sender_routeinfo = dict()
-        sender_routeinfo = sender_data['msg']['routingpaths'].copy()
-        othernodes_loss[sender_id] = sender_routeinfo['low_loss']
-        othernodes_loss[sender_id]['path_characteristics'] = sender_routeinfo['path_characteristics']
-        neigh_routing_paths['othernode_paths']['low_loss'] = othernodes_loss.copy()
-        return neigh_routing_paths
-
-    def _add_all_othernodes_bw_and_loss(self, sender_id, sender_data, neigh_routing_paths):
-        othernodes_bw_and_loss = dict()
-        othernodes_bw_and_loss = neigh_routing_paths['othernode_paths']['bw_and_loss'].copy()
-        if not sender_id in othernodes_bw_and_loss:
-           othernodes_bw_and_loss[sender_id] = dict()
-           othernodes_bw_and_loss[sender_id]['path_characteristics'] = dict()
-        else:
-             self.log.info('updating bw and loss compound route to other nodes from the existing neighbour')
-        sender_routeinfo = dict()
-        sender_routeinfo = sender_data['msg']['routingpaths'].copy()
-        othernodes_bw_and_loss[sender_id] = sender_routeinfo['bw_and_loss']
-        othernodes_bw_and_loss[sender_id]['path_characteristics'] = sender_routeinfo['path_characteristics']
-        neigh_routing_paths['othernode_paths']['bw_and_loss'] = othernodes_bw_and_loss.copy()
-        return neigh_routing_paths
-
-    def _add_all_othernodes_no_cost(self, sender_id, sender_data, neigh_routing_paths):
-        othernodes_no_cost = dict()
-        othernodes_no_cost = neigh_routing_paths['othernode_paths']['no_cost'].copy()
-        if not sender_id in othernodes_no_cost:
-           othernodes_no_cost[sender_id] = dict()
-           othernodes_no_cost[sender_id]['path_characteristics'] = dict()
-        else:
-             self.log.info('updating no monetary cost route to other nodes from the existing neighbour')
-        sender_routeinfo = dict()
-        sender_routeinfo = sender_data['msg']['routingpaths'].copy()
-        othernodes_no_cost[sender_id] = sender_routeinfo['no_cost']
-        othernodes_no_cost[sender_id]['path_characteristics'] = sender_routeinfo['path_characteristics']
-        neigh_routing_paths['othernode_paths']['no_cost'] = othernodes_no_cost.copy()
-        return neigh_routing_paths
-
-    def _add_all_othernodes_bw_and_cost(self, sender_id, sender_data, neigh_routing_paths):
-        othernodes_bw_and_cost = dict()
-        othernodes_bw_and_cost = neigh_routing_paths['othernode_paths']['bw_and_cost'].copy()
-        if not sender_id in othernodes_bw_and_cost:
-           othernodes_bw_and_cost[sender_id] = dict()
-           othernodes_bw_and_cost[sender_id]['path_characteristics'] = dict()
-        else:
-             self.log.info('updating filtered bandwidth and cost route to other nodes from the existing neighbour')
-        sender_routeinfo = dict()
-        sender_routeinfo = sender_data['msg']['routingpaths'].copy()
-        othernodes_bw_and_cost[sender_id] = sender_routeinfo['bw_and_cost']
-        othernodes_bw_and_cost[sender_id]['path_characteristics'] = sender_routeinfo['path_characteristics']
-        neigh_routing_paths['othernode_paths']['bw_and_cost'] = othernodes_bw_and_cost.copy()
-        return neigh_routing_paths
-
-
-    def _calc_fib_low_loss(self, neigh_routing_paths):
-        weigh_loss = dict()
-        compressedloss = dict()
-        for neigh_id, neigh_data in neigh_routing_paths['neighs'].items():
-            weigh_loss = self._loss_path_compression(neigh_data)
-            compressedloss = self.add_loss_entry(neigh_id, neigh_data,
-                                                 weigh_loss, compressedloss)
-        self.fib['low_loss'] = compressedloss.copy()
-        if len(neigh_routing_paths['othernode_paths']['low_loss']) > 0:
-           self._calc_shortestloss_path(neigh_routing_paths)
-        self._map_path_characteristics_loss(neigh_routing_paths)
-        self._add_self_to_neigh_losspathnumber()
-        self._add_lossweight_to_dest()
-
-
-    def _calc_fib_high_bandwidth(self, neigh_routing_paths):
-        weigh_bandwidth = dict()
-        compressedBW = dict()
-        for neigh_id, neigh_data in neigh_routing_paths['neighs'].items():
-            weigh_bandwidth = self._bandwidth_path_compression(neigh_data)
-            compressedBW = self.add_bandwidth_entry(neigh_id, neigh_data,
-                                                    weigh_bandwidth, compressedBW)
-        self.fib['high_bandwidth'] = compressedBW.copy()
-        if len(neigh_routing_paths['othernode_paths']['high_bandwidth']) > 0:
-           self._calc_widestBW_path(neigh_routing_paths)
-        self._map_path_characteristics_BW(neigh_routing_paths)
-        self._add_self_to_neigh_bandwidthpathnumber()
-        self._add_bandwidthweight_to_dest()
-
-    def _calc_fib_bw_and_loss(self, neigh_routing_paths,k1,k2):
-        weigh_bw_and_loss = dict()
-        compressedBWLoss = dict()
-        for neigh_id, neigh_data in neigh_routing_paths['neighs'].items():
-            weigh_bw_and_loss = self._bw_and_loss_path_compression(neigh_data,k1,k2)
-            compressedBWLoss = self.add_bw_and_loss_entry(neigh_id, neigh_data,
-                                                          weigh_bw_and_loss, compressedBWLoss)
-        self.fib['bw_and_loss'] = compressedBWLoss.copy()
-        if len(neigh_routing_paths['othernode_paths']['bw_and_loss']) > 0:
-           self._calc_CompoundBWLoss_path(neigh_routing_paths)
-        self._map_path_characteristics_BW_and_loss(neigh_routing_paths)
-        self._add_self_to_neigh_BW_and_loss_pathnumber()
-        self._add_BW_and_lossweight_to_dest(k1, k2)
-
-    def _calc_fib_no_cost(self, neigh_routing_paths):
-        weigh_cost = dict()
-        compressedCost = dict()
-        for neigh_id, neigh_data in neigh_routing_paths['neighs'].items():
-            weigh_cost = self._no_cost_path_compression(neigh_data)
-            if len(weigh_cost) > 0:
-               compressedCost = self.add_cost_entry(neigh_id, neigh_data,
-                                                    weigh_cost, compressedCost)
-        self.fib['no_cost'] = compressedCost.copy()
-        if len(neigh_routing_paths['othernode_paths']['no_cost']) > 0:
-           self._calc_nocost_path(neigh_routing_paths)
-        self._map_path_characteristics_cost(neigh_routing_paths)
-        self._add_self_to_neigh_cost_pathnumber()
-        self._add_costweight_to_dest()
-
-    def _calc_fib_bw_and_cost(self, neigh_routing_paths):
-        weigh_bw_and_cost = dict()
-        compressedBWCost = dict()
-        for neigh_id, neigh_data in neigh_routing_paths['neighs'].items():
-            weigh_bw_and_cost = self._bw_and_cost_path_compression(neigh_data)
-            if len(weigh_bw_and_cost) >0:
-               compressedBWCost = self.add_bw_and_cost_entry(neigh_id, neigh_data,
-                                                          weigh_bw_and_cost, compressedBWCost)
-        self.fib['bw_and_cost'] = compressedBWCost.copy()
-        if len(neigh_routing_paths['othernode_paths']['bw_and_cost']) > 0:
-           self._calc_filteredBWCost_path(neigh_routing_paths)
-        self._map_path_characteristics_BW_and_cost(neigh_routing_paths)
-        self._add_self_to_neigh_BW_and_cost_pathnumber()
-        self._add_BW_and_costweight_to_dest()
-
-    def _loss_path_compression(self, neigh_data):
-        loss_dict = dict()
-        for neigh_path_key,neigh_paths_name in neigh_data['paths'].items():
-            for neigh_iface_name in neigh_paths_name:
-                for iface in self._conf['interfaces']:
-                    if iface['name'] == neigh_iface_name:
-                       loss = iface['link-characteristics']['loss']
-                       if len(loss_dict) > 0:
-                          for iface_name, iface_loss in loss_dict.items():
-                              if loss < iface_loss:
-                                 loss_dict = dict()
-                                 loss_dict[iface['name']] = loss
-                       else:
-                            loss_dict[iface['name']] = loss
-                       break
-        return loss_dict
-
-
-    def _bandwidth_path_compression(self, neigh_data):
-        bandwidth_dict = dict()
-        for neigh_path_key, neigh_paths_name in neigh_data['paths'].items():
-            for neigh_iface_name in neigh_paths_name:
-                for iface in self._conf['interfaces']:
-                    if iface['name'] == neigh_iface_name:
-                       bw = iface['link-characteristics']['bandwidth']
-                       if len(bandwidth_dict)>0:
-                          for iface_name, iface_bw in bandwidth_dict.items():
-                              if bw > iface_bw:
-                                 bandwidth_dict=dict()
-                                 bandwidth_dict[iface['name']] = bw
-                       else:
-                            bandwidth_dict[iface['name']] = bw
-                       break
-        return bandwidth_dict
-
-
-    def _bw_and_loss_path_compression(self, neigh_data, k1, k2):
-        bw_and_loss_dict = dict()
-        for neigh_path_key,neigh_paths_name in neigh_data['paths'].items():
-            for neigh_iface_name in neigh_paths_name:
-                for iface in self._conf['interfaces']:
-                     if iface['name'] == neigh_iface_name:
-                        loss = iface['link-characteristics']['loss']
-                        bw = iface['link-characteristics']['bandwidth']
-                        bw_and_loss = ((k1*(10000000/bw))+(k2*loss))
-                        if len(bw_and_loss_dict) > 0:
-                           for iface_name, iface_bw_and_loss in bw_and_loss_dict.items():
-                               if bw_and_loss < iface_bw_and_loss:
-                                  bw_and_loss_dict = dict()
-                                  bw_and_loss_dict[iface['name']] = bw_and_loss
-                        else:
-                             bw_and_loss_dict[iface['name']] = bw_and_loss
-                        break
-        return bw_and_loss_dict
-
-    def _no_cost_path_compression(self, neigh_data):
-        no_cost_dict = dict()
-        for neigh_path_key,neigh_paths_name in neigh_data['paths'].items():
-            for neigh_iface_name in neigh_paths_name:
-                for iface in self._conf['interfaces']:
-                    if iface['name'] == neigh_iface_name:
-                       cost = iface['link-characteristics']['cost']
-                       #if len(no_cost_dict) > 0:
-                         # for iface_name, iface_cost in no_cost_dict.items():
-                           #   if cost < iface_cost:
-                            #     no_cost_dict = dict()
-                             #    cost_dict[iface['name']] = cost
-                       #else:
-                       if cost == 0:
-                          no_cost_dict[iface['name']] = cost
-                       break
-        return no_cost_dict
-
-    def _bw_and_cost_path_compression(self, neigh_data):
-        bw_and_cost_dict = dict()
-        for neigh_path_key,neigh_paths_name in neigh_data['paths'].items():
-            for neigh_iface_name in neigh_paths_name:
-                for iface in self._conf['interfaces']:
-                    if iface['name'] == neigh_iface_name:
-                       cost = iface['link-characteristics']['cost']
-                       if cost == 0:
-                          bw = iface['link-characteristics']['bandwidth']
-                          if len(bw_and_cost_dict) > 0:
-                             for iface_name, iface_bw in bw_and_cost_dict.items():
-                                 if bw > iface_bw:
-                                    bw_and_cost_dict = dict()
-                                    bw_and_cost_dict[iface['name']] = bw
-                          else:
-                               bw_and_cost_dict[iface['name']] = bw
-                          break
-        return bw_and_cost_dict
-
-    def add_loss_entry(self, neigh_id, neigh_data, weigh_loss, compressedloss):
-        route = "{}>{}".format(self._conf["id"], neigh_id)
-        compressedloss[neigh_id] = {'next-hop':neigh_data['next-hop'],
-                                    'networks':neigh_data['networks']
-                                   }
-        for iface, iface_loss in weigh_loss.items():
-            compressedloss[neigh_id]['weight'] = iface_loss
-            compressedloss[neigh_id]['paths'] = dict()
-            compressedloss[neigh_id]['paths'][route] = iface
-        return compressedloss
-
-
-    def add_bandwidth_entry(self, neigh_id, neigh_data, weigh_bandwidth, compressedBW):
-        route = "{}>{}".format(self._conf["id"], neigh_id)
-        compressedBW[neigh_id] = {'next-hop':neigh_data['next-hop'],
-                                  'networks':neigh_data['networks']
-                                 }
-        for iface, iface_bw in weigh_bandwidth.items():
-            compressedBW[neigh_id]['weight'] = iface_bw
-            compressedBW[neigh_id]['paths'] = dict()
-            compressedBW[neigh_id]['paths'][route] = iface
-        return compressedBW
-
-
-    def add_bw_and_loss_entry(self, neigh_id, neigh_data, weigh_bw_and_loss, compressedBWLoss):
-        route = "{}>{}".format(self._conf["id"], neigh_id)
-        compressedBWLoss[neigh_id] = {'next-hop':neigh_data['next-hop'],
-                                      'networks':neigh_data['networks']
-                                     }
-        for iface, iface_bw_and_loss in weigh_bw_and_loss.items():
-            compressedBWLoss[neigh_id]['weight'] = iface_bw_and_loss
-            compressedBWLoss[neigh_id]['paths'] = dict()
-            compressedBWLoss[neigh_id]['paths'][route] = iface
-        return compressedBWLoss
-
-    def add_cost_entry(self, neigh_id, neigh_data, weigh_cost, compressedCost):
-        route = "{}>{}".format(self._conf["id"], neigh_id)
-        compressedCost[neigh_id] = {'next-hop':neigh_data['next-hop'],
-                                    'networks':neigh_data['networks']
-                                   }
-        for iface, iface_cost in weigh_cost.items():
-            compressedCost[neigh_id]['weight'] = iface_cost
-            compressedCost[neigh_id]['paths'] = dict()
-            compressedCost[neigh_id]['paths'][route] = iface
-        return compressedCost
-
-    def add_bw_and_cost_entry(self, neigh_id, neigh_data, weigh_bw_and_cost, compressedBWCost):
-        route = "{}>{}".format(self._conf["id"], neigh_id)
-        compressedBWCost[neigh_id] = {'next-hop':neigh_data['next-hop'],
-                                     'networks':neigh_data['networks']
-                                     }
-        for iface, iface_bw_and_cost in weigh_bw_and_cost.items():
-            compressedBWCost[neigh_id]['weight'] = iface_bw_and_cost
-            compressedBWCost[neigh_id]['paths'] = dict()
-            compressedBWCost[neigh_id]['paths'][route] = iface
-        return compressedBWCost
-
-    def _calc_shortestloss_path(self, neigh_routing_paths):
-        path_weight = dict()
-        for other_id, other_data in neigh_routing_paths['othernode_paths']['low_loss'].items():
-            for dest_id, dest_data in other_data.items():
-                if dest_id != 'path_characteristics':
-                   if dest_id == self._conf["id"]:
-                      self.log.info('ignore self routing')
-                   else:
-                        loss_to_neigh = int(self.fib['low_loss'][other_id]['weight'])
-                        weight_update = int(dest_data['weight']) + loss_to_neigh
-                        loop_found = False
-                        for path, path_loss in dest_data['paths'].items():# Each path for example '1>2'
-                            id1_in_path = path[0]
-                            id2_in_path = path[2]
-                            if id1_in_path == self._conf["id"] or id2_in_path == self._conf["id"]:
-                               loop_found = True
-                               self.log.info('self_id in the path so avoiding looping')
-                               break
-                        if loop_found==False:
-                            self.log.info('No loop will occur in this path')
-                            self.add_shortestloss_path(weight_update, other_id, dest_id, dest_data)
-
-
-    def add_shortestloss_path(self, weight_update, other_id, dest_id, dest_data):
-        if not dest_id in self.fib['low_loss']:
-           self.log.info('it is a new entry to destination')
-           self.fib['low_loss'][dest_id] = dict()
-           self._map_loss_values(other_id, weight_update, dest_id, dest_data)
-        else:
-             self.log.info('updating existing destination entry in fib')
-             if weight_update < self.fib['low_loss'][dest_id]['weight']:
-                self._map_loss_values(other_id, weight_update, dest_id, dest_data)
-
-
-    def _map_loss_values(self, other_id, weight_update, dest_id, dest_data):
-        data = self.fib['low_loss'][dest_id]
-        data['networks'] = list()
-        data['paths'] = dict()
-        data['weight'] = weight_update
-        data['next-hop'] = other_id
-        data['networks'] = dest_data['networks'].copy()
-        data['paths'] = dest_data['paths'].copy()
-
-
-    def _calc_widestBW_path(self, neigh_routing_paths):
-        path_weight = dict()
-        for other_id, other_data in neigh_routing_paths['othernode_paths']['high_bandwidth'].items():
-            for dest_id, dest_data in other_data.items():
-                if dest_id != 'path_characteristics':
-                   if dest_id == self._conf["id"]:
-                      self.log.info('ignore self routing')
-                   else:
-                        bw_to_neigh = int(self.fib['high_bandwidth'][other_id]['weight'])
-                        weight_update = int(dest_data['weight']) + bw_to_neigh
-                        loop_found = False
-                        for path, path_loss in dest_data['paths'].items():
-                            id1_in_path = path[0]
-                            id2_in_path = path[2]
-                            if id1_in_path == self._conf["id"] or id2_in_path == self._conf["id"]:
-                               loop_found = True
-                               self.log.info('self_id in the path so avoiding looping')
-                               break
-                        if loop_found==False:
-                           self.log.info('No loop will occur in this path')
-                           self.add_widestBW_path(weight_update, other_id, dest_id, dest_data)
-
-
-    def add_widestBW_path(self, weight_update, other_id, dest_id, dest_data):
-        if not dest_id in self.fib['high_bandwidth']:
-           self.log.info('it is a new entry to destination')
-           self.fib['high_bandwidth'][dest_id] = dict()
-           self._map_BW_values(other_id, weight_update, dest_id, dest_data)
-        else:
-             if weight_update < self.fib['high_bandwidth'][dest_id]['weight']:
-                self.log.info('updating existing destination entry in fib')
-                self._map_BW_values(other_id, weight_update, dest_id, dest_data)
-
-
-    def _map_BW_values(self, other_id, weight_update, dest_id, dest_data):
-        data = self.fib['high_bandwidth'][dest_id]
-        data['networks'] = list()
-        data['paths'] = dict()
-        data['next-hop'] = other_id
-        data['weight'] = weight_update
-        data['networks'] = dest_data['networks'].copy()
-        data['paths'] = dest_data['paths'].copy()
-
-
-    def _calc_CompoundBWLoss_path(self, neigh_routing_paths):
-        path_weight = dict()
-        for other_id, other_data in neigh_routing_paths['othernode_paths']['bw_and_loss'].items():
-            for dest_id, dest_data in other_data.items():
-                if dest_id != 'path_characteristics':
-                   if dest_id == self._conf["id"]:
-                      self.log.info('ignore self routing')
-                   else:
-                        bw_loss_to_neigh = int(self.fib['bw_and_loss'][other_id]['weight'])
-                        weight_update = int(dest_data['weight']) + bw_loss_to_neigh
-                        loop_found = False
-                        for path, path_bw_and_loss in dest_data['paths'].items():
-                            id1_in_path = path[0]
-                            id2_in_path = path[2]
-                            if id1_in_path == self._conf["id"] or id2_in_path == self._conf["id"]:
-                               loop_found = True
-                               self.log.info('self_id in the path so avoiding looping')
-                               break
-                        if loop_found==False:
-                           self.log.info('No loop will occur in this path')
-                           self.add_CompoundBWLoss_path(weight_update, other_id, dest_id, dest_data)
-
-
-    def add_CompoundBWLoss_path(self, weight_update, other_id, dest_id, dest_data):
-        if not dest_id in self.fib['bw_and_loss']:
-           self.log.info('it is a new entry to destination')
-           self.fib['bw_and_loss'][dest_id] = dict()
-           self._map_BWLoss_values(other_id, weight_update, dest_id, dest_data)
-        else:
-             if weight_update < self.fib['bw_and_loss'][dest_id]['weight']:
-                self.log.info('updating existing destination entry in fib')
-                self._map_BWLoss_values(other_id, weight_update, dest_id, dest_data)
-
-
-    def _map_BWLoss_values(self, other_id, weight_update, dest_id, dest_data):
-        data = self.fib['bw_and_loss'][dest_id]
-        data['networks'] = list()
-        data['paths'] = dict()
-        data['next-hop'] = other_id
-        data['weight'] = weight_update
-        data['networks'] = dest_data['networks'].copy()
-        data['paths'] = dest_data['paths'].copy()
-
-    def _calc_nocost_path(self, neigh_routing_paths):
-        path_weight = dict()
-        for other_id, other_data in neigh_routing_paths['othernode_paths']['no_cost'].items():
-            for dest_id, dest_data in other_data.items():
-                if dest_id != 'path_characteristics':
-                   if dest_id == self._conf["id"]:
-                      self.log.info('ignore self routing')
-                   else:
-                        cost_to_neigh = int(self.fib['no_cost'][other_id]['weight'])
-                        weight_update = int(dest_data['weight']) + cost_to_neigh
-                        loop_found = False
-                        for path, path_cost in dest_data['paths'].items():
-                            id1_in_path = path[0]
-                            id2_in_path = path[2]
-                            if id1_in_path == self._conf["id"] or id2_in_path == self._conf["id"]:
-                               loop_found = True
-                               self.log.info('self_id in the path so avoiding looping')
-                               break
-                        if loop_found==False:
-                           self.log.info('No loop will occur in this path')
-                           self.add_nocost_path(weight_update, other_id, dest_id, dest_data)
-
-
-    def add_nocost_path(self, weight_update, other_id, dest_id, dest_data):
-        if not dest_id in self.fib['no_cost']:
-           self.log.info('it is a new entry to destination')
-           self.fib['no_cost'][dest_id] = dict()
-           self._map_cost_values(other_id, weight_update, dest_id, dest_data)
-        else:
-             if weight_update < self.fib['no_cost'][dest_id]['weight']:
-                self.log.info('updating existing destination entry in fib')
-                self._map_cost_values(other_id, weight_update, dest_id, dest_data)
-
-
-    def _map_cost_values(self, other_id, weight_update, dest_id, dest_data):
-        data = self.fib['no_cost'][dest_id]
-        data['networks'] = list()
-        data['paths'] = dict()
-        data['next-hop'] = other_id
-        data['weight'] = weight_update
-        data['networks'] = dest_data['networks'].copy()
-        data['paths'] = dest_data['paths'].copy()
-
-    def _calc_filteredBWCost_path(self, neigh_routing_paths):
-        path_weight = dict()
-        for other_id, other_data in neigh_routing_paths['othernode_paths']['bw_and_cost'].items():
-            for dest_id, dest_data in other_data.items():
-                if dest_id != 'path_characteristics':
-                    if dest_id == self._conf["id"]:
-                       self.log.info('ignore self routing')
-                    else:
-                         bw_cost_to_neigh = int(self.fib['bw_and_cost'][other_id]['weight'])
-                         weight_update = int(dest_data['weight']) + bw_cost_to_neigh
-                         loop_found = False
-                         for path, path_cost in dest_data['paths'].items():
-                             id1_in_path = path[0]
-                             id2_in_path = path[2]
-                             if id1_in_path == self._conf["id"] or id2_in_path == self._conf["id"]:
-                                loop_found = True
-                                self.log.info('self_id in the path so avoiding looping')
-                                break
-                         if loop_found==False:
-                            self.log.info('No loop will occur in this path')
-                            self.add_bw_and_cost_path(weight_update, other_id, dest_id, dest_data)
-
-
-    def add_bw_and_cost_path(self, weight_update, other_id, dest_id, dest_data):
-        if not dest_id in self.fib['bw_and_cost']:
-           self.log.info('it is a new entry to destination')
-           self.fib['bw_and_cost'][dest_id] = dict()
-           self._map_bw_cost_values(other_id, weight_update, dest_id, dest_data)
-        else:
-             if weight_update < self.fib['bw_and_cost'][dest_id]['weight']:
-                self.log.info('updating existing destination entry in fib')
-                self._map_bw_cost_values(other_id, weight_update, dest_id, dest_data)
-
-
-    def _map_bw_cost_values(self, other_id, weight_update, dest_id, dest_data):
-        data = self.fib['bw_and_cost'][dest_id]
-        data['networks'] = list()
-        data['paths'] = dict()
-        data['next-hop'] = other_id
-        data['weight'] = weight_update
-        data['networks'] = dest_data['networks'].copy()
-        data['paths'] = dest_data['paths'].copy()
-
-    def _map_path_characteristics_loss(self, neigh_routing_paths):
-        path_num = 1
-        for dest_id, dest_data in self.fib['low_loss'].items():
-            next_hop = dest_data['next-hop']
-            path_num_found = False
-            if dest_id != next_hop:
-               self.log.info('This is not neighbour destination-loss')
-               for path, path_number in dest_data['paths'].items():
-                   path_info = dict()
-                   path_info = neigh_routing_paths['othernode_paths']['low_loss'][next_hop]['path_characteristics']
-                   for path_type, path_data in path_info.items():
-                       if path_number == path_type:
-                          path_num_found = True
-                          path_num_new = self._map_path_number(path_data, path_num)
-                          break
-                   if path_num_found == True:
-                      dest_data['paths'][path] = path_num_new
-            if dest_id == next_hop:
-               self.log.info('This is neighbour destination-loss')
-               for path, path_number in dest_data['paths'].items():
-                   for iface in self._conf['interfaces']:
-                       if iface['name'] == path_number:
-                          path_num_found = True
-                          path_data = dict()
-                          path_data['loss'] = iface['link-characteristics']['loss']
-                          path_data['bandwidth'] = iface['link-characteristics']['bandwidth']
-                          path_data['cost'] = iface['link-characteristics']['cost']
-                          path_num_new = self._map_path_number(path_data, path_num)
-                          break
-                   if path_num_found==True:
-                      dest_data['paths'][path] = path_num_new
-
-
-    def _map_path_characteristics_BW(self, neigh_routing_paths):
-        path_num = 1
-        for dest_id, dest_data in self.fib['high_bandwidth'].items():
-            next_hop = dest_data['next-hop']
-            path_num_found = False
-            if dest_id != next_hop:
-               self.log.info('This is not neighbour destination-BW')
-               for path, path_number in dest_data['paths'].items():
-                   path_info = dict()
-                   path_info = neigh_routing_paths['othernode_paths']['high_bandwidth'][next_hop]['path_characteristics']
-                   for path_type, path_data in path_info.items():
-                       if path_number == path_type:
-                          path_num_found = True
-                          path_num_new = self._map_path_number(path_data, path_num)
-                          break
-                   if path_num_found==True:
-                      dest_data['paths'][path] = path_num_new
-            if dest_id == next_hop:
-                 self.log.info('This is neighbour destination-BW')
-                 for path, path_number in dest_data['paths'].items():
-                     for iface in self._conf['interfaces']:
-                         if iface['name']==path_number:
-                            path_num_found = True
-                            path_data = dict()
-                            path_data['loss'] = iface['link-characteristics']['loss']
-                            path_data['bandwidth'] = iface['link-characteristics']['bandwidth']
-                            path_data['cost'] = iface['link-characteristics']['cost']
-                            path_num_new = self._map_path_number(path_data, path_num)
-                            break
-                     if path_num_found==True:
-                        dest_data['paths'][path] = path_num_new
-
-
-    def _map_path_characteristics_BW_and_loss(self, neigh_routing_paths):
-        path_num = 1
-        for dest_id, dest_data in self.fib['bw_and_loss'].items():
-            next_hop = dest_data['next-hop']
-            path_num_found = False
-            if dest_id != next_hop:
-               self.log.info('This is not neighbour destination-BWLoss')
-               for path, path_number in dest_data['paths'].items():
-                   path_info = dict()
-                   path_info = neigh_routing_paths['othernode_paths']['bw_and_loss'][next_hop]['path_characteristics']
-                   for path_type, path_data in path_info.items():
-                       if path_number == path_type:
-                          path_num_found = True
-                          path_num_new = self._map_path_number(path_data, path_num)
-                          break
-                   if path_num_found==True:
-                      dest_data['paths'][path] = path_num_new
-            if dest_id == next_hop:
-               self.log.info('This is neighbour destination-BWLoss')
-               for path, path_number in dest_data['paths'].items():
-                   for iface in self._conf['interfaces']:
-                       if iface['name']==path_number:
-                          path_num_found = True
-                          path_data = dict()
-                          path_data['loss'] = iface['link-characteristics']['loss']
-                          path_data['bandwidth'] = iface['link-characteristics']['bandwidth']
-                          path_data['cost'] = iface['link-characteristics']['cost']
-                          path_num_new = self._map_path_number(path_data, path_num)
-                          break
-                   if path_num_found==True:
-                      dest_data['paths'][path] = path_num_new
-
-    def _map_path_characteristics_cost(self, neigh_routing_paths):
-        path_num = 1
-        self.log.debug(self.fib)
-        for dest_id, dest_data in self.fib['no_cost'].items():
-            next_hop = dest_data['next-hop']
-            path_num_found = False
-            if dest_id != next_hop:
-               self.log.info('This is not neighbour destination-Cost')
-               for path, path_number in dest_data['paths'].items():
-                   path_info = dict()
-                   path_info = neigh_routing_paths['othernode_paths']['no_cost'][next_hop]['path_characteristics']
-                   for path_type, path_data in path_info.items():
-                       if path_number == path_type:
-                          path_num_found = True
-                          path_num_new = self._map_path_number(path_data, path_num)
-                          break
-                   if path_num_found==True:
-                      dest_data['paths'][path] = path_num_new
-            if dest_id == next_hop:
-               self.log.info('This is neighbour destination-Cost')
-               self.log.debug(dest_data['paths'])
-               for path, path_number in dest_data['paths'].items():
-                   for iface in self._conf['interfaces']:
-                       if iface['name']==path_number:
-                          path_num_found = True
-                          path_data = dict()
-                          path_data['loss'] = iface['link-characteristics']['loss']
-                          path_data['bandwidth'] = iface['link-characteristics']['bandwidth']
-                          path_data['cost'] = iface['link-characteristics']['cost']
-                          path_num_new = self._map_path_number(path_data, path_num)
-                          break
-                   if path_num_found==True:
-                      dest_data['paths'][path] = path_num_new
-
-
-    def _map_path_characteristics_BW_and_cost(self, neigh_routing_paths):
-        path_num = 1
-        for dest_id, dest_data in self.fib['bw_and_cost'].items():
-            next_hop = dest_data['next-hop']
-            path_num_found = False
-            if dest_id != next_hop:
-               self.log.info('This is not neighbour destination-BWCost')
-               for path, path_number in dest_data['paths'].items():
-                   path_info = dict()
-                   path_info = neigh_routing_paths['othernode_paths']['bw_and_cost'][next_hop]['path_characteristics']
-                   for path_type, path_data in path_info.items():
-                       if path_number == path_type:
-                          path_num_found = True
-                          path_num_new = self._map_path_number(path_data, path_num)
-                          break
-                   if path_num_found==True:
-                      dest_data['paths'][path] = path_num_new
-            if dest_id == next_hop:
-               self.log.info('This is neighbour destination-BWCost')
-               for path, path_number in dest_data['paths'].items():
-                   for iface in self._conf['interfaces']:
-                       if iface['name']==path_number:
-                          path_num_found = True
-                          path_data = dict()
-                          path_data['loss'] = iface['link-characteristics']['loss']
-                          path_data['cost'] = iface['link-characteristics']['cost']
-                          path_data['bandwidth'] = iface['link-characteristics']['bandwidth']
-                          path_num_new = self._map_path_number(path_data, path_num)
-                          break
-                   if path_num_found==True:
-                      dest_data['paths'][path] = path_num_new
-
-
-    def _map_path_number(self, path_data, path_num):
-        path_char_found = False
-        self.log.debug(self.fib['path_characteristics'])
-        for fib_path_name, fib_path_data in self.fib['path_characteristics'].items():
-            if (path_data['loss']==fib_path_data['loss']) and (path_data['bandwidth']==fib_path_data['bandwidth']) and (path_data['cost']==fib_path_data['cost']) :
-               self.log.info('This is already existing path cahracteristic')
-               path_num_new = fib_path_name
-               path_char_found = True
-               break
-        if path_char_found==False:
-           while True:
-                 if not str(path_num) in self.fib['path_characteristics']:
-                    path_num_new = str(path_num)
-                    self.log.info('This path number is unique')
-                    break
-                 else:
-                      path_num+=1
-           self.fib['path_characteristics'][path_num_new] = path_data
-        return path_num_new
-
-
-    def _add_self_to_neigh_losspathnumber(self):
-        for i in range(2):
-            for dest_id, dest_data in self.fib['low_loss'].items():
-                next_hop = dest_data['next-hop']
-                if dest_id != next_hop:
-                   for path, path_num in self.fib['low_loss'][next_hop]['paths'].items():
-                       self.fib['low_loss'][dest_id]['paths'][path] = path_num
-
-
-    def _add_self_to_neigh_bandwidthpathnumber(self):
-        for i in range(2):
-            for dest_id, dest_data in self.fib['high_bandwidth'].items():
-                next_hop = dest_data['next-hop']
-                if dest_id != next_hop:
-                   for path, path_num in self.fib['high_bandwidth'][next_hop]['paths'].items():
-                       self.fib['high_bandwidth'][dest_id]['paths'][path] = path_num
-
-
-    def _add_self_to_neigh_BW_and_loss_pathnumber(self):
-        for i in range(2):
-            for dest_id, dest_data in self.fib['bw_and_loss'].items():
-                next_hop = dest_data['next-hop']
-                if dest_id != next_hop:
-                   for path, path_num in self.fib['bw_and_loss'][next_hop]['paths'].items():
-                       self.fib['bw_and_loss'][dest_id]['paths'][path] = path_num
-
-
-    def _add_self_to_neigh_cost_pathnumber(self):
-        for i in range(2):
-            for dest_id, dest_data in self.fib['no_cost'].items():
-                next_hop = dest_data['next-hop']
-                if dest_id != next_hop:
-                   for path, path_num in self.fib['no_cost'][next_hop]['paths'].items():
-                       self.fib['no_cost'][dest_id]['paths'][path] = path_num
-
-
-    def _add_self_to_neigh_BW_and_cost_pathnumber(self):
-        for i in range(2):
-            for dest_id, dest_data in self.fib['bw_and_cost'].items():
-                next_hop = dest_data['next-hop']
-                if dest_id != next_hop:
-                   for path, path_num in self.fib['bw_and_cost'][next_hop]['paths'].items():
-                       self.fib['bw_and_cost'][dest_id]['paths'][path] = path_num
-
-
-    def _add_lossweight_to_dest(self):
-        for dest_id, dest_data in self.fib['low_loss'].items():
-            self.fib['low_loss'][dest_id]['weight'] = 0
-            for path, path_num in dest_data['paths'].items():
-                for path_fib, path_data_fib in self.fib['path_characteristics'].items():
-                    if path_num == path_fib:
-                       weight_pre = self.fib['low_loss'][dest_id]['weight']
-                       self.fib['low_loss'][dest_id]['weight'] = weight_pre + path_data_fib['loss']
-                       break
-
-
-    def _add_bandwidthweight_to_dest(self):
-        for dest_id, dest_data in self.fib['high_bandwidth'].items():
-            self.fib['high_bandwidth'][dest_id]['weight'] = 0
-            for path, path_num in dest_data['paths'].items():
-                for path_fib, path_data_fib in self.fib['path_characteristics'].items():
-                    if path_num == path_fib:
-                       weight_pre = self.fib['high_bandwidth'][dest_id]['weight']
-                       self.fib['high_bandwidth'][dest_id]['weight'] = weight_pre + path_data_fib['bandwidth']
-                       break
-
-
-    def _add_BW_and_lossweight_to_dest(self, k1, k2):
-        for dest_id, dest_data in self.fib['bw_and_loss'].items():
-            self.fib['bw_and_loss'][dest_id]['weight'] = 0
-            for path, path_num in dest_data['paths'].items():
-                for path_fib, path_data_fib in self.fib['path_characteristics'].items():
-                    if path_num == path_fib:
-                       weight_pre = self.fib['bw_and_loss'][dest_id]['weight']
-                       bw = path_data_fib['bandwidth']
-                       loss = path_data_fib['loss']
-                       compound_metric = ((k1*(10000000/bw))+(k2*loss))
-                       self.fib['bw_and_loss'][dest_id]['weight'] = weight_pre + compound_metric
-                       break
-
-    def _add_costweight_to_dest(self):
-        for dest_id, dest_data in self.fib['no_cost'].items():
-            self.fib['no_cost'][dest_id]['weight'] = 0
-            for path, path_num in dest_data['paths'].items():
-                for path_fib, path_data_fib in self.fib['path_characteristics'].items():
-                    if path_num == path_fib:
-                       weight_pre = self.fib['no_cost'][dest_id]['weight']
-                       self.fib['no_cost'][dest_id]['weight'] = weight_pre + path_data_fib['cost']
-                       break
-
-    def _add_BW_and_costweight_to_dest(self):
-        for dest_id, dest_data in self.fib['bw_and_cost'].items():
-            self.fib['bw_and_cost'][dest_id]['weight'] = 0
-            for path, path_num in dest_data['paths'].items():
-                for path_fib, path_data_fib in self.fib['path_characteristics'].items():
-                    if path_num == path_fib:
-                       weight_pre = self.fib['bw_and_cost'][dest_id]['weight']
-                       self.fib['bw_and_cost'][dest_id]['weight'] = weight_pre + path_data_fib['bandwidth']
-                       break
-
-
-    def _calc_loss_routingtable(self):
-        self._routing_table['lowest-loss']=list()
-        for dest_id, dest_data in self.fib['low_loss'].items():
-            for network in dest_data['networks']:
-                loss_entry = dict()
-                for prefix_type, prefix_ip in network.items():
-                    loss_entry['proto'] = "v4"
-                    ip_pref_len = prefix_ip.split("/")
-                    loss_entry['prefix'] = ip_pref_len[0]
-                    loss_entry['prefix-len'] = ip_pref_len[1]
-                search_key = '{}>{}'.format(self._conf["id"], dest_data['next-hop'])
-                for path, path_num in dest_data['paths'].items():
-                    if path == search_key:
-                       for fib_path, fib_path_data in self.fib['path_characteristics'].items():
-                           if fib_path == path_num:
-                              path_found = False
-                              for iface in self._conf['interfaces']:
-                                  path_char = dict()
-                                  path_char = iface['link-characteristics']
-                                  if path_char['loss']==fib_path_data['loss'] and path_char['bandwidth']==fib_path_data['bandwidth']:
-                                     path_found = True
-                                     loss_entry['interface'] = iface['name']
-                                     break
-                              if path_found==True:
-                                 break
-                       break
-                loss_entry['next-hop'] = self.next_hop_ip_addr(loss_entry['proto'], dest_data['next-hop'], loss_entry['interface'])
-                self._routing_table['lowest-loss'].append(loss_entry)
-
-
-    def _calc_bw_routingtable(self):
-        self._routing_table['highest-bandwidth']=list()
-        for dest_id, dest_data in self.fib['high_bandwidth'].items():
-            for network in dest_data['networks']:
-                bw_entry=dict()
-                for prefix_type, prefix_ip in network.items():
-                    bw_entry['proto'] = "v4"
-                    ip_pref_len = prefix_ip.split("/")
-                    bw_entry['prefix'] = ip_pref_len[0]
-                    bw_entry['prefix-len'] = ip_pref_len[1]
-                search_key='{}>{}'.format(self._conf["id"], dest_data['next-hop'])
-                for path, path_num in dest_data['paths'].items():
-                   if path == search_key:
-                      for fib_path, fib_path_data in self.fib['path_characteristics'].items():
-                          if fib_path == path_num:
-                             path_found = False
-                             for iface in self._conf['interfaces']:
-                                 path_char = dict()
-                                 path_char = iface['link-characteristics']
-                                 if path_char['loss']==fib_path_data['loss'] and path_char['bandwidth']==fib_path_data['bandwidth']:
-                                    path_found = True
-                                    bw_entry['interface'] = iface['name']
-                                    break
-                             if path_found==True:
-                                break
-                      break
-                bw_entry['next-hop'] = self.next_hop_ip_addr(bw_entry['proto'], dest_data['next-hop'], bw_entry['interface'])
-                self._routing_table['highest-bandwidth'].append(bw_entry)
-
-
-    def _calc_bw_and_loss_routingtable(self):
-        self._routing_table['formular_bw_loss']=list()
-        for dest_id, dest_data in self.fib['bw_and_loss'].items():
-            for network in dest_data['networks']:
-                bwloss_entry=dict()
-                for prefix_type, prefix_ip in network.items():
-                    bwloss_entry['proto'] = "v4"
-                    ip_pref_len = prefix_ip.split("/")
-                    bwloss_entry['prefix'] = ip_pref_len[0]
-                    bwloss_entry['prefix-len'] = ip_pref_len[1]
-                search_key='{}>{}'.format(self._conf["id"], dest_data['next-hop'])
-                for path, path_num in dest_data['paths'].items():
-                    if path == search_key:
-                       for fib_path, fib_path_data in self.fib['path_characteristics'].items():
-                           if fib_path == path_num:
-                              path_found = False
-                              for iface in self._conf['interfaces']:
-                                  path_char = dict()
-                                  path_char = iface['link-characteristics']
-                                  if path_char['loss']==fib_path_data['loss'] and path_char['bandwidth']==fib_path_data['bandwidth']:
-                                     path_found = True
-                                     bwloss_entry['interface'] = iface['name']
-                                     break
-                              if path_found==True:
-                                 break
-                    break
-                bwloss_entry['next-hop'] = self.next_hop_ip_addr(bwloss_entry['proto'], dest_data['next-hop'], bwloss_entry['interface'])
-                self._routing_table['formular_bw_loss'].append(bwloss_entry)
-
-
-    def _calc_cost_routingtable(self):
-        self._routing_table['no-cost']=list()
-        for dest_id, dest_data in self.fib['no_cost'].items():
-            for network in dest_data['networks']:
-                cost_entry=dict()
-                for prefix_type, prefix_ip in network.items():
-                    cost_entry['proto'] = "v4"
-                    ip_pref_len = prefix_ip.split("/")
-                    cost_entry['prefix'] = ip_pref_len[0]
-                    cost_entry['prefix-len'] = ip_pref_len[1]
-                search_key='{}>{}'.format(self._conf["id"], dest_data['next-hop'])
-                for path, path_num in dest_data['paths'].items():
-                    if path == search_key:
-                       for fib_path, fib_path_data in self.fib['path_characteristics'].items():
-                           if fib_path == path_num:
-                              path_found = False
-                              for iface in self._conf['interfaces']:
-                                  path_char = dict()
-                                  path_char = iface['link-characteristics']
-                                  if path_char['cost']==fib_path_data['cost']:
-                                     path_found = True
-                                     cost_entry['interface'] = iface['name']
-                                     break
-                              if path_found==True:
-                                 break
-                    break
-                cost_entry['next-hop'] = self.next_hop_ip_addr(cost_entry['proto'], dest_data['next-hop'], cost_entry['interface'])
-                self._routing_table['no-cost'].append(cost_entry)
-
-
-    def _calc_bw_and_cost_routingtable(self):
-        self._routing_table['filtered-bw-cost']=list()
-        for dest_id, dest_data in self.fib['bw_and_cost'].items():
-            for network in dest_data['networks']:
-                bw_cost_entry=dict()
-                for prefix_type, prefix_ip in network.items():
-                    bw_cost_entry['proto'] = "v4"
-                    ip_pref_len = prefix_ip.split("/")
-                    bw_cost_entry['prefix'] = ip_pref_len[0]
-                    bw_cost_entry['prefix-len'] = ip_pref_len[1]
-                search_key='{}>{}'.format(self._conf["id"], dest_data['next-hop'])
-                for path, path_num in dest_data['paths'].items():
-                    if path == search_key:
-                       for fib_path, fib_path_data in self.fib['path_characteristics'].items():
-                           if fib_path == path_num:
-                              path_found = False
-                              for iface in self._conf['interfaces']:
-                                  path_char = dict()
-                                  path_char = iface['link-characteristics']
-                                  if path_char['cost']==fib_path_data['cost'] and path_char['bandwidth']==fib_path_data['bandwidth']:
-                                     path_found = True
-                                     bw_cost_entry['interface'] = iface['name']
-                                     break
-                              if path_found==True:
-                                 break
-                    break
-                bw_cost_entry['next-hop'] = self.next_hop_ip_addr(bw_cost_entry['proto'], dest_data['next-hop'], bw_cost_entry['interface'])
-                self._routing_table['filtered-bw-cost'].append(bw_cost_entry)
+    def _update_neigh_entry(self, neigh_id):
+        """ rebuild the neighbor entry from the routing messages received
+            on all interfaces and return all destinations depending on it """
+        neighs = self._rtd["neighs"]
+        adv_index = self._rtd["adv-index"]
+        old_dests = set()
+        known = neigh_id in neighs
+        if known:
+            old_dests = neighs[neigh_id].dests
+            self._release_neigh_paths(neighs[neigh_id])
+            del neighs[neigh_id]
+        new_dests = set()
+        neigh_data = self._calc_neigh_entry(neigh_id)
+        if neigh_data is not None:
+            neighs[neigh_id] = neigh_data
+            new_dests = neigh_data.dests
+        if known != (neigh_data is not None):
+            self._rtd["routes-changed"] = True
+        if neigh_data is None:
+            self._router_ids.forget_path_key(self._router_num, neigh_id)
+        for dest_id in old_dests - new_dests:
+            adv_index[dest_id].discard(neigh_id)
+            if len(adv_index[dest_id]) == 0:
+                del adv_index[dest_id]
+        for dest_id in new_dests - old_dests:
+            adv_index.setdefault(dest_id, set()).add(neigh_id)
+        return old_dests | new_dests | {neigh_id}
+
+
+    def _calc_neigh_entry(self, neigh_id):
+        neigh_data = None
+        for iface_no, (iface, iface_data) in enumerate(self._rtd["interfaces"].items()):
+            if not neigh_id in iface_data["rx-msg-db"]:
+                continue
+            rx_data = iface_data["rx-msg-db"][neigh_id]
+            if neigh_data is None:
+                neigh_data = DMPRNeighbor(rx_data.msg['networks'])
+            neigh_data.ifaces.append(iface)
+            self._add_neigh_links(neigh_data, iface)
+            if len(rx_data.msg['routingpaths']) > 0:
+                # routing paths received last on the interfaces are used,
+                # but the neighbor is ordered by the first one
+                neigh_data.routingpaths = rx_data.msg['routingpaths']
+                if neigh_data.rx_order is None:
+                    neigh_data.rx_order = (iface_no, rx_data.rx_order)
+        if neigh_data is None:
+            # all routing messages outdated
+            return None
+        # the advertised paths by router number, each checked once for
+        # running through this router instead of for every candidate
+        # route. The path keys are split once per table, see
+        # DMPRRouterIds.path()
+        for path_num, path_data in neigh_data.routingpaths.get('path_characteristics', dict()).items():
+            neigh_data.path_info[path_num] = DMPRPathData.from_dict(path_data)
+        for policy in self._metrics:
+            advertised = neigh_data.advertised[policy] = dict()
+            for dest_key, dest_data in neigh_data.routingpaths.get(policy, dict()).items():
+                if dest_key == 'path_characteristics':
+                    continue
+                dest_id = self._router_ids.number(dest_key)
+                if dest_id != self._router_num:
+                    neigh_data.dests.add(dest_id)
+                    advertised[dest_id] = (dest_data, self._path_routers(dest_data['paths']))
+        return neigh_data
+
+
+    def _path_routers(self, paths):
+        """ the routers on the paths as bitset over the router numbers, a
+            route runs through this router if its bit is set. The paths
+            are held for the neighbor entry and released with it, see
+            _release_neigh_paths() """
+        acquire_path = self._router_ids.acquire_path
+        path_routers = 0
+        for path in paths:
+            for router_num in acquire_path(path):
+                path_routers |= 1 << router_num
+        return path_routers
+
+
+    def _release_neigh_paths(self, neigh_data):
+        release_path = self._router_ids.release_path
+        for advertised in neigh_data.advertised.values():
+            for dest_data, path_routers in advertised.values():
+                for path in dest_data['paths']:
+                    release_path(path)
+
+
+    def _add_neigh_links(self, neigh_data, iface):
+        """ compress all links to a neighbor into the best
+            link per policy """
+        path_data = self._iface_path_characteristics(iface)
+        for policy, metric in self._metrics.items():
+            if not metric.usable(path_data):
+                continue
+            weight = metric.weight(path_data)
+            if policy in neigh_data.links:
+                if not metric.better_link(weight, neigh_data.links[policy][0]):
+                    continue
+            neigh_data.links[policy] = (weight, iface)
+
+
+    def _calc_dest_entries(self, dest_id):
+        """ select the path with the best weight per policy: the direct
+            link if the destination is a neighbor or a path advertised by
+            a neighbor extended by the link to it. On equal weight the
+            direct link and then the earlier neighbor wins. All policies
+            are filled in one walk over the advertising neighbors """
+        neighs = self._rtd["neighs"]
+        best = dict()
+        if dest_id in neighs:
+            for policy, (weight, iface) in neighs[dest_id].links.items():
+                best[policy] = (weight, dest_id, None)
+        # neighbors advertising this destination, earlier
+        # received neighbors first
+        other_ids = sorted(self._rtd["adv-index"].get(dest_id, set()),
+                           key=lambda other_id: neighs[other_id].rx_order)
+        for other_id in other_ids:
+            other_data = neighs[other_id]
+            for policy, (link_weight, iface) in other_data.links.items():
+                advertised = other_data.advertised[policy].get(dest_id)
+                if advertised is None:
+                    continue
+                dest_data, path_routers = advertised
+                if path_routers >> self._router_num & 1:
+                    self.log.debug("self_id in the path so avoiding looping",
+                                   dest=self._router_ids.router_id(dest_id),
+                                   neighbor=self._router_ids.router_id(other_id))
+                    continue
+                metric = self._metrics[policy]
+                weight = metric.combine(dest_data['weight'], link_weight)
+                if policy not in best or metric.better(weight, best[policy][0]):
+                    best[policy] = (weight, other_id, dest_data)
+        dest_key = self._router_ids.router_id(dest_id)
+        for policy in self._metrics:
+            fib = self.fib[policy]
+            routing_rows = self._rtd["routing-rows"][policy]
+            if policy not in best:
+                if dest_key in fib:
+                    self._fib_entry_changed(dest_id, fib[dest_key], None)
+                    self._release_path_nums(fib[dest_key])
+                    del fib[dest_key]
+                    del routing_rows[dest_id]
+                continue
+            weight, other_id, other_dest_data = best[policy]
+            if other_dest_data is None:
+                dest_data = self._calc_neigh_path_entry(policy, dest_id)
+            else:
+                dest_data = self._calc_other_path_entry(policy, other_id, other_dest_data)
+            # release the path numbers of the old entry after the new
+            # one holds its own, numbers in use by both stay the same
+            if dest_key in fib:
+                self._release_path_nums(fib[dest_key])
+            self._fib_entry_changed(dest_id, fib.get(dest_key), dest_data)
+            fib[dest_key] = dest_data
+            routing_rows[dest_id] = self._calc_routing_rows(policy, dest_id, dest_data)
+
+
+    def _calc_neigh_path_entry(self, policy, neigh_id):
+        weight, iface = self._rtd["neighs"][neigh_id].links[policy]
+        route = self._router_ids.path_key(self._router_num, neigh_id)
+        dest_data = DMPRFibEntry(self._router_ids.router_id(neigh_id),
+                                 self._rtd["neighs"][neigh_id].networks,
+                                 {route: self._acquire_iface_path_num(iface)})
+        dest_data.weight = self._calc_path_weight(policy, dest_data.paths)
+        return dest_data
+
+
+    def _calc_other_path_entry(self, policy, other_id, other_dest_data):
+        other_data = self._rtd["neighs"][other_id]
+        path_info = other_data.path_info
+        paths = dict()
+        # path numbers are local to the sender, map them to our own
+        # path characteristics. Numbers the sender did not define
+        # are unknown (None) and do not add to the weight. The path
+        # keys are the interned ones, not those of the message
+        router_ids = self._router_ids
+        for path, path_number in other_dest_data['paths'].items():
+            path_key = router_ids.path_key(*router_ids.path(path))
+            if path_number in path_info:
+                paths[path_key] = self._path_chars.acquire(path_info[path_number])
+            else:
+                paths[path_key] = None
+        # and add the link to the neighbor itself
+        weight, iface = other_data.links[policy]
+        route = router_ids.path_key(self._router_num, other_id)
+        paths[route] = self._acquire_iface_path_num(iface)
+        # FIB entries are replaced but never changed, the networks
+        # of the advertisement are shared by all policies
+        dest_data = DMPRFibEntry(router_ids.router_id(other_id), other_dest_data['networks'], paths)
+        dest_data.weight = self._calc_path_weight(policy, paths)
+        return dest_data
+
+
+    def _calc_path_weight(self, policy, paths):
+        metric = self._metrics[policy]
+        weight = None
+        for path, path_num in paths.items():
+            if path_num is not None:
+                link_weight = metric.weight(self._path_chars.lookup(path_num))
+                if weight is None:
+                    weight = link_weight
+                else:
+                    weight = metric.combine(weight, link_weight)
+        if weight is None:
+            return 0
+        return weight
+
+
+    def _calc_graph_entries(self):
+        """ route engine "graph": a shortest path search per policy from
+            this router over the links to the neighbors and all links of
+            the paths they advertise. A link learned from any path is
+            used for every destination, not only the advertised one. The
+            result is stored in the same FIB entries and routing table
+            rows as the path-vector engine creates. Path weights must not
+            get better when a path is extended """
+        networks = self._graph_networks()
+        for policy, metric in self._metrics.items():
+            graph = self._build_graph(policy)
+            tree = self._graph_search(metric, graph, self._router_num)
+            fib = self.fib[policy]
+            routing_rows = self._rtd["routing-rows"][policy]
+            for dest_id in list(routing_rows):
+                if dest_id not in tree or dest_id not in networks:
+                    dest_key = self._router_ids.router_id(dest_id)
+                    self._fib_entry_changed(dest_id, fib[dest_key], None)
+                    self._release_path_nums(fib[dest_key])
+                    del fib[dest_key]
+                    del routing_rows[dest_id]
+            for dest_id in tree:
+                if dest_id not in networks:
+                    # the router is only seen within paths
+                    continue
+                dest_key = self._router_ids.router_id(dest_id)
+                path = self._graph_path(tree, dest_id)
+                dest_data = self._calc_graph_path_entry(policy, graph, path, networks[dest_id])
+                if dest_key in fib:
+                    self._release_path_nums(fib[dest_key])
+                self._fib_entry_changed(dest_id, fib.get(dest_key), dest_data)
+                fib[dest_key] = dest_data
+                routing_rows[dest_id] = self._calc_routing_rows(policy, dest_id, dest_data)
+
+
+    def _ordered_neigh_ids(self, neigh_ids=None):
+        """ all or the given neighbors in receive order, neighbors
+            without routing paths last """
+        neighs = self._rtd["neighs"]
+        def order(neigh_id):
+            rx_order = neighs[neigh_id].rx_order
+            return (rx_order is None, rx_order or (), neigh_id)
+        return sorted(neighs if neigh_ids is None else neigh_ids, key=order)
+
+
+    def _graph_networks(self):
+        """ networks of all known routers, as announced by the
+            neighbors themselves or else by the first advertising one """
+        neighs = self._rtd["neighs"]
+        neigh_ids = self._ordered_neigh_ids()
+        networks = dict()
+        for neigh_id in neigh_ids:
+            networks[neigh_id] = neighs[neigh_id].networks
+        for neigh_id in neigh_ids:
+            for advertised in neighs[neigh_id].advertised.values():
+                for dest_id, (dest_data, path_routers) in advertised.items():
+                    networks.setdefault(dest_id, dest_data['networks'])
+        return networks
+
+
+    def _build_graph(self, policy):
+        """ directed graph {router: {router: (weight, path_data, iface)}}
+            of the links usable by the policy. iface is only set for the
+            links of this router, links with unknown characteristics have
+            no weight. Of several links between two routers the better
+            one is kept """
+        neighs = self._rtd["neighs"]
+        metric = self._metrics[policy]
+        self_id = self._router_num
+        path_of_key = self._router_ids.path
+        neigh_ids = self._ordered_neigh_ids()
+        graph = {self_id: dict()}
+        for neigh_id in neigh_ids:
+            if policy in neighs[neigh_id].links:
+                weight, iface = neighs[neigh_id].links[policy]
+                path_data = self._iface_path_characteristics(iface)
+                graph[self_id][neigh_id] = (weight, path_data, iface)
+        for neigh_id in neigh_ids:
+            routingpaths = neighs[neigh_id].routingpaths
+            path_info = neighs[neigh_id].path_info
+            for dest_data in routingpaths.get(policy, dict()).values():
+                for path, path_number in dest_data['paths'].items():
+                    router_id, next_id = path_of_key(path)
+                    if router_id == self_id or next_id == self_id:
+                        # our own links are known better
+                        continue
+                    path_data = path_info.get(path_number)
+                    weight = None
+                    if path_data is not None:
+                        if not metric.usable(path_data):
+                            continue
+                        weight = metric.weight(path_data)
+                    links = graph.setdefault(router_id, dict())
+                    if next_id in links:
+                        old_weight = links[next_id][0]
+                        if weight is None or (old_weight is not None and
+                                              not metric.better_link(weight, old_weight)):
+                            continue
+                    links[next_id] = (weight, path_data, None)
+        return graph
+
+
+    def _combine_weight(self, metric, weight, link_weight):
+        if link_weight is None:
+            return weight
+        if weight is None:
+            return link_weight
+        return metric.combine(weight, link_weight)
+
+
+    def _graph_search(self, metric, graph, source_id, target_id=None, weight=None,
+                      banned_ids=frozenset(), banned_links=frozenset()):
+        """ Dijkstra search with a binary heap, returns the shortest path
+            tree {router: (weight, previous router)} of all reached routers
+            or up to the target. weight is the one of the path up to the
+            source. On equal weight the earlier found path wins """
+        tree = {source_id: (weight, None)}
+        best = dict()
+        heap = list()
+        seq = 0
+        router_id = source_id
+        while router_id != target_id:
+            for next_id, (link_weight, path_data, iface) in graph.get(router_id, dict()).items():
+                if next_id in tree or next_id in banned_ids or (router_id, next_id) in banned_links:
+                    continue
+                next_weight = self._combine_weight(metric, weight, link_weight)
+                if next_id in best and not metric.better(next_weight, best[next_id]):
+                    continue
+                best[next_id] = next_weight
+                heapq.heappush(heap, (DMPRWeightOrder(metric, next_weight), seq, next_id, router_id))
+                seq += 1
+            # skip entries of routers reached on a better path meanwhile
+            while heap and heap[0][2] in tree:
+                heapq.heappop(heap)
+            if not heap:
+                break
+            order, _, router_id, prev_id = heapq.heappop(heap)
+            weight = order.weight
+            tree[router_id] = (weight, prev_id)
+        return tree
+
+
+    def _graph_path(self, tree, dest_id):
+        path = [dest_id]
+        while tree[path[-1]][1] is not None:
+            path.append(tree[path[-1]][1])
+        path.reverse()
+        return path
+
+
+    def _calc_graph_path_entry(self, policy, graph, path, networks):
+        paths = dict()
+        for router_id, next_id in zip(path, path[1:]):
+            weight, path_data, iface = graph[router_id][next_id]
+            route = self._router_ids.path_key(router_id, next_id)
+            if iface is not None:
+                paths[route] = self._acquire_iface_path_num(iface)
+            elif path_data is not None:
+                paths[route] = self._path_chars.acquire(path_data)
+            else:
+                paths[route] = None
+        dest_data = DMPRFibEntry(self._router_ids.router_id(path[1]), networks, paths)
+        dest_data.weight = self._calc_path_weight(policy, paths)
+        return dest_data
+
+
+    def k_shortest_paths(self, policy, dest_id, k):
+        """ up to k loop free paths to a destination, best first, over
+            the links the route engine "graph" uses (Yen's algorithm).
+            Available with every route engine. Only the links to the
+            neighbors and the links within the best paths they advertise
+            are known, alternatives over other links of the network are
+            not found. The entries are shaped like FIB entries but the
+            'paths' hold the path characteristics itself instead of path
+            numbers """
+        dest_id = self._router_ids.lookup(dest_id)
+        if policy not in self._metrics or dest_id is None:
+            return list()
+        metric = self._metrics[policy]
+        graph = self._build_graph(policy)
+        tree = self._graph_search(metric, graph, self._router_num, dest_id)
+        if dest_id not in tree:
+            return list()
+        found = [(tree[dest_id][0], self._graph_path(tree, dest_id))]
+        seen = {tuple(found[0][1])}
+        candidates = list()
+        seq = 0
+        while len(found) < k:
+            last_path = found[-1][1]
+            for i in range(len(last_path) - 1):
+                # deviate from the last path at its i-th router, with
+                # all links already used after the same root banned
+                root = last_path[:i + 1]
+                banned_links = {(path[i], path[i + 1]) for weight, path in found
+                                if path[:i + 1] == root}
+                root_weight = None
+                for router_id, next_id in zip(root, root[1:]):
+                    root_weight = self._combine_weight(metric, root_weight,
+                                                       graph[router_id][next_id][0])
+                spur = self._graph_search(metric, graph, root[-1], dest_id, root_weight,
+                                          frozenset(root[:-1]), banned_links)
+                if dest_id not in spur:
+                    continue
+                path = root[:-1] + self._graph_path(spur, dest_id)
+                if tuple(path) in seen:
+                    continue
+                seen.add(tuple(path))
+                heapq.heappush(candidates, (DMPRWeightOrder(metric, spur[dest_id][0]), seq, path))
+                seq += 1
+            if not candidates:
+                break
+            order, _, path = heapq.heappop(candidates)
+            found.append((order.weight, path))
+        networks = self._graph_networks().get(dest_id, list())
+        entries = list()
+        for weight, path in found:
+            paths = dict()
+            for router_id, next_id in zip(path, path[1:]):
+                path_data = graph[router_id][next_id][1]
+                paths[self._router_ids.path_key(router_id, next_id)] = \
+                    None if path_data is None else path_data.as_dict()
+            entries.append({'next-hop': self._router_ids.router_id(path[1]),
+                            'networks': networks.copy(),
+                            'paths': paths,
+                            'weight': 0 if weight is None else weight})
+        return entries
+
+
+    def _aggregate_networks(self, networks):
+        """ collapse adjacent and covered prefixes of the own networks,
+            all of them have the same forwarding: this router """
+        by_key = dict()
+        for network in networks:
+            for prefix_type, prefix_ip in network.items():
+                by_key.setdefault(prefix_type, list()).append(ipaddress.ip_network(prefix_ip, strict=False))
+        aggregated = list()
+        for prefix_type, prefixes in by_key.items():
+            for prefix in ipaddress.collapse_addresses(prefixes):
+                aggregated.append({prefix_type: str(prefix)})
+        return aggregated
+
+
+    def _aggregate_rows(self, rows):
+        """ collapse the rows of a routing table with the same forwarding,
+            the longest prefix match result stays the same for every
+            address: a prefix is dropped if the nearest prefix covering
+            it forwards the same way, two sibling prefixes are merged if
+            both forward the same way and their parent prefix is not
+            routed. A prefix routed to several destinations which forward
+            differently is kept with all its rows. Unchanged rows are kept
+            as they are """
+        def row_forwarding(row):
+            return (row.interface, row.next_hop,
+                    tuple(tuple(sorted(next_hop.items())) for next_hop in row.next_hops or ()))
+        def forwarding(network):
+            # None if the rows of the prefix forward differently
+            result = row_forwarding(routes[network][0])
+            for row in routes[network][1:]:
+                if row_forwarding(row) != result:
+                    return None
+            return result
+        routes = dict()
+        for row in rows:
+            network = ipaddress.ip_network("{}/{}".format(row.prefix, row.prefix_len), strict=False)
+            routes.setdefault(network, list()).append(row)
+        def covering_network(network):
+            for prefix_len in range(network.prefixlen - 1, -1, -1):
+                supernet = network.supernet(new_prefix=prefix_len)
+                if supernet in routes:
+                    return supernet
+            return None
+        for network in sorted(routes, key=lambda network: network.prefixlen):
+            cover = covering_network(network)
+            if cover is not None and forwarding(network) is not None and \
+                    forwarding(cover) == forwarding(network):
+                del routes[network]
+        # merge siblings from the longest prefixes up, a merged prefix
+        # may merge again with its own sibling
+        pending = sorted(routes, key=lambda network: network.prefixlen, reverse=True)
+        while pending:
+            network = pending.pop(0)
+            if network not in routes or network.prefixlen == 0:
+                continue
+            parent = network.supernet()
+            if parent in routes:
+                continue
+            sibling = next(subnet for subnet in parent.subnets() if subnet != network)
+            row_forward = forwarding(network)
+            if row_forward is None or sibling not in routes or forwarding(sibling) != row_forward:
+                continue
+            row = routes[network][0]
+            del routes[network]
+            del routes[sibling]
+            merged = DMPRRoute(row.dest, row.proto, str(parent.network_address), str(parent.prefixlen),
+                               row.interface, row.next_hop, row.next_hops)
+            cover = covering_network(parent)
+            if cover is None or forwarding(cover) != row_forward:
+                routes[parent] = [merged]
+                pending.insert(0, parent)
+        return [row for network_rows in routes.values() for row in network_rows]
+
+
+    def _calc_routing_rows(self, policy, dest_id, dest_data):
+        """ one row per network of the destination, v4 and v6 networks
+            use the same paths with the next hop addresses of their
+            address family """
+        paths = self._calc_next_hops(policy, dest_id, dest_data)
+        dest_key = self._router_ids.router_id(dest_id)
+        next_hops_by_proto = dict()
+        rows = list()
+        for network in dest_data.networks:
+            for prefix_type, prefix_ip in network.items():
+                # "v4-prefix" or "v6-prefix"
+                proto = prefix_type.split("-")[0]
+                if proto not in next_hops_by_proto:
+                    next_hops_by_proto[proto] = self._calc_next_hop_addrs(proto, paths)
+                next_hops = next_hops_by_proto[proto]
+                if len(next_hops) == 0:
+                    # no neighbor on the paths has an address of this family
+                    continue
+                prefix, prefix_len = prefix_ip.split("/")
+                entry = DMPRRoute(dest_key, proto, prefix, prefix_len,
+                                  next_hops[0]['interface'], next_hops[0]['next-hop'])
+                if self._conf["multipath"] == "on":
+                    entry.next_hops = next_hops
+                rows.append(entry)
+        return rows
+
+
+    def _calc_next_hop_addrs(self, proto, paths):
+        """ the next hops of the paths which have an address of the
+            protocol, the load is split by the bandwidth of the paths """
+        addrs = list()
+        for neigh_id, iface_name, bandwidth in paths:
+            addr = self._next_hop_ip_addr(proto, neigh_id, iface_name)
+            if addr is not None:
+                addrs.append((addr, iface_name, bandwidth))
+        bandwidth_sum = sum(bandwidth for addr, iface_name, bandwidth in addrs)
+        next_hops = list()
+        for addr, iface_name, bandwidth in addrs:
+            if bandwidth_sum > 0:
+                load_share = bandwidth / bandwidth_sum
+            else:
+                load_share = 1 / len(addrs)
+            next_hops.append({'next-hop': addr,
+                              'interface': iface_name,
+                              'load-share': round(load_share, 3)})
+        return next_hops
+
+
+    def _calc_next_hops(self, policy, dest_id, dest_data):
+        """ the best path and, with multipath on, all paths over the
+            links to the neighbors which are within the multipath
+            tolerance of it, as list of (neighbor, interface, bandwidth).
+            Paths longer than the best one are not used, else policies
+            where most paths weigh the same would spread the traffic over
+            detours """
+        next_hop = self._router_ids.number(dest_data.next_hop)
+        route = self._router_ids.path_key(self._router_num, next_hop)
+        path_data = self._path_chars.lookup(dest_data.paths[route])
+        iface_name = self._iface_by_path_characteristics(path_data, next_hop)
+        next_hops = [(next_hop, iface_name,
+                      self._path_bandwidth(dest_data.paths, self._path_chars.lookup))]
+        if self._conf["multipath"] != "on":
+            return next_hops
+        neighs = self._rtd["neighs"]
+        metric = self._metrics[policy]
+        tolerance = float(self._conf["multipath-tolerance"])
+        hops = len(dest_data.paths)
+        neigh_ids = set(self._rtd["adv-index"].get(dest_id, set()))
+        if dest_id in neighs:
+            neigh_ids.add(dest_id)
+        for neigh_id in self._ordered_neigh_ids(neigh_ids):
+            neigh_data = neighs[neigh_id]
+            if neigh_id == dest_id:
+                other_dest_data = None
+            else:
+                other_dest_data, path_routers = neigh_data.advertised[policy].get(dest_id, (None, None))
+                if other_dest_data is None or len(other_dest_data['paths']) + 1 > hops:
+                    continue
+                if path_routers >> self._router_num & 1:
+                    continue
+                other_bandwidth = self._path_bandwidth(other_dest_data['paths'], neigh_data.path_info.get)
+            for iface in neigh_data.ifaces:
+                if neigh_id == next_hop and iface == iface_name:
+                    continue
+                link_data = self._iface_path_characteristics(iface)
+                if not metric.usable(link_data):
+                    continue
+                weight = metric.weight(link_data)
+                bandwidth = link_data.bandwidth
+                if other_dest_data is not None:
+                    weight = metric.combine(other_dest_data['weight'], weight)
+                    if other_bandwidth is not None:
+                        bandwidth = min(bandwidth, other_bandwidth)
+                if metric.tolerable(weight, dest_data.weight, tolerance):
+                    next_hops.append((neigh_id, iface, bandwidth))
+        return next_hops
+
+
+    def _path_bandwidth(self, paths, path_data_by_num):
+        """ bottleneck bandwidth of the links with known characteristics """
+        bandwidth = None
+        for path_num in paths.values():
+            path_data = path_data_by_num(path_num)
+            if path_data is not None and (bandwidth is None or path_data.bandwidth < bandwidth):
+                bandwidth = path_data.bandwidth
+        return bandwidth
+
+
+    def _iface_by_path_characteristics(self, path_data, router_id):
+        """ outgoing interface of a link with these characteristics, if
+            several interfaces share them the one the router is seen on """
+        iface_names = self._ifaces_by_path_data.get(path_data)
+        if not iface_names:
+            return None
+        for iface_name in iface_names:
+            if router_id in self._rtd["interfaces"][iface_name]["rx-msg-db"]:
+                return iface_name
+        return iface_names[0]
+
+
+    def _iface_path_characteristics(self, iface_name):
+        return self._iface_index[iface_name]['path-characteristics']
+
+
+    def _acquire_iface_path_num(self, iface_name):
+        return self._path_chars.acquire(self._iface_path_characteristics(iface_name))
+
+
+    def _release_path_nums(self, dest_data):
+        for path_num in dest_data.paths.values():
+            if path_num is not None:
+                self._path_chars.release(path_num)
 
 
     def register_get_time_cb(self, function, priv_data=None):
         self._get_time = function
         self._get_time_priv_data = priv_data
+        self.log.register_get_time_cb(function, priv_data)
 
 
     def register_routing_table_update_cb(self, function, priv_data=None):
@@ -1508,11 +2883,36 @@ class DMPR(object):
         self._routing_table_update_func_priv_data = priv_data
 
 
+    def register_routing_table_diff_cb(self, function, priv_data=None):
+        """ optional, called with the route changes since the last call
+            instead of the complete routing tables, not called when no
+            route changed. The prototype should look like:
+            func(diff, priv_data=None), see _routing_table_diff() """
+        self._routing_table_diff_func = function
+        self._routing_table_diff_func_priv_data = priv_data
+
+
+    def register_metric(self, metric):
+        """ register an additional routing policy or replace a policy
+            with the same name, see DMPRMetric. Each policy results in
+            an own routing table. Must be called before start() """
+        assert isinstance(metric, DMPRMetric)
+        assert(not self._started)
+        self._metrics[metric.name] = metric
+
+
+    def unregister_metric(self, name):
+        """ disable a routing policy, e.g. one of the default policies """
+        assert(not self._started)
+        del self._metrics[name]
+
+
     def register_msg_tx_cb(self, function, priv_data=None):
         """ when a DMPR packet must be transmitted
         the surrounding framework must register this
         function. The prototype for the function should look like:
         func(interface_name, proto, dst_mcast_addr, packet)
+        packet is a dict or bytes, depending on "rtn-msg-format"
         """
         self._packet_tx_func = function
         self._packet_tx_func_priv_data = priv_data
@@ -1533,8 +2933,119 @@ class DMPR(object):
              ]
              }
         """
-        self._routing_table_update_func(self._routing_table,
-                                        priv_data=self._routing_table_update_func_priv_data)
+        if self._routing_table_update_func is not None:
+            routing_table = {table: [row.as_dict() for row in rows]
+                             for table, rows in self._routing_table.items()}
+            self._routing_table_update_func(routing_table,
+                                            priv_data=self._routing_table_update_func_priv_data)
+        if self._routing_table_diff_func is not None:
+            diff = self._routing_table_diff(self._installed_routes)
+            if len(diff) > 0:
+                for operations in diff.values():
+                    for operation in operations:
+                        operation['destination'] = operation['route'].dest
+                        operation['route'] = operation['route'].as_dict()
+                self._routing_table_diff_func(diff, priv_data=self._routing_table_diff_func_priv_data)
+
+
+    def _routing_table_diff(self, installed_routes):
+        """ return the changed routes per routing table compared to the
+            installed routes {table: {route key: row}} and update them to
+            the current routing table, to be applied as one transaction. Routes are identified
+            by destination, proto, prefix and prefix length: two routers
+            advertising the same network have a route each. Deletions
+            come first. The routes are DMPRRoute records, the driver gets
+            their dict form and the router id of the destination:
+             {
+             "lowest-loss" : [
+                { "op" : "delete", "destination" : "ID-3", "route" : { "proto" : "v4", "prefix" : "10.12.0.0", ... } },
+                { "op" : "replace", "destination" : "ID-2", "route" : { "proto" : "v4", "prefix" : "10.11.0.0", ... } },
+                { "op" : "add", "destination" : "ID-1", "route" : { "proto" : "v4", "prefix" : "10.10.0.0", ... } },
+             ]
+             }
+            Rows of unchanged destinations are the same objects as before,
+            they are skipped without comparing them """
+        diff = dict()
+        tables = list(self._routing_table)
+        tables.extend(table for table in installed_routes if table not in self._routing_table)
+        for table in tables:
+            installed = installed_routes.get(table, dict())
+            routes = dict()
+            for row in self._routing_table.get(table, list()):
+                routes[self._route_key(row)] = row
+            deleted, replaced, added = list(), list(), list()
+            for key, row in installed.items():
+                if key not in routes:
+                    deleted.append({'op': 'delete', 'route': row})
+            for key, row in routes.items():
+                old_row = installed.get(key)
+                if old_row is None:
+                    added.append({'op': 'add', 'route': row})
+                elif old_row is not row and old_row != row:
+                    replaced.append({'op': 'replace', 'route': row})
+            if len(deleted) + len(replaced) + len(added) > 0:
+                diff[table] = deleted + replaced + added
+            if len(routes) > 0:
+                installed_routes[table] = routes
+            else:
+                installed_routes.pop(table, None)
+        return diff
+
+
+    def _route_key(self, row):
+        return (row.dest, row.proto, row.prefix, row.prefix_len)
+
+
+    def lookup(self, policy, address):
+        """ return the routing table row of the longest prefix containing
+            the IPv4/IPv6 address or None. policy is the name of a policy
+            or of its routing table """
+        if self._routing_table is None:
+            return None
+        if self._rtd["lookup-outdated"]:
+            self._update_lookup_tries()
+        if policy in self._metrics:
+            policy = self._metrics[policy].table
+        address = ipaddress.ip_address(address)
+        trie = self._rtd["lookup-tries"].get((policy, "v{}".format(address.version)))
+        if trie is None:
+            return None
+        row = trie.lookup(int(address))
+        if row is None:
+            return None
+        return row.as_dict()
+
+
+    def _update_lookup_tries(self):
+        """ patch the tries with the routing table changes since the last
+            lookup, unchanged routes are not touched. A prefix routed to
+            several destinations holds one of their rows """
+        tries = self._rtd["lookup-tries"]
+        prefixes = self._rtd["lookup-prefixes"]
+        diff = self._routing_table_diff(self._rtd["lookup-routes"])
+        for table, operations in diff.items():
+            for operation in operations:
+                row = operation['route']
+                network = ipaddress.ip_network("{}/{}".format(row.prefix, row.prefix_len),
+                                               strict=False)
+                key = (table, row.proto)
+                if key not in tries:
+                    tries[key] = DMPRPrefixTrie(network.max_prefixlen)
+                prefix = int(network.network_address)
+                prefix_key = (table, row.proto, row.prefix, row.prefix_len)
+                rows = prefixes.setdefault(prefix_key, dict())
+                if operation['op'] != 'delete':
+                    rows[row.dest] = row
+                    tries[key].insert(prefix, network.prefixlen, row)
+                    continue
+                del rows[row.dest]
+                if len(rows) > 0:
+                    # the prefix is still routed to another destination
+                    tries[key].insert(prefix, network.prefixlen, next(iter(rows.values())))
+                else:
+                    del prefixes[prefix_key]
+                    tries[key].remove(prefix, network.prefixlen)
+        self._rtd["lookup-outdated"] = False
 
 
     def _packet_tx(self, msg):
@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+""" benchmarks for the DMPR core, run offline: the core is driven only
+    through its register_*_cb hooks and msg_rx().
+
+    pipeline: time each stage of the route calculation and track peak
+              memory for one node receiving synthetic routing messages
+              of all its neighbors (rx-msg-db generators)
+    codec:    size and time of the binary routing message format
+              compared to the JSON form of the same message
+    delta:    control traffic of a converged mesh with delta messages
+              between full snapshots compared to full messages only
+    compare:  compare two result files written with --output
+
+    usage: dmpr_bench.py [pipeline|codec|delta] [--nodes N ...] [--output FILE]
+           dmpr_bench.py compare OLD NEW """
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import dmpr
+from dmpr_sim import (NoLog, INTERFACE_CLASSES, TOPOLOGIES, interfaces, topology,
+                      node_id, node_addr, node_conf, neighbors, msg_size)
+
+
+class SyntheticRxMsgs(object):
+    """ generate the routing messages a node receives from its neighbors
+        in a converged network without running the network: every
+        neighbor advertises shortest (hop count) paths to all nodes.
+        Weights are calculated with the default metrics """
+
+    def __init__(self, links, n):
+        self.links = links
+        self.n = n
+        self.adj = [dict() for _ in range(n)]
+        for a, b, iface in links:
+            self.adj[a][b] = iface
+            self.adj[b][a] = iface
+        link_chars = dict(interfaces(len(INTERFACE_CLASSES) * 4))
+        self.link_chars = dict()
+        for name, chars in link_chars.items():
+            self.link_chars[name] = dmpr.DMPRPathData.from_dict({key: int(value) for key, value
+                                                                 in chars.items()})
+        self.metrics = [metric_cls() for metric_cls in dmpr.DMPR_DEFAULT_METRICS]
+        # path numbers as a converged node would advertise them, one
+        # number per distinct link characteristics in use
+        self.path_nums = dict()
+        self.path_characteristics = dict()
+        for name in sorted({iface for a, b, iface in links}):
+            chars = self.link_chars[name]
+            for path_num, path_data in self.path_characteristics.items():
+                if path_data == chars:
+                    break
+            else:
+                path_num = str(len(self.path_characteristics) + 1)
+                self.path_characteristics[path_num] = chars
+            self.path_nums[name] = path_num
+
+    def busiest_node(self):
+        return max(range(self.n), key=lambda i: (len(self.adj[i]), -i))
+
+    def msgs(self, i, sequence_no=1):
+        """ list of (interface, msg) received by node i """
+        return [(iface, self.msg(neigh, iface, sequence_no))
+                for neigh, iface in sorted(self.adj[i].items())]
+
+    def msg(self, neigh, iface, sequence_no):
+        routingpaths = {metric.name: dict() for metric in self.metrics}
+        routingpaths['path_characteristics'] = {path_num: path_data.as_dict() for path_num, path_data
+                                                in self.path_characteristics.items()}
+        for dest, path in self._shortest_paths(neigh).items():
+            links = [(a, b, self.adj[a][b]) for a, b in zip(path, path[1:])]
+            link_data = [self.link_chars[iface] for a, b, iface in links]
+            for metric in self.metrics:
+                if not all(metric.usable(chars) for chars in link_data):
+                    continue
+                weight = metric.weight(link_data[0])
+                for chars in link_data[1:]:
+                    weight = metric.combine(weight, metric.weight(chars))
+                routingpaths[metric.name][node_id(dest)] = {
+                    'next-hop' : node_id(path[1]),
+                    'networks' : [{ "v4-prefix" : "172.{}.{}.0/24".format(16 + (dest >> 8), dest & 0xff) }],
+                    'paths' : {"{}>{}".format(node_id(a), node_id(b)) : self.path_nums[iface]
+                               for a, b, iface in links},
+                    'weight' : weight
+                }
+        msg = {
+            'id' : node_id(neigh),
+            'sequence-no' : sequence_no,
+            'networks' : [{ "v4-prefix" : "172.{}.{}.0/24".format(16 + (neigh >> 8), neigh & 0xff) }],
+            'originator-addr-v4' : node_addr(neigh, 0),
+            'routingpaths' : routingpaths
+        }
+        return msg
+
+    def _shortest_paths(self, src):
+        """ {dest: [src, ..., dest]} breadth first """
+        prev = {src: None}
+        queue = [src]
+        for node in queue:
+            for neigh in sorted(self.adj[node]):
+                if neigh not in prev:
+                    prev[neigh] = node
+                    queue.append(neigh)
+        paths = dict()
+        for dest in prev:
+            if dest == src:
+                continue
+            path = [dest]
+            while path[-1] != src:
+                path.append(prev[path[-1]])
+            paths[dest] = path[::-1]
+        return paths
+
+
+# pipeline stages, the methods of DMPR taking part in each of them
+PIPELINE_STAGES = {
+    "rx" : ["_rx_save_routing_data"],
+    "neighbors" : ["_update_neigh_entry"],
+    "fib" : ["_calc_dest_entries"],
+    "path-numbers" : ["_calc_neigh_path_entry", "_calc_other_path_entry"],
+    "weights" : ["_calc_path_weight"],
+    "routing-table" : ["_calc_routing_rows"],
+    "tx" : ["create_routing_msg"],
+}
+
+
+class StageTimer(object):
+    """ wraps the stage methods of a DMPR instance and accumulates the
+        time spent in each stage exclusive of nested stages """
+
+    def __init__(self, core, stages):
+        self._stack = list()
+        self.reset(stages)
+        for stage, methods in stages.items():
+            for method in methods:
+                setattr(core, method, self._wrap(stage, getattr(core, method)))
+
+    def reset(self, stages=None):
+        stages = stages or self.seconds
+        self.seconds = {stage: 0.0 for stage in stages}
+        self.calls = {stage: 0 for stage in stages}
+
+    def _wrap(self, stage, func):
+        def timed(*args, **kwargs):
+            self._stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = self._stack.pop()
+                self.seconds[stage] += elapsed - nested
+                self.calls[stage] += 1
+                if len(self._stack) > 0:
+                    self._stack[-1] += elapsed
+        return timed
+
+    def result(self):
+        return {stage: {"seconds" : self.seconds[stage], "calls" : self.calls[stage]}
+                for stage in self.seconds}
+
+
+class Node(object):
+    """ single DMPR core driven by hand """
+
+    def __init__(self, conf):
+        self.now = 0
+        self.sent = list()
+        self.routing_table = None
+        self.core = dmpr.DMPR(log=NoLog(), log_level="error")
+        self.core.register_configuration(conf)
+        self.core.register_get_time_cb(self._get_time)
+        self.core.register_routing_table_update_cb(self._routing_table_update)
+        self.core.register_msg_tx_cb(self._msg_tx)
+        self.core.start()
+
+    def _get_time(self, priv_data=None):
+        return self.now
+
+    def _routing_table_update(self, routing_table, priv_data=None):
+        self.routing_table = routing_table
+
+    def _msg_tx(self, interface_name, proto, mcast_addr, msg, priv_data=None):
+        self.sent.append(msg)
+
+
+def pipeline_phases(node, msgs, refresh_msgs):
+    """ run the phases of a node lifetime, yield (phase, seconds) """
+    start = time.perf_counter()
+    for iface, msg in msgs:
+        node.core.msg_rx(iface, msg)
+    yield "cold-start", time.perf_counter() - start
+    start = time.perf_counter()
+    node.core._recalculate_routing_table()
+    yield "full-recalculation", time.perf_counter() - start
+    node.now += 1
+    start = time.perf_counter()
+    for iface, msg in refresh_msgs:
+        node.core.msg_rx(iface, msg)
+    yield "refresh", time.perf_counter() - start
+    start = time.perf_counter()
+    node.core.tx_route_packet()
+    yield "tx", time.perf_counter() - start
+
+
+def bench_pipeline(topology_name, n, interface_count, repeat, seed):
+    links = topology(topology_name, n, interface_count, seed)
+    synthetic = SyntheticRxMsgs(links, n)
+    i = synthetic.busiest_node()
+    msgs = synthetic.msgs(i, sequence_no=1)
+    refresh_msgs = synthetic.msgs(i, sequence_no=2)
+    conf = node_conf(i, links)
+    best = dict()
+    for _ in range(repeat):
+        node = Node(conf)
+        timer = StageTimer(node.core, PIPELINE_STAGES)
+        for phase, seconds in pipeline_phases(node, msgs, refresh_msgs):
+            if phase not in best or seconds < best[phase]["seconds"]:
+                best[phase] = {"seconds" : seconds, "stages" : timer.result()}
+            timer.reset()
+    # memory in an own run, tracemalloc slows down the timed one
+    node = Node(conf)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for iface, msg in msgs:
+        node.core.msg_rx(iface, msg)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "topology" : topology_name,
+        "nodes" : n,
+        "node-interfaces" : len(conf["interfaces"]),
+        "neighbors" : len(msgs),
+        "destinations" : len(node.core.fib['low_loss']),
+        "routes" : sum(len(rows) for rows in node.routing_table.values()),
+        "phases" : best,
+        "memory" : {
+            "cold-start-peak-kib" : (peak - before) / 1024,
+            "retained-kib" : (retained - before) / 1024,
+        }
+    }
+
+
+def print_pipeline(results):
+    stages = list(PIPELINE_STAGES)
+    fmt = "{:<16} {:>5} {:>3} {:>5} {:>5} {:>19} {:>9}" + " {:>9}" * len(stages) + " {:>9}"
+    print(fmt.format("topology", "nodes", "if", "neigh", "dests", "phase", "ms",
+                     *stages, "peak KiB"))
+    for r in results:
+        for phase, data in r["phases"].items():
+            print(fmt.format(r["topology"], r["nodes"], r["node-interfaces"], r["neighbors"],
+                             r["destinations"], phase, "{:.2f}".format(data["seconds"] * 1e3),
+                             *["{:.2f}".format(data["stages"][stage]["seconds"] * 1e3)
+                               for stage in stages],
+                             "{:.0f}".format(r["memory"]["cold-start-peak-kib"])))
+
+
+class Mesh(object):
+    """ nodes on shared interface segments, every transmitted message
+        is delivered to all link neighbors immediately """
+
+    def __init__(self, n, links, conf=None):
+        self.links = links
+        self.outbox = list()
+        self.nodes = list()
+        for i in range(n):
+            node = Node(node_conf(i, links, conf))
+            node.core.register_msg_tx_cb(self._msg_tx, priv_data=i)
+            self.nodes.append(node)
+
+    def _msg_tx(self, interface_name, proto, mcast_addr, msg, priv_data=None):
+        self.outbox.append((priv_data, interface_name, msg))
+
+    def round(self):
+        """ every node transmits once, return the transmitted messages """
+        sent = list()
+        for node in self.nodes:
+            node.core.tx_route_packet()
+            while self.outbox:
+                i, interface_name, msg = self.outbox.pop(0)
+                sent.append(msg)
+                for j, iface in neighbors(self.links, i).items():
+                    if iface == interface_name:
+                        self.nodes[j].core.msg_rx(interface_name, msg)
+        for node in self.nodes:
+            node.now += 1
+        return sent
+
+    def converge(self):
+        """ run enough rounds for every route to reach every node """
+        for _ in range(len(self.nodes) + 2):
+            self.round()
+        return self.round()
+
+
+def bench_codec(topology_name, n, interface_count, repeat, seed):
+    mesh = Mesh(n, topology(topology_name, n, interface_count, seed))
+    msgs = mesh.converge()
+    codec = dmpr.DMPRMsgCodec()
+    encoded = [codec.encode(msg) for msg in msgs]
+    for msg, data in zip(msgs, encoded):
+        assert codec.decode(data) == msg
+    json_size = sum(msg_size(msg) for msg in msgs)
+    binary_size = sum(len(data) for data in encoded)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for msg in msgs:
+            codec.encode(msg)
+    encode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for data in encoded:
+            codec.decode(data)
+    decode_time = time.perf_counter() - start
+    count = len(msgs) * repeat
+    return {
+        "topology" : topology_name,
+        "nodes" : n,
+        "messages" : len(msgs),
+        "json-bytes-per-msg" : json_size / len(msgs),
+        "binary-bytes-per-msg" : binary_size / len(msgs),
+        "ratio" : binary_size / json_size,
+        "encode-us-per-msg" : encode_time / count * 1e6,
+        "decode-us-per-msg" : decode_time / count * 1e6,
+    }
+
+
+def bench_delta(topology_name, n, interface_count, rounds, snapshot_interval, msg_format, seed):
+    result = {"topology" : topology_name, "nodes" : n, "rounds" : rounds,
+              "snapshot-interval" : snapshot_interval, "format" : msg_format}
+    links = topology(topology_name, n, interface_count, seed)
+    for mode, interval in (("full", "1"), ("delta", str(snapshot_interval))):
+        conf = {"rtn-msg-snapshot-interval" : interval, "rtn-msg-format" : msg_format}
+        mesh = Mesh(n, links, conf)
+        mesh.converge()
+        sent = list()
+        for _ in range(rounds):
+            sent.extend(mesh.round())
+        result[mode + "-bytes-per-round"] = sum(msg_size(msg) for msg in sent) / rounds
+    result["ratio"] = result["delta-bytes-per-round"] / result["full-bytes-per-round"]
+    return result
+
+
+def print_delta(results):
+    fmt = "{:<16} {:>6} {:>7} {:>9} {:>14} {:>14} {:>7}"
+    print(fmt.format("topology", "nodes", "format", "snapshot", "full B/round",
+                     "delta B/round", "ratio"))
+    for r in results:
+        print(fmt.format(r["topology"], r["nodes"], r["format"], r["snapshot-interval"],
+                         "{:.0f}".format(r["full-bytes-per-round"]),
+                         "{:.0f}".format(r["delta-bytes-per-round"]),
+                         "{:.3f}".format(r["ratio"])))
+
+
+def print_codec(results):
+    fmt = "{:<16} {:>6} {:>12} {:>12} {:>7} {:>11} {:>11}"
+    print(fmt.format("topology", "nodes", "json B/msg", "binary B/msg",
+                     "ratio", "encode us", "decode us"))
+    for r in results:
+        print(fmt.format(r["topology"], r["nodes"],
+                         "{:.0f}".format(r["json-bytes-per-msg"]),
+                         "{:.0f}".format(r["binary-bytes-per-msg"]),
+                         "{:.3f}".format(r["ratio"]),
+                         "{:.1f}".format(r["encode-us-per-msg"]),
+                         "{:.1f}".format(r["decode-us-per-msg"])))
+
+
+def revision():
+    """ git revision of the benchmarked core, if available """
+    try:
+        out = subprocess.check_output(["git", "describe", "--always", "--dirty"],
+                                      cwd=os.path.dirname(os.path.abspath(dmpr.__file__)),
+                                      stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.decode().strip()
+
+
+def result_key(benchmark, result):
+    return (benchmark, result["topology"], result["nodes"], result.get("interfaces"))
+
+
+def compare(old_path, new_path):
+    """ print the change of all timings and sizes of two result files """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    if old["benchmark"] != new["benchmark"]:
+        sys.exit("cannot compare {} with {} results".format(old["benchmark"], new["benchmark"]))
+    print("{} -> {}".format(old.get("revision"), new.get("revision")))
+    old_results = {result_key(old["benchmark"], r): r for r in old["results"]}
+    fmt = "{:<16} {:>5} {:>3} {:<48} {:>10} {:>10} {:>7}"
+    print(fmt.format("topology", "nodes", "if", "value", "old", "new", "new/old"))
+    for r in new["results"]:
+        o = old_results.get(result_key(new["benchmark"], r))
+        if o is None:
+            continue
+        for name, old_value, new_value in compare_values(o, r):
+            ratio = new_value / old_value if old_value else float("nan")
+            print(fmt.format(r["topology"], r["nodes"], r.get("interfaces") or "-", name,
+                             "{:.4g}".format(old_value), "{:.4g}".format(new_value),
+                             "{:.3f}".format(ratio)))
+
+
+def compare_values(old, new, prefix=""):
+    """ numeric values found in both results, nested keys joined by / """
+    for key, value in new.items():
+        if key not in old or key in ("nodes", "interfaces", "calls"):
+            continue
+        if isinstance(value, dict):
+            yield from compare_values(old[key], value, prefix + key + "/")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield prefix + key, old[key], value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DMPR core benchmarks")
+    parser.add_argument("benchmark", nargs="?", default="pipeline",
+                        choices=["pipeline", "codec", "delta", "compare"])
+    parser.add_argument("files", nargs="*", help="compare: old and new result file")
+    parser.add_argument("--topology", nargs="+", default=sorted(TOPOLOGIES),
+                        choices=sorted(TOPOLOGIES))
+    parser.add_argument("--nodes", nargs="+", type=int, default=[16, 64])
+    parser.add_argument("--interfaces", nargs="+", type=int, default=[2],
+                        help="interface classes assigned round robin to the links")
+    parser.add_argument("--seed", type=int, default=1, help="random-geometric placement")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=20,
+                        help="delta: measured rounds after convergence")
+    parser.add_argument("--snapshot-interval", type=int, default=10)
+    parser.add_argument("--format", default="dict", choices=["dict", "binary"])
+    parser.add_argument("--json", action="store_true", help="machine readable output")
+    parser.add_argument("--output", help="write machine readable results to file")
+    args = parser.parse_args()
+    if args.benchmark == "compare":
+        if len(args.files) != 2:
+            parser.error("compare needs the old and the new result file")
+        compare(*args.files)
+        return
+    results = list()
+    for topology_name in args.topology:
+        for n in args.nodes:
+            for interface_count in args.interfaces:
+                if args.benchmark == "pipeline":
+                    result = bench_pipeline(topology_name, n, interface_count, args.repeat, args.seed)
+                elif args.benchmark == "codec":
+                    result = bench_codec(topology_name, n, interface_count, args.repeat, args.seed)
+                else:
+                    result = bench_delta(topology_name, n, interface_count, args.rounds,
+                                         args.snapshot_interval, args.format, args.seed)
+                result["interfaces"] = interface_count
+                results.append(result)
+    output = {
+        "benchmark" : args.benchmark,
+        "revision" : revision(),
+        "python" : platform.python_version(),
+        "results" : results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+    if args.json:
+        print(json.dumps(output, indent=2))
+    elif args.benchmark == "pipeline":
+        print_pipeline(results)
+    elif args.benchmark == "codec":
+        print_codec(results)
+    else:
+        print_delta(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+""" discrete-event mesh simulator for DMPR cores. Each node is a DMPR
+    object driven through its register_*_cb hooks: ticks and packet
+    deliveries are events of a priority queue, the get time callback
+    returns the virtual clock. Packets are delivered to all neighbors on
+    the sending interface after the link delay, or lost with the link
+    loss probability. Nodes can be sharded across worker processes.
+
+    Reported are convergence time, control bytes per node and CPU time
+    of the route recalculation per node.
+
+    usage: dmpr_sim.py [--topology T] [--nodes N] [--duration S] [--workers W] """
+
+import argparse
+import heapq
+import json
+import math
+import multiprocessing
+import pickle
+import random
+import time
+import uuid
+
+import dmpr
+
+
+class NoLog(object):
+
+    def debug(self, *args, **kwargs): pass
+    def info(self, *args, **kwargs): pass
+    def warning(self, *args, **kwargs): pass
+    def error(self, *args, **kwargs): pass
+
+
+# interface classes, the first two as in dmpr.exa_conf
+INTERFACE_CLASSES = [
+    ("wlan0", { "bandwidth" : "100000", "loss" : "0" , "cost" : "1" }),
+    ("tetra0", { "bandwidth" : "10000",  "loss" : "0" , "cost" : "0" }),
+    ("lte0", { "bandwidth" : "50000",  "loss" : "5" , "cost" : "10" }),
+    ("sat0", { "bandwidth" : "1000",  "loss" : "2" , "cost" : "1000" }),
+]
+
+
+def interfaces(count):
+    """ list of (name, link characteristics), more interfaces than
+        classes repeat the characteristics under a new name """
+    result = list()
+    for i in range(count):
+        name, link_chars = INTERFACE_CLASSES[i % len(INTERFACE_CLASSES)]
+        if i >= len(INTERFACE_CLASSES):
+            name = "{}.{}".format(name, i // len(INTERFACE_CLASSES))
+        result.append((name, link_chars))
+    return result
+
+
+def topology_chain(n, rnd):
+    """ list of edges (node a, node b) """
+    return [(i, i + 1) for i in range(n - 1)]
+
+
+def topology_grid(n, rnd):
+    width = max(1, int(math.ceil(n ** 0.5)))
+    edges = list()
+    for i in range(n):
+        if (i + 1) % width != 0 and i + 1 < n:
+            edges.append((i, i + 1))
+        if i + width < n:
+            edges.append((i, i + width))
+    return edges
+
+
+def topology_star(n, rnd):
+    return [(0, i) for i in range(1, n)]
+
+
+def topology_random_geometric(n, rnd, degree=8):
+    """ nodes placed at random in the unit square, connected if closer
+        than a radius which gives the mean degree """
+    radius = math.sqrt(degree / (math.pi * n))
+    pos = [(rnd.random(), rnd.random()) for _ in range(n)]
+    edges = list()
+    for a in range(n):
+        for b in range(a + 1, n):
+            if math.hypot(pos[a][0] - pos[b][0], pos[a][1] - pos[b][1]) < radius:
+                edges.append((a, b))
+    return edges
+
+
+TOPOLOGIES = {
+    "chain" : topology_chain,
+    "grid" : topology_grid,
+    "star" : topology_star,
+    "random-geometric" : topology_random_geometric,
+}
+
+
+def topology(name, n, interface_count, seed=1):
+    """ list of links (node a, node b, interface name), interfaces are
+        assigned round robin """
+    names = [name for name, link_chars in interfaces(interface_count)]
+    edges = TOPOLOGIES[name](n, random.Random(seed))
+    return [(a, b, names[i % len(names)]) for i, (a, b) in enumerate(edges)]
+
+
+def node_id(i):
+    return str(uuid.UUID(int=i + 1))
+
+
+def node_conf(i, links, extra_conf=None):
+    """ configuration of node i with all interfaces it has links on """
+    link_chars = dict(interfaces(len(INTERFACE_CLASSES) * 4))
+    names = sorted({iface for a, b, iface in links if i in (a, b)}) or ["wlan0"]
+    conf = {
+        "id" : node_id(i),
+        "mcast-v4-tx-addr" : "224.0.1.1",
+        "mcast-v6-tx-addr" : "ff05:0:0:0:0:0:0:2",
+        "interfaces" : [{ "name" : name,
+                          "addr-v4" : node_addr(i, k),
+                          "link-characteristics" : link_chars[name] }
+                        for k, name in enumerate(names)],
+        "networks" : [{ "proto" : "v4", "prefix" : "172.{}.{}.0".format(16 + (i >> 8), i & 0xff),
+                        "prefix-len" : "24" }]
+    }
+    conf.update(extra_conf or dict())
+    return conf
+
+
+def node_addr(i, k):
+    return "10.{}.{}.{}".format(k, i >> 8, i & 0xff)
+
+
+def neighbors(links, i):
+    """ {neighbor: interface} """
+    result = dict()
+    for a, b, iface in links:
+        if i in (a, b):
+            result[b if a == i else a] = iface
+    return result
+
+
+
+def msg_size(msg):
+    if isinstance(msg, bytes):
+        return len(msg)
+    return len(json.dumps(msg, separators=(',', ':')).encode('utf-8'))
+
+
+class Link(object):
+    """ one direction of a link as seen by the sender """
+    __slots__ = ('dst', 'delay', 'loss', 'rnd')
+
+    def __init__(self, dst, delay, loss, rnd):
+        self.dst = dst
+        self.delay = delay
+        self.loss = loss
+        self.rnd = rnd
+
+
+class SimNode(object):
+    """ a DMPR core and its statistics """
+
+    def __init__(self, shard, i, conf, log_level):
+        self.shard = shard
+        self.i = i
+        self.tx_bytes = 0
+        self.tx_packets = 0
+        self.recomputes = 0
+        self.recompute_cpu = 0.0
+        self.core_cpu = 0.0
+        self.routing_table = None
+        self.last_change = None
+        self.core = dmpr.DMPR(log=NoLog(), log_level=log_level)
+        self.core.register_configuration(conf)
+        self.core.register_get_time_cb(self._get_time)
+        self.core.register_routing_table_update_cb(self._routing_table_update)
+        self.core.register_msg_tx_cb(self._msg_tx)
+        update_routing_table = self.core._update_routing_table
+        def timed_update_routing_table(neigh_ids):
+            start = time.process_time()
+            update_routing_table(neigh_ids)
+            self.recompute_cpu += time.process_time() - start
+            self.recomputes += 1
+        self.core._update_routing_table = timed_update_routing_table
+
+    def _get_time(self, priv_data=None):
+        return self.shard.now
+
+    def _routing_table_update(self, routing_table, priv_data=None):
+        if routing_table != self.routing_table:
+            self.routing_table = routing_table
+            self.last_change = self.shard.now
+
+    def _msg_tx(self, interface_name, proto, mcast_addr, msg, priv_data=None):
+        self.tx_bytes += msg_size(msg)
+        self.tx_packets += 1
+        self.shard.transmit(self.i, interface_name, msg)
+
+    def call(self, func, *args):
+        start = time.process_time()
+        func(*args)
+        self.core_cpu += time.process_time() - start
+
+    def stats(self):
+        destinations = set()
+        for policy, entries in self.core.fib.items():
+            if policy != 'path_characteristics':
+                destinations.update(entries)
+        return {
+            "node" : self.i,
+            "tx-bytes" : self.tx_bytes,
+            "tx-packets" : self.tx_packets,
+            "recomputes" : self.recomputes,
+            "recompute-cpu" : self.recompute_cpu,
+            "core-cpu" : self.core_cpu,
+            "last-change" : self.last_change,
+            "destinations" : len(destinations),
+            "hold-time" : self.hold_time(),
+        }
+
+    def hold_time(self):
+        """ seconds the neighbors keep the routes of this node, as
+            configured or as advertised in the adaptive mode """
+        if self.core._conf["rtn-msg-interval-mode"] == "adaptive":
+            return self.core._tx_hold_time()
+        return int(self.core._conf["rtn-msg-hold-time"])
+
+
+class Shard(object):
+    """ event loop over a partition of the nodes. Packets to nodes of
+        other shards are collected in the outbox and handed over by the
+        Simulation """
+
+    def __init__(self, links, n, nodes, conf=None, seed=1, delay=0.01, loss=0.0,
+                 tick_interval=1.0, log_level="error"):
+        self.now = 0.0
+        self.events = list()
+        self.seq = 0
+        self.outbox = list()
+        self.processed = 0
+        self.tick_interval = tick_interval
+        random.seed("{}:{}".format(seed, min(nodes) if nodes else 0))
+        self.nodes = dict()
+        for i in nodes:
+            self.nodes[i] = SimNode(self, i, node_conf(i, links, conf), log_level)
+        # sender -> interface -> receivers
+        self.links = dict()
+        for link in links:
+            a, b, iface = link[:3]
+            link_delay = link[3] if len(link) > 3 else delay
+            link_loss = link[4] if len(link) > 4 else loss
+            for src, dst in ((a, b), (b, a)):
+                if src in self.nodes:
+                    rnd = random.Random("{}:{}:{}:{}".format(seed, src, dst, iface))
+                    self.links.setdefault(src, dict()).setdefault(iface, list()).append(
+                        Link(dst, link_delay, link_loss, rnd))
+        for i, node in self.nodes.items():
+            node.core.start()
+            # spread the ticks of the nodes over the tick interval
+            self.schedule(tick_interval * ((i * 0.618034) % 1.0), self._tick, i)
+
+    def schedule(self, at, func, *args):
+        heapq.heappush(self.events, (at, self.seq, func, args))
+        self.seq += 1
+
+    def run(self, until):
+        """ process all events before until """
+        events = self.events
+        while len(events) > 0 and events[0][0] < until:
+            self.now, seq, func, args = heapq.heappop(events)
+            func(*args)
+            self.processed += 1
+        self.now = until
+
+    def receive(self, packets):
+        for at, dst, interface_name, msg in packets:
+            self.schedule(at, self._rx, dst, interface_name, msg)
+
+    def transmit(self, src, interface_name, msg):
+        for link in self.links.get(src, dict()).get(interface_name, ()):
+            if link.loss > 0 and link.rnd.random() < link.loss:
+                continue
+            at = self.now + link.delay
+            if link.dst in self.nodes:
+                self.schedule(at, self._rx, link.dst, interface_name, msg)
+            else:
+                self.outbox.append((at, link.dst, interface_name, msg))
+
+    def next_event_time(self):
+        if len(self.events) == 0:
+            return None
+        return self.events[0][0]
+
+    def take_outbox(self):
+        outbox = self.outbox
+        self.outbox = list()
+        return outbox
+
+    def _tick(self, i):
+        node = self.nodes[i]
+        node.call(node.core.tick)
+        self.schedule(self.now + self.tick_interval, self._tick, i)
+
+    def _rx(self, i, interface_name, msg):
+        node = self.nodes[i]
+        node.call(node.core.msg_rx, interface_name, msg)
+
+    def stats(self):
+        return {"events" : self.processed,
+                "nodes" : [node.stats() for node in self.nodes.values()]}
+
+
+def _shard_worker(conn, partition, args, kwargs):
+    """ worker process: a shard driven by commands of the Simulation.
+        Packets are exchanged pickled per destination shard, the
+        Simulation forwards them without unpickling """
+    shard = Shard(*args, **kwargs)
+    while True:
+        cmd, data = conn.recv()
+        if cmd == "run":
+            until, inbox = data
+            for packets in inbox:
+                shard.receive(pickle.loads(packets))
+            shard.run(until)
+            outbox = dict()
+            next_time = shard.next_event_time()
+            for packet in shard.take_outbox():
+                outbox.setdefault(partition[packet[1]], list()).append(packet)
+                if next_time is None or packet[0] < next_time:
+                    next_time = packet[0]
+            outbox = {worker: pickle.dumps(packets, pickle.HIGHEST_PROTOCOL)
+                      for worker, packets in outbox.items()}
+            conn.send((outbox, next_time))
+        elif cmd == "stats":
+            conn.send(shard.stats())
+        elif cmd == "exit":
+            conn.close()
+            return
+
+
+class Simulation(object):
+    """ simulate the nodes 0..n-1 on links (a, b, interface[, delay[,
+        loss]]), delay in seconds and loss probability default to the
+        arguments. conf is added to the configuration of all nodes.
+        With workers > 1 the nodes are partitioned into contiguous
+        ranges, one worker process each. The workers run in lockstep
+        windows of the smallest delay of the links between partitions,
+        a packet sent within a window arrives in a later one. A window
+        starts at the earliest pending event, idle time is skipped """
+
+    def __init__(self, links, n, conf=None, seed=1, delay=0.01, loss=0.0,
+                 tick_interval=1.0, workers=1, log_level="error"):
+        self.links = links
+        self.n = n
+        self.workers = max(1, min(workers, n))
+        kwargs = {"conf" : conf, "seed" : seed, "delay" : delay, "loss" : loss,
+                  "tick_interval" : tick_interval, "log_level" : log_level}
+        self.partition = [i * self.workers // n for i in range(n)]
+        if self.workers == 1:
+            self.shard = Shard(links, n, list(range(n)), **kwargs)
+            return
+        self.window = None
+        for link in links:
+            if self.partition[link[0]] != self.partition[link[1]]:
+                link_delay = link[3] if len(link) > 3 else delay
+                if self.window is None or link_delay < self.window:
+                    self.window = link_delay
+        if self.window is not None and self.window <= 0:
+            raise ValueError("links between worker partitions need a delay > 0")
+        self.window = self.window or tick_interval
+        self.conns = list()
+        self.procs = list()
+        for worker in range(self.workers):
+            nodes = [i for i in range(n) if self.partition[i] == worker]
+            parent_conn, child_conn = multiprocessing.Pipe()
+            proc = multiprocessing.Process(target=_shard_worker,
+                                           args=(child_conn, self.partition, (links, n, nodes), kwargs))
+            proc.start()
+            self.conns.append(parent_conn)
+            self.procs.append(proc)
+        self.now = 0.0
+
+    def run(self, duration):
+        """ run the simulation for duration seconds of virtual time
+            and return the report """
+        start = time.perf_counter()
+        if self.workers == 1:
+            self.shard.run(duration)
+            stats = [self.shard.stats()]
+        else:
+            stats = self._run_sharded(duration)
+        return self._report(duration, stats, time.perf_counter() - start)
+
+    def _run_sharded(self, duration):
+        inboxes = [list() for _ in range(self.workers)]
+        next_time = self.now
+        while next_time < duration:
+            until = min(next_time + self.window, duration)
+            for conn, inbox in zip(self.conns, inboxes):
+                conn.send(("run", (until, inbox)))
+            inboxes = [list() for _ in range(self.workers)]
+            next_time = duration
+            for conn in self.conns:
+                outbox, next_event_time = conn.recv()
+                for worker, packets in outbox.items():
+                    inboxes[worker].append(packets)
+                if next_event_time is not None:
+                    next_time = min(next_time, next_event_time)
+            next_time = max(next_time, until)
+            self.now = until
+        stats = list()
+        for conn in self.conns:
+            conn.send(("stats", None))
+            stats.append(conn.recv())
+        for conn, proc in zip(self.conns, self.procs):
+            conn.send(("exit", None))
+            proc.join()
+        return stats
+
+    def _report(self, duration, stats, wall_seconds):
+        nodes = sorted((node for shard in stats for node in shard["nodes"]),
+                       key=lambda node: node["node"])
+        changes = [node["last-change"] for node in nodes if node["last-change"] is not None]
+        reachable = self._reachable()
+        coverage = [node["destinations"] / reachable[node["node"]]
+                    for node in nodes if reachable[node["node"]] > 0]
+        hold_time = max((node["hold-time"] for node in nodes), default=0)
+        return {
+            "nodes" : self.n,
+            "links" : len(self.links),
+            "workers" : self.workers,
+            "duration" : duration,
+            "events" : sum(shard["events"] for shard in stats),
+            "wall-seconds" : wall_seconds,
+            "convergence-time" : max(changes) if changes else None,
+            "converged" : not changes or max(changes) < duration - hold_time,
+            "route-coverage" : sum(coverage) / len(coverage) if coverage else None,
+            "control-bytes-per-node" : summary([node["tx-bytes"] for node in nodes]),
+            "control-packets-per-node" : summary([node["tx-packets"] for node in nodes]),
+            "recomputes-per-node" : summary([node["recomputes"] for node in nodes]),
+            "recompute-cpu-per-node" : summary([node["recompute-cpu"] for node in nodes]),
+            "core-cpu-per-node" : summary([node["core-cpu"] for node in nodes]),
+        }
+
+    def _reachable(self):
+        """ number of nodes reachable from each node """
+        adj = [set() for _ in range(self.n)]
+        for link in self.links:
+            adj[link[0]].add(link[1])
+            adj[link[1]].add(link[0])
+        reachable = [0] * self.n
+        seen = set()
+        for i in range(self.n):
+            if i in seen:
+                continue
+            component = [i]
+            seen.add(i)
+            for node in component:
+                for neigh in adj[node] - seen:
+                    seen.add(neigh)
+                    component.append(neigh)
+            for node in component:
+                reachable[node] = len(component) - 1
+        return reachable
+
+
+def summary(values):
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+    return {"mean" : sum(values) / len(values), "max" : values[-1],
+            "median" : values[len(values) // 2]}
+
+
+def print_report(report):
+    for key, value in report.items():
+        if isinstance(value, dict):
+            value = ", ".join("{}: {:.4g}".format(k, v) for k, v in value.items())
+        elif isinstance(value, float):
+            value = "{:.4g}".format(value)
+        print("{:<26} {}".format(key, value))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DMPR mesh simulator")
+    parser.add_argument("--topology", default="random-geometric", choices=sorted(TOPOLOGIES))
+    parser.add_argument("--nodes", type=int, default=100)
+    parser.add_argument("--interfaces", type=int, default=2,
+                        help="interface classes assigned round robin to the links")
+    parser.add_argument("--duration", type=float, default=300.0, help="virtual seconds")
+    parser.add_argument("--delay", type=float, default=0.01, help="link delay in seconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="link loss probability")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--format", default="dict", choices=["dict", "binary"])
+    parser.add_argument("--snapshot-interval", type=int, default=1)
+    parser.add_argument("--route-engine", default="path-vector", choices=["path-vector", "graph"])
+    parser.add_argument("--recompute-hold-down", type=float, default=0.0,
+                        help="seconds without routing changes before routes are recalculated")
+    parser.add_argument("--triggered-updates", action="store_true",
+                        help="send routing messages early after route changes")
+    parser.add_argument("--interval-mode", default="static", choices=["static", "adaptive"])
+    parser.add_argument("--json", action="store_true", help="machine readable output")
+    args = parser.parse_args()
+    links = topology(args.topology, args.nodes, args.interfaces, args.seed)
+    conf = {"rtn-msg-format" : args.format,
+            "rtn-msg-snapshot-interval" : str(args.snapshot_interval),
+            "route-engine" : args.route_engine,
+            "route-recompute-hold-down" : str(args.recompute_hold_down),
+            "rtn-msg-triggered-updates" : "on" if args.triggered_updates else "off",
+            "rtn-msg-interval-mode" : args.interval_mode}
+    sim = Simulation(links, args.nodes, conf, seed=args.seed, delay=args.delay,
+                     loss=args.loss, workers=args.workers)
+    report = sim.run(args.duration)
+    report["topology"] = args.topology
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
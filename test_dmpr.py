@@ -0,0 +1,531 @@
+""" tests of the DMPR core, run with pytest. Nodes are driven through
+    the simulator and the synthetic routing messages of the benchmarks """
+
+import ipaddress
+import random
+
+import pytest
+
+import dmpr
+import dmpr_sim
+from dmpr_bench import Node, SyntheticRxMsgs
+
+
+def route_state(core):
+    """ FIB and routing tables in a comparable form: path numbers are
+        replaced by their characteristics and rows are sorted, both
+        depend on the order the routes were calculated in """
+    path_chars = core.fib['path_characteristics']
+    fib = dict()
+    for policy, entries in core.fib.items():
+        if policy == 'path_characteristics':
+            continue
+        fib[policy] = dict()
+        for dest_key, dest_data in entries.items():
+            paths = {path: None if path_num is None else path_chars[path_num].key()
+                     for path, path_num in dest_data.paths.items()}
+            fib[policy][dest_key] = dict(dest_data.as_dict(), paths=paths)
+    routing_table = dict()
+    for table, rows in (core._routing_table or dict()).items():
+        routing_table[table] = sorted((row.as_dict() for row in rows),
+                                      key=lambda row: (row['proto'], row['prefix'],
+                                                       row['prefix-len'], row['next-hop']))
+    return {'fib': fib, 'routing-table': routing_table}
+
+
+def remove_link(sim, a, b):
+    """ drop the link between two nodes of a running simulation """
+    for src, dst in ((a, b), (b, a)):
+        for receivers in sim.shard.links.get(src, dict()).values():
+            receivers[:] = [link for link in receivers if link.dst != dst]
+
+
+def run_with_link_removal(conf, seed, check, n=14):
+    """ run a random mesh, remove some links after it converged and
+        call check(core) for all nodes along the way """
+    links = dmpr_sim.topology("random-geometric", n, 2, seed)
+    sim = dmpr_sim.Simulation(links, n, conf, seed=seed, tick_interval=2.0)
+    for step in range(8):
+        sim.shard.run(45.0 * (step + 1))
+        if step == 3:
+            for a, b, iface in random.Random(seed).sample(links, len(links) // 4):
+                remove_link(sim, a, b)
+        for node in sim.shard.nodes.values():
+            if node.core._routing_table is not None:
+                check(node.core)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_incremental_update_matches_full_rebuild(seed):
+    def check(core):
+        incremental = route_state(core)
+        core._recalculate_routing_table()
+        assert route_state(core) == incremental
+    run_with_link_removal({"route-engine" : "path-vector", "multipath" : "on"}, seed, check)
+
+
+def shortest_path_weights(metric, graph, source):
+    """ reference Dijkstra search without a heap """
+    weights = {source: None}
+    tentative = dict()
+    router_id = source
+    while router_id is not None:
+        for next_id, (link_weight, path_data, iface) in graph.get(router_id, dict()).items():
+            if next_id in weights:
+                continue
+            weight = link_weight
+            if weights[router_id] is not None:
+                weight = metric.combine(weights[router_id], link_weight)
+            if next_id not in tentative or metric.better(weight, tentative[next_id]):
+                tentative[next_id] = weight
+        router_id = None
+        for next_id, weight in tentative.items():
+            if router_id is None or metric.better(weight, tentative[router_id]):
+                router_id = next_id
+        if router_id is not None:
+            weights[router_id] = tentative.pop(router_id)
+    return weights
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_graph_engine_finds_shortest_paths(seed):
+    # equal weight paths may be chosen differently after a rebuild,
+    # the weights must not differ
+    def check(core):
+        weights = {policy: {dest_key: dest_data['weight'] for dest_key, dest_data in entries.items()}
+                   for policy, entries in route_state(core)['fib'].items()}
+        for policy, metric in core._metrics.items():
+            reference = shortest_path_weights(metric, core._build_graph(policy), core._router_num)
+            for dest_key, weight in weights[policy].items():
+                assert weight == pytest.approx(reference[core._router_ids.lookup(dest_key)])
+        core._recalculate_routing_table()
+        for policy, entries in route_state(core)['fib'].items():
+            assert {dest_key: dest_data['weight'] for dest_key, dest_data in entries.items()} \
+                == pytest.approx(weights[policy])
+    run_with_link_removal({"route-engine" : "graph"}, seed, check)
+
+
+def test_prefix_trie_lookup_matches_linear_search():
+    rnd = random.Random(1)
+    trie = dmpr.DMPRPrefixTrie(32)
+    prefixes = dict()
+    for _ in range(300):
+        network = ipaddress.ip_network((rnd.getrandbits(32) & 0x0a0fffff, rnd.randint(8, 32)),
+                                       strict=False)
+        prefixes[network] = str(network)
+        trie.insert(int(network.network_address), network.prefixlen, str(network))
+    for network in rnd.sample(sorted(prefixes), 100):
+        del prefixes[network]
+        trie.remove(int(network.network_address), network.prefixlen)
+    addresses = [ipaddress.ip_address(rnd.getrandbits(32) & 0x0a0fffff) for _ in range(2000)]
+    addresses.extend(network.network_address for network in prefixes)
+    addresses.extend(network.broadcast_address for network in prefixes)
+    for address in addresses:
+        matches = [network for network in prefixes if address in network]
+        expected = str(max(matches, key=lambda network: network.prefixlen)) if matches else None
+        assert trie.lookup(int(address)) == expected
+
+
+def lpm_forwarding(rows, address):
+    best = None
+    for row in rows:
+        network = ipaddress.ip_network("{}/{}".format(row.prefix, row.prefix_len))
+        if address in network and (best is None or network.prefixlen > best[0].prefixlen):
+            best = (network, row)
+    if best is None:
+        return None
+    return (best[1].interface, best[1].next_hop)
+
+
+@pytest.mark.parametrize("seed", [3])
+def test_lookup_matches_routing_table(seed):
+    def check(core):
+        for policy, metric in core._metrics.items():
+            rows = core._routing_table[metric.table]
+            for row in rows:
+                network = ipaddress.ip_network("{}/{}".format(row.prefix, row.prefix_len))
+                for address in (network.network_address, network.broadcast_address):
+                    route = core.lookup(policy, str(address))
+                    assert (route['interface'], route['next-hop']) == lpm_forwarding(rows, address)
+            assert core.lookup(policy, "192.0.2.1") is None
+        assert sum(len(rows) for rows in core._rtd["lookup-prefixes"].values()) == \
+            sum(len(routes) for routes in core._rtd["lookup-routes"].values())
+    run_with_link_removal(dict(), seed, check)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_aggregate_rows_keeps_longest_prefix_match(seed):
+    rnd = random.Random(seed)
+    core = dmpr.DMPR(log=dmpr_sim.NoLog())
+    hops = [("wlan0", "10.0.0.2"), ("wlan0", "10.0.0.3"), ("tetra0", "10.1.0.2")]
+    routes = dict()
+    for _ in range(60):
+        prefix_len = rnd.randint(16, 26)
+        network = ipaddress.ip_network(("192.168.{}.{}".format(rnd.randint(0, 3), rnd.randint(0, 255)),
+                                        prefix_len), strict=False)
+        interface, next_hop = rnd.choice(hops)
+        routes[network] = dmpr.DMPRRoute('ID-1', 'v4', str(network.network_address), str(prefix_len),
+                                         interface, next_hop)
+    rows = list(routes.values())
+    aggregated = core._aggregate_rows(rows)
+    assert len(aggregated) <= len(rows)
+    addresses = [network.network_address for network in routes]
+    addresses.extend(network.broadcast_address for network in routes)
+    addresses.extend(ipaddress.ip_address("192.168.0.0") + rnd.randint(0, 4 * 256 - 1) for _ in range(500))
+    for address in addresses:
+        assert lpm_forwarding(aggregated, address) == lpm_forwarding(rows, address)
+
+
+def test_aggregate_rows_keeps_prefixes_of_several_destinations():
+    core = dmpr.DMPR(log=dmpr_sim.NoLog())
+    def route(dest, prefix, interface, next_hop):
+        return dmpr.DMPRRoute(dest, 'v4', prefix, "24", interface, next_hop)
+    rows = [route('A', "10.0.0.0", "wlan0", "1.1.1.1"),
+            route('B', "10.0.0.0", "tetra0", "2.2.2.2"),
+            route('A', "10.0.1.0", "wlan0", "1.1.1.1"),
+            route('A', "10.0.2.0", "wlan0", "1.1.1.1"),
+            route('C', "10.0.3.0", "wlan0", "1.1.1.1"),
+            route('D', "10.0.3.0", "wlan0", "1.1.1.1")]
+    aggregated = core._aggregate_rows(rows)
+    assert rows[0] in aggregated and rows[1] in aggregated and rows[2] in aggregated
+    merged = [row for row in aggregated if row.prefix_len == "23"]
+    assert [(row.prefix, row.interface, row.next_hop) for row in merged] == [("10.0.2.0", "wlan0", "1.1.1.1")]
+    assert len(aggregated) == 4
+
+
+def rx_packets(seed):
+    """ routing messages of the neighbors of the busiest node before and
+        after some links failed, shuffled and with duplicates """
+    rnd = random.Random(seed)
+    links = dmpr_sim.topology("random-geometric", 30, 2, seed)
+    synthetic = SyntheticRxMsgs(links, 30)
+    i = synthetic.busiest_node()
+    packets = synthetic.msgs(i, sequence_no=1)
+    remaining = [link for link in links if i not in link[:2] and rnd.random() > 0.2]
+    remaining.extend(link for link in links if i in link[:2])
+    packets.extend(SyntheticRxMsgs(remaining, 30).msgs(i, sequence_no=2))
+    packets.extend(rnd.sample(packets, len(packets) // 2))
+    rnd.shuffle(packets)
+    return dmpr_sim.node_conf(i, links), packets
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_msg_rx_batch_matches_msg_rx(seed):
+    conf, packets = rx_packets(seed)
+    single = Node(conf)
+    for interface_name, msg in packets:
+        single.core.msg_rx(interface_name, msg)
+    batch = Node(conf)
+    batch.core.msg_rx_batch(packets)
+    assert route_state(batch.core) == route_state(single.core)
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_recompute_hold_down_matches_immediate_recalculation(seed):
+    conf, packets = rx_packets(seed)
+    immediate = Node(conf)
+    held = Node(dict(conf, **{"route-recompute-hold-down" : "1"}))
+    for interface_name, msg in packets:
+        immediate.core.msg_rx(interface_name, msg)
+        held.core.msg_rx(interface_name, msg)
+    assert held.routing_table is None
+    held.now += 1
+    held.core.tick()
+    assert route_state(held.core) == route_state(immediate.core)
+
+
+def test_metric_without_weight_cannot_be_created():
+    class NoWeight(dmpr.DMPRMetric):
+        name = 'no_weight'
+        table = 'no-weight'
+    with pytest.raises(TypeError):
+        NoWeight()
+
+
+def test_simulation_convergence_uses_configured_hold_time():
+    links = dmpr_sim.topology("chain", 4, 1)
+    report = dmpr_sim.Simulation(links, 4).run(200)
+    assert report["converged"]
+    report = dmpr_sim.Simulation(links, 4, {"rtn-msg-hold-time" : "300"}).run(200)
+    assert not report["converged"]
+
+
+@pytest.mark.parametrize("multipath", ["on", "off"])
+def test_next_hops_only_with_multipath(multipath):
+    conf, packets = rx_packets(1)
+    node = Node(dict(conf, multipath=multipath))
+    node.core.msg_rx_batch(packets)
+    rows = [row for rows in node.routing_table.values() for row in rows]
+    assert len(rows) > 0
+    if multipath == "on":
+        assert all(len(row['next-hops']) >= 1 for row in rows)
+        assert any(len(row['next-hops']) > 1 for row in rows)
+    else:
+        assert all('next-hops' not in row for row in rows)
+
+
+def test_interned_paths_released_with_neighbors():
+    conf, packets = rx_packets(1)
+    node = Node(conf)
+    node.core.msg_rx_batch(packets)
+    held = {path for neigh_data in node.core._rtd["neighs"].values()
+            for advertised in neigh_data.advertised.values()
+            for dest_data, path_routers in advertised.values() for path in dest_data['paths']}
+    assert set(node.core._router_ids._paths) == held
+    node.now += int(node.core._conf["rtn-msg-hold-time"]) + 1
+    node.core.tick()
+    assert len(node.core._rtd["neighs"]) == 0
+    assert len(node.core._router_ids._paths) == 0
+    assert len(node.core._router_ids._path_keys) == 0
+
+
+@pytest.mark.parametrize("aggregation", ["off", "on"])
+def test_routes_of_destinations_with_the_same_network(aggregation):
+    links = dmpr_sim.topology("chain", 3, 1)
+    sim = dmpr_sim.Simulation(links, 3, {"prefix-aggregation" : aggregation})
+    network = dmpr_sim.node_conf(0, links)["networks"]
+    sim.shard.nodes[2].core.register_configuration(dmpr_sim.node_conf(2, links, {"networks" : network}))
+    core = sim.shard.nodes[1].core
+    diffs = list()
+    core.register_routing_table_diff_cb(lambda diff, priv_data=None: diffs.append(diff))
+    sim.shard.run(60)
+    added = [(operation['destination'], operation['route']['next-hop'])
+             for diff in diffs for operation in diff['lowest-loss'] if operation['op'] == 'add']
+    assert sorted(added) == [(dmpr_sim.node_id(0), dmpr_sim.node_addr(0, 0)),
+                             (dmpr_sim.node_id(2), dmpr_sim.node_addr(2, 0))]
+    assert core.lookup('lowest-loss', "172.16.0.1") is not None
+    del diffs[:]
+    remove_link(sim, 1, 2)
+    sim.shard.run(60 + int(core._conf["rtn-msg-hold-time"]) + 30)
+    operations = [(operation['op'], operation['destination'])
+                  for diff in diffs for operation in diff['lowest-loss']]
+    assert operations == [('delete', dmpr_sim.node_id(2))]
+    assert core.lookup('lowest-loss', "172.16.0.1")['next-hop'] == dmpr_sim.node_addr(0, 0)
+
+
+def test_route_change_in_all_policies_is_one_flap():
+    links = dmpr_sim.topology("chain", 3, 1)
+    sim = dmpr_sim.Simulation(links, 3, {"rtn-msg-triggered-updates" : "on",
+                                         "route-flap-suppress" : "2"})
+    sim.shard.run(60)
+    core = sim.shard.nodes[1].core
+    dest_id = core._router_ids.lookup(dmpr_sim.node_id(2))
+    policies = [policy for policy in core._metrics if dmpr_sim.node_id(2) in core.fib[policy]]
+    assert len(policies) > 2
+    remove_link(sim, 1, 2)
+    sim.shard.run(60 + int(core._conf["rtn-msg-hold-time"]) + 1)
+    assert all(dmpr_sim.node_id(2) not in core.fib[policy] for policy in policies)
+    penalty, changed = core._rtd["flap-penalties"][dest_id]
+    assert penalty == pytest.approx(1.0)
+    assert dest_id not in core._rtd["flap-suppressed"]
+
+
+def test_shrinking_hold_time_expires_early():
+    links = dmpr_sim.topology("chain", 2, 1)
+    node = Node(dmpr_sim.node_conf(0, links))
+    interface_name, msg = SyntheticRxMsgs(links, 2).msgs(0, sequence_no=1)[0]
+    node.core.msg_rx(interface_name, dict(msg, **{'hold-time' : "500"}))
+    node.now = 10
+    msg = SyntheticRxMsgs(links, 2).msg(1, interface_name, 2)
+    node.core.msg_rx(interface_name, dict(msg, **{'hold-time' : "60"}))
+    node.now = 69
+    node.core.tick()
+    assert len(node.core._rtd["neighs"]) == 1
+    node.now = 71
+    node.core.tick()
+    assert len(node.core._rtd["neighs"]) == 0
+
+
+def test_invalid_hold_time_is_logged():
+    class Log(dmpr_sim.NoLog):
+        def __init__(self):
+            self.errors = list()
+        def error(self, msg, **kwargs):
+            self.errors.append(msg)
+    links = dmpr_sim.topology("chain", 2, 1)
+    node = Node(dmpr_sim.node_conf(0, links))
+    node.core.log = Log()
+    interface_name, msg = SyntheticRxMsgs(links, 2).msgs(0)[0]
+    node.core.msg_rx(interface_name, dict(msg, **{'hold-time' : "soon"}))
+    assert len(node.core._rtd["neighs"]) == 0
+    assert any("hold-time soon" in msg for msg in node.core.log.errors)
+
+
+def test_process_conf_rebuilds_tx_payload():
+    links = dmpr_sim.topology("chain", 2, 1)
+    node = Node(dmpr_sim.node_conf(0, links))
+    assert node.core.create_routing_msg("wlan0")['networks'] == [{"v4-prefix" : "172.16.0.0/24"}]
+    networks = [{"proto" : "v4", "prefix" : "172.17.0.0", "prefix-len" : "24"}]
+    node.core.process_conf(dmpr_sim.node_conf(0, links, {"networks" : networks}))
+    assert node.core.create_routing_msg("wlan0")['networks'] == [{"v4-prefix" : "172.17.0.0/24"}]
+
+
+def test_codec_round_trip():
+    codec = dmpr.DMPRMsgCodec()
+    conf, packets = rx_packets(1)
+    interface_name, msg = packets[0]
+    delta = dict(msg, **{'snapshot-sequence-no' : 1, 'sequence-no' : 2,
+                         'routingpaths-delta' : {'low_loss' : msg['routingpaths']['low_loss']},
+                         'routingpaths-removed' : {'high_bandwidth' : sorted(msg['routingpaths']['high_bandwidth'])}})
+    del delta['routingpaths']
+    odd = dict(msg, **{'hold-time' : "42", 'unknown' : [1, "two", None],
+                       'networks' : [{"v6-prefix" : "fd00::/64"}, {"v4-prefix" : "10.0.0.1/24"}],
+                       'originator-addr-v6' : "fd00::1"})
+    for msg in (msg, delta, odd):
+        data = codec.encode(msg)
+        assert codec.is_encoded(data)
+        assert codec.decode(data) == msg
+
+
+def test_malformed_packets_are_dropped():
+    links = dmpr_sim.topology("chain", 2, 1)
+    node = Node(dmpr_sim.node_conf(0, links))
+    interface_name, msg = SyntheticRxMsgs(links, 2).msgs(0)[0]
+    data = dmpr.DMPRMsgCodec().encode(msg)
+    packets = [b'\xd3\x01\x00\x00', b'\xd3\x01', b'{}', data[:len(data) // 2], data + b'\x00']
+    for key in ('id', 'sequence-no', 'networks', 'routingpaths', 'originator-addr-v4'):
+        packets.append({k: v for k, v in msg.items() if k != key})
+        packets.append(dict(msg, **{key : 1 if key == 'originator-addr-v4' else None}))
+    packets.append(dict(msg, networks=[{"v4-prefix" : "10.0.0.0/33"}]))
+    dest_key, dest_data = next(iter(msg['routingpaths']['low_loss'].items()))
+    for broken in ({'weight' : None}, {'paths' : [1]}, {'next-hop' : 1}, {'networks' : ["10.0.0.0/8"]}):
+        routingpaths = dict(msg['routingpaths'], low_loss={dest_key : dict(dest_data, **broken)})
+        packets.append(dict(msg, routingpaths=routingpaths))
+    for packet in packets:
+        node.core.msg_rx(interface_name, packet)
+    node.core.msg_rx_batch([(interface_name, packet) for packet in packets])
+    assert len(node.core._rtd["neighs"]) == 0
+    node.core.msg_rx(interface_name, msg)
+    assert len(node.core._rtd["neighs"]) == 1
+
+
+def delta_sender(snapshot_interval):
+    """ the busiest node of a random mesh sending delta messages to one
+        of its neighbors, and the messages it receives before and after
+        a node far from it lost its links """
+    links = dmpr_sim.topology("random-geometric", 30, 2, 1)
+    synthetic = SyntheticRxMsgs(links, 30)
+    i = synthetic.busiest_node()
+    j, interface_name = sorted(synthetic.adj[i].items())[0]
+    gone = next(k for k in sorted(synthetic._shortest_paths(i))
+                if k not in (i, j) and not {i, j} & synthetic.adj[k].keys())
+    remaining = [link for link in links if gone not in link[:2]]
+    changed = SyntheticRxMsgs(remaining, 30).msgs(i, sequence_no=2)
+    sender = Node(dmpr_sim.node_conf(i, links, {"rtn-msg-snapshot-interval" : str(snapshot_interval)}))
+    sender.core.msg_rx_batch(synthetic.msgs(i))
+    return sender, interface_name, Node(dmpr_sim.node_conf(j, links)), changed
+
+
+def test_delta_msg_applied_to_snapshot():
+    sender, interface_name, receiver, changed = delta_sender(10)
+    snapshot = sender.core.create_routing_msg(interface_name)
+    sender.core.msg_rx_batch(changed)
+    delta = sender.core.create_routing_msg(interface_name)
+    assert 'routingpaths' in snapshot and 'routingpaths' not in delta
+    assert delta['snapshot-sequence-no'] == snapshot['sequence-no']
+    assert len(delta['routingpaths-removed']) > 0
+    receiver.core.msg_rx(interface_name, snapshot)
+    receiver.core.msg_rx(interface_name, delta)
+    rx_data = receiver.core._rtd["interfaces"][interface_name]["rx-msg-db"][receiver.core._router_ids.lookup(delta['id'])]
+    assert rx_data.msg['routingpaths'] == sender.core._create_tx_payload()['routingpaths']
+    assert rx_data.snapshot is snapshot
+    full = Node(receiver.core._conf)
+    full.core.msg_rx(interface_name, dict(rx_data.msg))
+    assert route_state(receiver.core) == route_state(full.core)
+
+
+def test_delta_msg_without_snapshot_keeps_last_paths():
+    sender, interface_name, receiver, changed = delta_sender(2)
+    first = sender.core.create_routing_msg(interface_name)
+    sender.core.create_routing_msg(interface_name)
+    sender.core.msg_rx_batch(changed)
+    lost = sender.core.create_routing_msg(interface_name)
+    delta = sender.core.create_routing_msg(interface_name)
+    assert 'routingpaths' in lost and delta['snapshot-sequence-no'] == lost['sequence-no']
+    assert lost['routingpaths'] != first['routingpaths']
+    # a new neighbor only learns the networks from a delta message
+    receiver.core.msg_rx(interface_name, delta)
+    neigh_data = receiver.core._rtd["neighs"][receiver.core._router_ids.lookup(delta['id'])]
+    assert neigh_data.networks == delta['networks'] and len(neigh_data.dests) == 0
+    receiver = Node(receiver.core._conf)
+    receiver.core.msg_rx(interface_name, first)
+    fib = route_state(receiver.core)['fib']
+    receiver.now += 60
+    receiver.core.msg_rx(interface_name, delta)
+    sender_id = receiver.core._router_ids.lookup(delta['id'])
+    rx_data = receiver.core._rtd["interfaces"][interface_name]["rx-msg-db"][sender_id]
+    assert rx_data.rx_time == 60 and rx_data.msg['routingpaths'] == first['routingpaths']
+    assert route_state(receiver.core)['fib'] == fib
+    receiver.core.msg_rx(interface_name, sender.core.create_routing_msg(interface_name))
+    assert rx_data.msg['routingpaths'] == sender.core._create_tx_payload()['routingpaths']
+
+
+def test_default_log_level_skips_debug_dumps():
+    class Log(dmpr_sim.NoLog):
+        def __init__(self):
+            self.debugs = list()
+        def debug(self, msg, **kwargs):
+            self.debugs.append(msg)
+    log = Log()
+    links = dmpr_sim.topology("chain", 2, 1)
+    core = dmpr.DMPR(log=log)
+    core.register_configuration(dmpr_sim.node_conf(0, links))
+    core.register_get_time_cb(lambda priv_data=None: 0)
+    core.register_routing_table_update_cb(lambda routing_table, priv_data=None: None)
+    core.register_msg_tx_cb(lambda *args, **kwargs: None)
+    core.start()
+    core.msg_rx(*SyntheticRxMsgs(links, 2).msgs(0)[0])
+    core.tx_route_packet()
+    assert log.debugs == []
+
+
+def test_k_shortest_paths_over_advertised_links():
+    links = dmpr_sim.topology("grid", 9, 1)
+    sim = dmpr_sim.Simulation(links, 9)
+    sim.shard.run(120)
+    core = sim.shard.nodes[0].core
+    nodes = {dmpr_sim.node_id(i): i for i in range(9)}
+    def routers(entry):
+        path = [0]
+        for key in entry['paths']:
+            router_id, next_id = key.split('>')
+            assert nodes[router_id] == path[-1]
+            path.append(nodes[next_id])
+        return path
+    entries = core.k_shortest_paths('low_loss', dmpr_sim.node_id(8), 10)
+    # the links 2>5, 5>8 and 6>7 of the other shortest paths are in
+    # no best path the neighbors advertise
+    assert [routers(entry) for entry in entries] == [[0, 1, 4, 7, 8], [0, 3, 4, 7, 8]]
+    assert entries[0]['next-hop'] == core.fib['low_loss'][dmpr_sim.node_id(8)].next_hop
+    assert all(entry['networks'] == [{"v4-prefix" : "172.16.8.0/24"}] for entry in entries)
+    assert core.k_shortest_paths('low_loss', dmpr_sim.node_id(8), 1) == entries[:1]
+    assert core.k_shortest_paths('low_loss', "unknown", 3) == []
+
+
+@pytest.mark.parametrize("relay_v6", [True, False])
+def test_dual_stack_routes(relay_v6):
+    links = dmpr_sim.topology("chain", 3, 1)
+    sim = dmpr_sim.Simulation(links, 3)
+    for i in range(3):
+        conf = dmpr_sim.node_conf(i, links)
+        if relay_v6 or i != 1:
+            conf["interfaces"][0]["addr-v6"] = "fd00::{}".format(i + 1)
+        if i == 2:
+            conf["networks"].append({"proto" : "v6", "prefix" : "fd00:2::", "prefix-len" : "64"})
+        sim.shard.nodes[i].core.register_configuration(conf)
+    sim.shard.run(60)
+    core = sim.shard.nodes[0].core
+    rows = {(row.proto, row.prefix): row for row in core._routing_table['lowest-loss']}
+    assert rows[('v4', "172.16.2.0")].next_hop == dmpr_sim.node_addr(1, 0)
+    route = core.lookup('low_loss', "172.16.2.9")
+    assert (route['proto'], route['prefix'], route['next-hop']) == ('v4', "172.16.2.0", dmpr_sim.node_addr(1, 0))
+    if relay_v6:
+        assert rows[('v6', "fd00:2::")].next_hop == "fd00::2"
+        route = core.lookup('low_loss', "fd00:2::9")
+        assert (route['proto'], route['prefix'], route['next-hop']) == ('v6', "fd00:2::", "fd00::2")
+        assert {('lowest-loss', 'v4'), ('lowest-loss', 'v6')} <= set(core._rtd["lookup-tries"])
+    else:
+        # no v6 next hop on the path
+        assert ('v6', "fd00:2::") not in rows
+        assert core.lookup('low_loss', "fd00:2::9") is None
+    assert core.lookup('low_loss', "fd00:3::9") is None